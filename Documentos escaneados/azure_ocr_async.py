@@ -0,0 +1,252 @@
+"""
+Cliente asíncrono de la Read API de Azure Computer Vision (REST v3.2).
+
+A diferencia del cliente síncrono del SDK (ver ejemplo_azure_ocr.py: una imagen a la vez y
+time.sleep(1) entre consultas):
+- Envía muchas páginas a la vez, con un límite configurable de operaciones en vuelo
+- Consulta el resultado con espera adaptativa: empieza en decenas de milisegundos
+  y crece hasta un máximo
+- Respeta el throttling de Azure (HTTP 429 + cabecera Retry-After)
+- Habla directamente el contrato REST (POST /read/analyze -> Operation-Location -> GET),
+  así que puede probarse contra el servidor local de azure_read_stub.py
+"""
+import asyncio
+import os
+import queue
+import sys
+import threading
+
+import httpx
+
+# Métricas compartidas (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.metricas import medir, evento, BYTES, REINTENTOS
+
+# Ruta de la Read API dentro del endpoint de Cognitive Services
+READ_ANALYZE_PATH = "/vision/v3.2/read/analyze"
+
+# Estados de una operación de lectura que todavía no ha terminado
+ESTADOS_EN_CURSO = ("notStarted", "running")
+
+# Códigos HTTP que se reintentan: throttling y errores transitorios del servidor
+CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class ErrorOCRAzure(Exception):
+    """Error al procesar una imagen con la Read API de Azure."""
+
+
+def _segundos_retry_after(respuesta, por_defecto):
+    """
+    Lee la cabecera Retry-After (en segundos). Si no existe o no es numérica,
+    retorna la espera por defecto.
+    """
+    valor = respuesta.headers.get("Retry-After")
+    try:
+        return max(float(valor), 0.0)
+    except (TypeError, ValueError):
+        return por_defecto
+
+
+class ClienteAzureReadAsync:
+    """
+    Cliente asyncio para OCR concurrente con la Read API.
+
+    Uso:
+        async with ClienteAzureReadAsync(endpoint, key, max_en_vuelo=32) as cliente:
+            textos = await cliente.ocr_lote([bytes_pagina_1, bytes_pagina_2, ...])
+    """
+
+    def __init__(self, endpoint, key, max_en_vuelo=16, espera_inicial=0.02,
+                 espera_maxima=1.0, factor_espera=1.5, max_reintentos=8,
+                 timeout=60.0, idioma=None):
+        """
+        Parámetros:
+        - endpoint: URL del recurso de Azure (o del servidor local de pruebas)
+        - key: clave de la API (cabecera Ocp-Apim-Subscription-Key)
+        - max_en_vuelo: máximo de operaciones de OCR simultáneas
+        - espera_inicial: primera espera antes de consultar el resultado (segundos)
+        - espera_maxima: tope de la espera entre consultas
+        - factor_espera: multiplicador de la espera tras cada consulta sin terminar
+        - max_reintentos: reintentos ante 429/5xx antes de dar la página por fallida
+        - timeout: tiempo máximo total por página (segundos)
+        - idioma: código de idioma opcional para la Read API (ej: "es")
+        """
+        self.endpoint = endpoint.rstrip("/")
+        self.key = key
+        self.max_en_vuelo = max_en_vuelo
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.factor_espera = factor_espera
+        self.max_reintentos = max_reintentos
+        self.timeout = timeout
+        self.idioma = idioma
+        self._semaforo = asyncio.Semaphore(max_en_vuelo)
+        self._http = None
+
+    async def __aenter__(self):
+        # Un único cliente HTTP reutiliza las conexiones (keep-alive) entre páginas
+        self._http = httpx.AsyncClient(
+            headers={"Ocp-Apim-Subscription-Key": self.key},
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=self.max_en_vuelo * 2),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._http.aclose()
+
+    async def _peticion(self, metodo, url, **kwargs):
+        """
+        Realiza una petición HTTP reintentando ante throttling (429) y errores 5xx.
+        Con 429 se espera lo que indique Retry-After; si no hay cabecera, se usa
+        una espera exponencial.
+        """
+        espera = self.espera_inicial
+        for intento in range(self.max_reintentos + 1):
+            if "content" in kwargs:
+                # Cada reintento vuelve a subir la imagen
+                BYTES.inc(len(kwargs["content"]), operacion="subido", destino="azure")
+            respuesta = await self._http.request(metodo, url, **kwargs)
+            if respuesta.status_code not in CODIGOS_REINTENTABLES or intento == self.max_reintentos:
+                return respuesta
+            REINTENTOS.inc(servicio="azure_read", codigo=respuesta.status_code)
+            await asyncio.sleep(_segundos_retry_after(respuesta, espera))
+            espera = min(espera * 2, self.espera_maxima * 10)
+        return respuesta
+
+    async def ocr(self, imagen):
+        """
+        Reconoce el texto de una imagen.
+
+        Parámetros:
+        - imagen: bytes de la imagen (PNG, JPEG, ...)
+
+        Retorna:
+        - Texto reconocido, una línea por cada línea detectada
+        """
+        # El semáforo cubre el envío y la espera: limita las operaciones abiertas en Azure
+        async with self._semaforo:
+            with medir("ocr", motor="azure"):
+                return await asyncio.wait_for(self._ocr(imagen), self.timeout)
+
+    async def _ocr(self, imagen):
+        params = {"language": self.idioma} if self.idioma else None
+        respuesta = await self._peticion(
+            "POST", self.endpoint + READ_ANALYZE_PATH,
+            content=imagen, params=params,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        if respuesta.status_code != 202:
+            raise ErrorOCRAzure(f"Envío rechazado ({respuesta.status_code}): {respuesta.text[:200]}")
+
+        # La URL donde consultar el resultado viene en la cabecera Operation-Location
+        operation_location = respuesta.headers["Operation-Location"]
+
+        # Espera adaptativa: consultas rápidas al principio, más espaciadas si tarda
+        espera = self.espera_inicial
+        while True:
+            await asyncio.sleep(espera)
+            respuesta = await self._peticion("GET", operation_location)
+            if respuesta.status_code != 200:
+                raise ErrorOCRAzure(f"Consulta fallida ({respuesta.status_code}): {respuesta.text[:200]}")
+
+            resultado = respuesta.json()
+            estado = resultado.get("status")
+            if estado not in ESTADOS_EN_CURSO:
+                break
+            espera = min(espera * self.factor_espera, self.espera_maxima)
+
+        if estado != "succeeded":
+            raise ErrorOCRAzure(f"OCR falló. Estado: {estado}")
+
+        lineas = []
+        for pagina in resultado["analyzeResult"]["readResults"]:
+            for linea in pagina["lines"]:
+                lineas.append(linea["text"])
+        return "\n".join(lineas)
+
+    async def ocr_lote(self, imagenes):
+        """
+        Reconoce muchas imágenes de forma concurrente.
+
+        Retorna:
+        - Lista de textos en el mismo orden que las imágenes. Las páginas que
+          fallan devuelven la excepción en su posición en lugar del texto.
+        """
+        return await asyncio.gather(*(self.ocr(imagen) for imagen in imagenes), return_exceptions=True)
+
+
+def iter_ocr_concurrente(items, endpoint, key, max_en_vuelo=16, **opciones):
+    """
+    Puente síncrono: aplica OCR concurrente a un iterable de páginas y entrega los
+    resultados en cuanto terminan, sin que el código que lo usa tenga que ser asyncio.
+
+    Parámetros:
+    - items: iterable de tuplas (etiqueta, imagen). La etiqueta se devuelve tal cual
+      para identificar el resultado. Si imagen es None la página no necesita OCR
+      (por ejemplo, un acierto de caché) y se devuelve sin llamar a Azure, de modo
+      que todas las páginas salen por el mismo flujo de resultados.
+    - endpoint, key, max_en_vuelo, **opciones: ver ClienteAzureReadAsync
+
+    Retorna (generador):
+    - Tuplas (etiqueta, texto) en orden de finalización. texto es None si la página
+      no necesitaba OCR, y "" si el OCR falló.
+
+    El bucle de eventos corre en un hilo propio; el iterable de entrada se consume
+    desde otro hilo, de modo que puede ser un generador lento (como el renderizado).
+    """
+    resultados = queue.Queue(maxsize=max_en_vuelo * 2)
+    fin = object()
+
+    async def productor():
+        loop = asyncio.get_running_loop()
+        iterador = iter(items)
+
+        async def procesar(etiqueta, imagen):
+            try:
+                texto = await cliente.ocr(imagen)
+            except Exception as e:
+                evento("ocr_fallido", nivel="error", motor="azure", error=str(e))
+                texto = ""
+            await loop.run_in_executor(None, resultados.put, (etiqueta, texto))
+
+        async with ClienteAzureReadAsync(endpoint, key, max_en_vuelo, **opciones) as cliente:
+            tareas = set()
+            while True:
+                # Limita las páginas leídas y no terminadas para mantener la memoria acotada
+                if len(tareas) >= max_en_vuelo * 2:
+                    _, tareas = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+
+                item = await loop.run_in_executor(None, next, iterador, fin)
+                if item is fin:
+                    break
+                etiqueta, imagen = item
+                if imagen is None:
+                    await loop.run_in_executor(None, resultados.put, (etiqueta, None))
+                else:
+                    tareas.add(asyncio.create_task(procesar(etiqueta, imagen)))
+
+            if tareas:
+                await asyncio.wait(tareas)
+
+    def ejecutar():
+        try:
+            asyncio.run(productor())
+        except BaseException as e:
+            # El error se relanza en el hilo que consume los resultados
+            resultados.put(e)
+        finally:
+            resultados.put(fin)
+
+    hilo = threading.Thread(target=ejecutar, daemon=True)
+    hilo.start()
+
+    while True:
+        resultado = resultados.get()
+        if resultado is fin:
+            break
+        if isinstance(resultado, BaseException):
+            raise resultado
+        yield resultado
+    hilo.join()
@@ -0,0 +1,142 @@
+"""
+Servidor HTTP local que imita el contrato de la Read API de Azure (v3.2).
+
+Sirve para probar y medir azure_ocr_async sin gastar llamadas reales:
+- POST /vision/v3.2/read/analyze  -> 202 + cabecera Operation-Location
+- GET  /vision/v3.2/read/analyzeResults/<id> -> {"status": "running"} hasta que pasa
+  la latencia simulada, y después {"status": "succeeded", "analyzeResult": {...}}
+- Si hay más operaciones abiertas que max_operaciones responde 429 con Retry-After
+
+Uso desde la línea de comandos:
+    python azure_read_stub.py --puerto 8765 --latencia 0.3
+Y en .env:
+    AZURE_VISION_ENDPOINT=http://127.0.0.1:8765
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+READ_ANALYZE_PATH = "/vision/v3.2/read/analyze"
+READ_RESULTS_PATH = "/vision/v3.2/read/analyzeResults/"
+
+
+def texto_por_defecto(imagen):
+    """Texto simulado: depende del contenido para poder comprobar el orden de resultados."""
+    return [f"Factura simulada {hashlib.sha256(imagen).hexdigest()[:12]}", f"Bytes: {len(imagen)}"]
+
+
+class _ManejadorRead(BaseHTTPRequestHandler):
+    # Silencia el log por petición de BaseHTTPRequestHandler
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo=None, cabeceras=None):
+        datos = json.dumps(cuerpo).encode("utf-8") if cuerpo is not None else b""
+        self.send_response(codigo)
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        servidor = self.server
+        if self.path.split("?")[0] != READ_ANALYZE_PATH:
+            return self._responder(404, {"error": {"code": "NotFound"}})
+
+        imagen = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        with servidor.lock:
+            servidor.peticiones += 1
+            abiertas = sum(1 for op in servidor.operaciones.values() if not op["leida"])
+            if servidor.max_operaciones and abiertas >= servidor.max_operaciones:
+                servidor.rechazos_429 += 1
+                return self._responder(
+                    429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                    {"Retry-After": str(servidor.retry_after)},
+                )
+            operation_id = str(uuid.uuid4())
+            servidor.operaciones[operation_id] = {
+                "listo_en": time.monotonic() + servidor.latencia,
+                "lineas": servidor.generar_texto(imagen),
+                "leida": False,
+            }
+
+        host, puerto = servidor.server_address[:2]
+        return self._responder(202, None, {
+            "Operation-Location": f"http://{host}:{puerto}{READ_RESULTS_PATH}{operation_id}"
+        })
+
+    def do_GET(self):
+        servidor = self.server
+        if not self.path.startswith(READ_RESULTS_PATH):
+            return self._responder(404, {"error": {"code": "NotFound"}})
+
+        operation_id = self.path[len(READ_RESULTS_PATH):]
+        with servidor.lock:
+            servidor.consultas += 1
+            operacion = servidor.operaciones.get(operation_id)
+            if operacion is None:
+                return self._responder(404, {"error": {"code": "NotFound"}})
+            if time.monotonic() < operacion["listo_en"]:
+                return self._responder(200, {"status": "running"})
+            operacion["leida"] = True
+
+        lineas = [{"text": texto} for texto in operacion["lineas"]]
+        return self._responder(200, {
+            "status": "succeeded",
+            "analyzeResult": {"readResults": [{"page": 1, "lines": lineas}]},
+        })
+
+
+def iniciar_servidor(puerto=0, latencia=0.2, max_operaciones=None, retry_after=1,
+                     generar_texto=texto_por_defecto):
+    """
+    Arranca el servidor simulado en un hilo en segundo plano.
+
+    Parámetros:
+    - puerto: puerto local (0 = cualquiera libre)
+    - latencia: segundos que tarda cada operación en pasar a "succeeded"
+    - max_operaciones: operaciones abiertas permitidas antes de responder 429 (None = sin límite)
+    - retry_after: valor de la cabecera Retry-After en los 429 (segundos, admite decimales)
+    - generar_texto: función bytes -> lista de líneas reconocidas
+
+    Retorna:
+    - (servidor, endpoint). Llamar a servidor.shutdown() para detenerlo.
+      servidor.peticiones, servidor.consultas y servidor.rechazos_429 cuentan el tráfico.
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _ManejadorRead)
+    servidor.daemon_threads = True
+    servidor.lock = threading.Lock()
+    servidor.operaciones = {}
+    servidor.latencia = latencia
+    servidor.max_operaciones = max_operaciones
+    servidor.retry_after = retry_after
+    servidor.generar_texto = generar_texto
+    servidor.peticiones = 0
+    servidor.consultas = 0
+    servidor.rechazos_429 = 0
+
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita la Read API de Azure")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--max-operaciones", type=int, default=None)
+    parser.add_argument("--retry-after", type=float, default=1)
+    args = parser.parse_args()
+
+    servidor, endpoint = iniciar_servidor(args.puerto, args.latencia, args.max_operaciones, args.retry_after)
+    print("Read API simulada en:", endpoint)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -1,13 +1,57 @@
+import io
 import os
+import sys
 import fitz # PyMuPDF
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
-def pdf_to_images(pdf_path, output_folder):
+# Métricas compartidas (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.metricas import medir, BYTES
+from comun.perfilado import perfilar
+
+# Documentos PDF abiertos dentro de cada proceso del pool (ruta -> fitz.Document).
+# Cada proceso conserva sus propios documentos para no reabrir el PDF en cada página.
+_documentos_abiertos = {}
+
+# Número máximo de documentos abiertos simultáneamente por proceso
+MAX_DOCUMENTOS_ABIERTOS = 8
+
+# Perfiles de renderizado con nombre. Cada motor de OCR elige el suyo para que la página
+# se renderice una sola vez a la resolución adecuada (get_pixmap() sin opciones usa 72 DPI).
+# - dpi: resolución de renderizado
+# - colorspace: 'gray' (1 canal) o 'rgb' (3 canales)
+# - alpha: incluir canal de transparencia
+# - clip: región a renderizar en fracciones de la página (x0, y0, x1, y1), o None = página completa
+# - max_side: tamaño máximo en píxeles del lado mayor; si se supera se reduce el DPI
+RENDER_PROFILES = {
+    # Tesseract funciona mejor alrededor de 300 DPI en escala de grises;
+    # evita el reescalado x2 posterior en preprocesar_imagen
+    "ocr-tesseract": {"dpi": 300, "colorspace": "gray", "alpha": False, "clip": None, "max_side": 7000},
+    # Azure Read acepta hasta 10000 px por lado; en gris la imagen subida pesa menos
+    "ocr-azure": {"dpi": 200, "colorspace": "gray", "alpha": False, "clip": None, "max_side": 10000},
+    # Vista previa pequeña en color
+    "thumbnail": {"dpi": 36, "colorspace": "rgb", "alpha": False, "clip": None, "max_side": 400},
+}
+
+# Página renderizada en memoria.
+# - name: nombre lógico de la página (nombre_archivo_page_N.png)
+# - data: bytes PNG (format='png') o muestras crudas del pixmap (format='raw')
+# - width, height, channels: dimensiones del pixmap (channels = componentes por píxel)
+# - path: ruta en disco si la página también se guardó, o None
+RenderedPage = namedtuple(
+    'RenderedPage',
+    ['pdf_path', 'page_num', 'name', 'data', 'format', 'width', 'height', 'channels', 'path']
+)
+
+def pdf_to_images(pdf_path, output_folder, profile=None):
     """
     Convierte un archivo PDF en imágenes PNG, una por cada página.
 
     Parámetros:
     pdf_path (str): Ruta completa al archivo PDF de entrada
     output_folder (str): Directorio donde se guardarán las imágenes
+    profile (str o None): Perfil de renderizado (ver RENDER_PROFILES); None = 72 DPI RGB
 
     Funcionalidad:
     - Abre el PDF usando PyMuPDF (fitz)
@@ -15,12 +59,7 @@ def pdf_to_images(pdf_path, output_folder):
     - Guarda cada página como archivo PNG separado
     """
     # El PDF está abierto, pero las páginas individuales están en disco
-    pdf_document = fitz.open(pdf_path)
-
-    # Extrae el nombre del archivo sin extensión para usar como prefijo
-    # os.path.basename() obtiene solo el nombre del archivo de la ruta completa
-    # os.path.splitext() separa nombre y extensión, [0] toma solo el nombre
-    file_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    pdf_document = _open_pdf(pdf_path)
 
     # Verifica si el directorio de salida existe, si no, lo crea
     if not os.path.exists(output_folder):
@@ -28,34 +67,268 @@ def pdf_to_images(pdf_path, output_folder):
 
     # Itera sobre cada página del PDF
     for page_num in range(len(pdf_document)):
+        _render_page(pdf_document, pdf_path, page_num, output_folder, fmt=None, profile=profile)
+
+def iter_pdf_pages(pdf_path, output_folder=None, fmt='png', profile=None, pages=None):
+    """
+    Renderiza las páginas de un PDF directamente en memoria, una a una.
+
+    Parámetros:
+    pdf_path (str): Ruta completa al archivo PDF de entrada
+    output_folder (str o None): Si se indica, además guarda cada página como PNG
+    fmt (str): 'png' (bytes codificados) o 'raw' (muestras crudas del pixmap)
+    profile (str o None): Perfil de renderizado (ver RENDER_PROFILES)
+    pages (lista o None): Índices de las páginas a renderizar (None = todas)
+
+    Retorna (generador):
+    RenderedPage: Cada página renderizada
+    """
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+
+    with _open_pdf(pdf_path) as pdf_document:
+        for page_num in (range(len(pdf_document)) if pages is None else pages):
+            yield _render_page(pdf_document, pdf_path, page_num, output_folder, fmt, profile)
+
+def to_pil_image(rendered_page):
+    """
+    Convierte una RenderedPage en un objeto PIL.Image sin leer nada de disco.
+    """
+    from PIL import Image
+
+    if rendered_page.format == 'raw':
+        # Modo PIL según el número de componentes del pixmap
+        mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[rendered_page.channels]
+        return Image.frombytes(mode, (rendered_page.width, rendered_page.height), rendered_page.data)
+    return Image.open(io.BytesIO(rendered_page.data))
+
+def _get_profile(profile):
+    """
+    Devuelve el diccionario de un perfil de renderizado a partir de su nombre.
+    También acepta un diccionario propio con las mismas claves, o None (sin perfil).
+    """
+    if profile is None or isinstance(profile, dict):
+        return profile
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Perfil de renderizado desconocido: {profile}")
+    return RENDER_PROFILES[profile]
+
+def _get_pixmap(page, profile):
+    """
+    Convierte la página a un mapa de píxeles aplicando el perfil de renderizado.
+    """
+    if profile is None:
+        # Comportamiento original: 72 DPI, RGB
+        return page.get_pixmap()
+
+    # Región a renderizar: la página completa o el recorte indicado en fracciones
+    rect = page.rect
+    clip = None
+    if profile.get("clip"):
+        x0, y0, x1, y1 = profile["clip"]
+        clip = fitz.Rect(
+            rect.x0 + rect.width * x0, rect.y0 + rect.height * y0,
+            rect.x0 + rect.width * x1, rect.y0 + rect.height * y1,
+        )
+        rect = clip
+
+    # Factor de zoom: 72 puntos PDF por pulgada
+    zoom = profile.get("dpi", 72) / 72
+
+    # Adaptación al tamaño: las páginas muy grandes (planos, A0...) se limitan a max_side
+    max_side = profile.get("max_side")
+    if max_side and max(rect.width, rect.height) * zoom > max_side:
+        zoom = max_side / max(rect.width, rect.height)
+
+    colorspace = fitz.csGRAY if profile.get("colorspace") == "gray" else fitz.csRGB
+    return page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom),
+        colorspace=colorspace,
+        alpha=profile.get("alpha", False),
+        clip=clip,
+    )
+
+def _render_page(pdf_document, pdf_path, page_num, output_folder=None, fmt='png', profile=None):
+    """
+    Renderiza una única página de un PDF ya abierto.
+
+    Parámetros:
+    output_folder (str o None): Si se indica, la página también se guarda como PNG
+    fmt (str o None): 'png' para bytes PNG codificados, 'raw' para las muestras crudas
+                      del pixmap, None si solo interesa el archivo en disco
+    profile (str, dict o None): Perfil de renderizado (ver RENDER_PROFILES)
+
+    Retorna:
+    RenderedPage: Página renderizada en memoria
+    """
+    # Duración de cada página en facturas_etapa_segundos{etapa="render"} (ver comun/metricas.py)
+    perfil = profile if isinstance(profile, str) else ("propio" if profile else "ninguno")
+    with medir("render", perfil=perfil):
+        # Extrae el nombre del archivo sin extensión para usar como prefijo
+        # os.path.basename() obtiene solo el nombre del archivo de la ruta completa
+        # os.path.splitext() separa nombre y extensión, [0] toma solo el nombre
+        file_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+        # Formato: nombre_archivo_page_N.png
+        name = f'{file_name}_page_{page_num + 1}.png'
+
         # Carga la página específica del PDF ram, para manipularlo se crea objeto asociado page
         page = pdf_document.load_page(page_num) # Objeto page contiene puntero a datos en RAM
 
-        # Convierte la página a un mapa de píxeles (imagen)
-        pix = page.get_pixmap()
+        # Convierte la página a un mapa de píxeles (imagen) según el perfil elegido
+        pix = _get_pixmap(page, _get_profile(profile))
 
-        # Construye la ruta completa para el archivo de salida
-        # Formato: nombre_archivo_page_N.png
-        output_path = os.path.join(output_folder, f'{file_name}_page_{page_num + 1}.png')
+        output_path = None
+        if output_folder is not None:
+            # Construye la ruta completa para el archivo de salida y guarda la imagen como PNG
+            output_path = os.path.join(output_folder, name)
+            pix.save(output_path)
+            BYTES.inc(os.path.getsize(output_path), operacion="escrito", destino="imagen")
+
+            # Línea comentada para debug: mostrar archivos guardados
+            #print(f'saved: {output_path}')
+
+        # MÉTODO pix.tobytes('png'): codifica el pixmap en memoria, sin pasar por disco
+        # pix.samples: bytes crudos (width * height * n), listos para numpy o PIL
+        if fmt is None:
+            data = None
+        elif fmt == 'raw':
+            data = pix.samples
+        else:
+            data = pix.tobytes('png')
+
+        return RenderedPage(pdf_path, page_num, name, data, fmt, pix.width, pix.height, pix.n, output_path)
 
-        # Guarda la imagen como archivo PNG
-        pix.save(output_path)
+def _open_pdf(pdf_path):
+    """Abre un PDF y suma su tamaño a los bytes leídos."""
+    pdf_document = fitz.open(pdf_path)
+    BYTES.inc(os.path.getsize(pdf_path), operacion="leido", origen="pdf")
+    return pdf_document
 
-        # Línea comentada para debug: mostrar archivos guardados
-        #print(f'saved: {output_path}')
+def _open_cached(pdf_path):
+    """
+    Devuelve el documento abierto en este proceso, abriéndolo solo la primera vez.
+    Cuando hay demasiados documentos abiertos se cierra el más antiguo.
+    """
+    pdf_document = _documentos_abiertos.get(pdf_path)
+    if pdf_document is None:
+        if len(_documentos_abiertos) >= MAX_DOCUMENTOS_ABIERTOS:
+            # Los diccionarios conservan el orden de inserción: el primero es el más antiguo
+            ruta_antigua = next(iter(_documentos_abiertos))
+            _documentos_abiertos.pop(ruta_antigua).close()
+        pdf_document = _open_pdf(pdf_path)
+        _documentos_abiertos[pdf_path] = pdf_document
+    return pdf_document
 
-def main(input_folder, output_folder):
+def render_page(pdf_path, page_num, output_folder=None, fmt='png', profile=None):
+    """
+    Tarea que ejecuta cada proceso del pool: renderiza una página de un PDF.
+
+    Parámetros:
+    pdf_path (str): Ruta completa al archivo PDF
+    page_num (int): Índice de la página (empezando en 0)
+    output_folder (str o None): Directorio donde guardar la imagen (None = solo memoria)
+    fmt (str): 'png' o 'raw'
+    profile (str o None): Perfil de renderizado (ver RENDER_PROFILES)
+
+    Retorna:
+    RenderedPage: Página renderizada
+    """
+    # Con PROFILE_SLOW_DOCS=true se guarda el perfil de las páginas lentas (escaneos enormes)
+    with perfilar("render", f"{pdf_path} (página {page_num + 1})", contenido=pdf_path):
+        return _render_page(_open_cached(pdf_path), pdf_path, page_num, output_folder, fmt, profile)
+
+def render_task(task, output_folder=None, fmt='png', profile=None):
+    """
+    Igual que render_page, pero recibe la tarea (pdf_path, page_num) como un único
+    argumento, tal como la generan iter_page_tasks y la etapa de renderizado del
+    pipeline (se puede fijar el resto con functools.partial).
+    """
+    pdf_path, page_num = task
+    return render_page(pdf_path, page_num, output_folder, fmt, profile)
+
+def iter_page_tasks(input_folder, skip=None):
+    """
+    Genera una tarea (pdf_path, page_num) por cada página de cada PDF de la carpeta.
+    Solo se lee el número de páginas; el renderizado lo hacen los procesos del pool.
+    Las páginas para las que skip(pdf_path, page_num) devuelve True no se generan.
+    """
+    for pdf_file in os.listdir(input_folder):
+        pdf_path = os.path.join(input_folder, pdf_file)
+        with fitz.open(pdf_path) as pdf_document:
+            page_count = len(pdf_document)
+        for page_num in range(page_count):
+            if skip is not None and skip(pdf_path, page_num):
+                continue
+            yield pdf_path, page_num
+
+def iter_pages_parallel(input_folder, output_folder=None, workers=None, fmt='png', profile=None, skip=None):
+    """
+    Convierte todos los PDFs de una carpeta repartiendo las PÁGINAS (no solo los
+    archivos) entre un pool de procesos, y devuelve cada imagen en cuanto está lista.
+
+    Parámetros:
+    input_folder (str): Directorio que contiene los archivos PDF a procesar
+    output_folder (str o None): Directorio donde guardar las imágenes (None = solo memoria)
+    workers (int): Número máximo de procesos (por defecto, uno por núcleo)
+    fmt (str o None): 'png' (bytes codificados), 'raw' (muestras crudas del pixmap) o
+        None (solo se guarda en output_folder; data es None)
+    profile (str o None): Perfil de renderizado (ver RENDER_PROFILES)
+    skip (callable o None): skip(pdf_path, page_num) -> True para no renderizar esa página
+        (por ejemplo, porque el manifiesto indica que ya se procesó)
+
+    Retorna (generador):
+    RenderedPage: Cada página, en el orden en que se terminan de renderizar
+
+    Funcionalidad:
+    - Mantiene como máximo 2 * workers páginas en vuelo, de modo que el consumidor
+      (por ejemplo, el OCR) puede empezar mientras el resto del lote se renderiza
+    """
+    workers = workers or os.cpu_count() or 1
+
+    # Verifica si el directorio de salida existe, si no, lo crea
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+
+    # Límite de páginas enviadas al pool y todavía no entregadas al consumidor
+    max_in_flight = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for pdf_path, page_num in iter_page_tasks(input_folder, skip):
+            pending.add(pool.submit(render_page, pdf_path, page_num, output_folder, fmt, profile))
+
+            # Si se alcanzó el límite, espera a que termine al menos una página
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        # Entrega las páginas que quedan pendientes según vayan terminando
+        for future in as_completed(pending):
+            yield future.result()
+
+def main(input_folder, output_folder, workers=1):
     """
     Función principal que procesa todos los PDFs en una carpeta de entrada.
 
     Parámetros:
     input_folder (str): Directorio que contiene los archivos PDF a procesar
     output_folder (str): Directorio donde se guardarán todas las imágenes generadas
+    workers (int): Número de procesos; con más de 1 se usa el modo paralelo
 
     Funcionalidad:
     - Lista todos los archivos en la carpeta de entrada
     - Para cada archivo PDF encontrado, llama a pdf_to_images()
     """
+    # Modo paralelo: reparte las páginas de todos los PDFs entre varios procesos.
+    # Solo se guardan los PNG en disco (fmt=None): no se codifican otra vez en memoria
+    # para enviarlos de vuelta a este proceso, que no los usa
+    if workers > 1:
+        for _ in iter_pages_parallel(input_folder, output_folder, workers, fmt=None):
+            pass
+        return
+
     # Obtiene la lista de todos los archivos en el directorio de entrada
     pdf_files = os.listdir(input_folder)
 
@@ -65,4 +338,4 @@ def main(input_folder, output_folder):
         pdf_path = os.path.join(input_folder, pdf_file)
 
         # Llama a la función que convierte el PDF a imágenes
-        pdf_to_images(pdf_path, output_folder)
\ No newline at end of file
+        pdf_to_images(pdf_path, output_folder)
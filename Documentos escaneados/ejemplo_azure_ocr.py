@@ -10,6 +10,7 @@ from PIL import Image
 import time  # Para manejo de tiempo (no usado actualmente)
 import re   # Para expresiones regulares (no usado actualmente)
 import os   # Para operaciones del sistema de archivos
+import sys  # Para poder importar los módulos compartidos de 'comun'
 import csv  # Para manejo de archivos CSV
 import json # Para manejo de datos JSON
 
@@ -20,6 +21,10 @@ from openai import OpenAI  # Cliente para API de OpenAI GPT
 # Módulo personalizado para convertir PDFs a imágenes
 import convert_to_img
 
+# Caché OCR compartida (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.cache import CacheDisco, clave_ocr
+
 # Cargar variables de entorno desde archivo .env
 load_dotenv()
 
@@ -90,7 +95,16 @@ def congnitive_azure_ocr(roi_name, computervision_client):
         print("ERROR OCR COGNITIVE AZURE:", e)
         return ""
 
-texto = congnitive_azure_ocr("path/factura_edesur.jpeg", computervision_client)
+ruta_imagen = "path/factura_edesur.jpeg"
+
+# Consulta la caché antes de llamar a Azure: si la imagen no cambió, no se vuelve a pagar el OCR
+with CacheDisco(os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")) as cache:
+    clave = clave_ocr(ruta_imagen, "azure-read-v3.2") if os.path.exists(ruta_imagen) else None
+    texto = cache.obtener(clave) if clave else None
+    if texto is None:
+        texto = congnitive_azure_ocr(ruta_imagen, computervision_client)
+        if clave and texto:
+            cache.guardar(clave, texto)
 
 print("Texto detectado:")
 print(texto)
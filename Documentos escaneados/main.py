@@ -1,162 +1,98 @@
 # IMPORTACIONES Y CONFIGURACIÓN INICIAL
 # Librerías necesarias para el procesamiento de facturas con OCR y IA
 
-# Azure Cognitive Services para OCR (reconocimiento óptico de caracteres)
-from azure.cognitiveservices.vision.computervision.models import OperationsStatusCodes
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from msrest.authentication import CognitiveServicesCredentials
-
 # PIL para manipulación de imágenes
 from PIL import Image
 
 # Librerías estándar de Python
+import io   # Para tratar bytes en memoria como si fueran archivos
 import os   
-import csv  # Para manejo de archivos CSV
+import sys  # Para poder importar los módulos compartidos de 'comun'
+import time # Para medir el inicio del lote
 import json # Para manejo de datos JSON
+import functools # Para fijar los argumentos de la etapa de renderizado
 
 # Variables de entorno y APIs externas
 from dotenv import load_dotenv  # Para cargar variables de entorno desde .env
-from openai import OpenAI  # Cliente para API de OpenAI GPT
 
 # Módulo personalizado para convertir PDFs a imágenes
 import convert_to_img
 
+# Cliente asíncrono de la Read API para OCR concurrente
+import azure_ocr_async
+
+# Módulos compartidos de la carpeta 'comun' (en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.cache import CacheDisco, clave_ocr, hash_contenido
+from comun.extraccion_llm import MotorExtraccionLLM
+from comun.extraccion_escalonada import ExtractorEscalonado
+from comun.salida_resultados import abrir_salida, TIPOS_FACTURA
+from comun.manifiesto import Manifiesto, clave_documento
+from comun.pipeline import Pipeline, Etapa
+from comun.metricas import configurar, evento, traza
+from comun.perfilado import imprimir_informe
+
 # Cargar variables de entorno desde archivo .env
 load_dotenv()
 
-# Configurar cliente de Azure Computer Vision
+# Credenciales de Azure Computer Vision (las usa el cliente asíncrono de la etapa de OCR)
 key = os.getenv("AZURE_VISION_KEY")  # Clave API de Azure
 endpoint = os.getenv("AZURE_VISION_ENDPOINT")  # Endpoint de Azure Cognitive Services
-computervision_client = ComputerVisionClient(endpoint, CognitiveServicesCredentials(key))
 
-# Configurar cliente de OpenAI
-client = OpenAI()  # Cliente para hacer llamadas a la API de OpenAI GPT
+# Campos que se extraen de cada factura (mismo orden que las columnas del CSV)
+INVOICE_FIELDS = ["Fecha", "Número", "Cliente", "Domicilio", "Ciudad", "NIF", "Subtotal", "IVA", "Total a pagar"]
+
+# Identificador del motor OCR para las claves de la caché (si cambia el modelo, cambia la clave)
+AZURE_OCR_ENGINE = "azure-read-v3.2"
 
 # Función que valida si un archivo es una imagen válida
 # Parámetros:
-#   - file_path: ruta del archivo a validar
+#   - image: ruta del archivo a validar, o bytes de la imagen ya cargada en memoria
 # Retorna:
 #   - True si el archivo es una imagen válida
 #   - False si no es válido o hay error
-def validate_image(file_path):
+def validate_image(image):
     try:
-        with Image.open(file_path) as img:
+        # Los bytes se envuelven en BytesIO para no tener que escribirlos a disco
+        source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+        with Image.open(source) as img:
             img.verify()
-            print("La imagen es válida.")
+            traza("La imagen es válida.")
             return True
     except Exception as e:
-        print(f"El archivo no es una imagen válida: {e}")
+        evento("imagen_no_valida", nivel="warning", error=str(e))
         return False
 
-# Función que realiza OCR (Optical Character Recognition) usando Azure Cognitive Services
-# Parámetros:
-#   - roi_name: ruta de la imagen a procesar
-#   - computervision_client: cliente de Azure Computer Vision
-# Retorna:
-#   - cleaned_ocr_text: texto extraído limpio de la imagen
-#   - ocr_emails: lista de emails encontrados (actualmente no implementada)
-# NOTA: Esta función está incompleta - el bloque try está vacío
-def cognitive_azure_ocr(roi_name, computervision_client):
-    cleaned_ocr_text = ""
-    ocr_emails = []
-
-    try:
-        '''
-        try vacío
-        '''
-    except Exception as e:
-        print("ERROR OCR COGNITIVE AZURE: ", e)
-
-    return cleaned_ocr_text, ocr_emails
-
-# Función que utiliza OpenAI GPT para extraer datos estructurados de una factura
-# Parámetros:
-#   - texto_factura: texto plano extraído de la imagen de la factura
-# Retorna:
-#   - datos_factura_str: cadena JSON con los datos extraídos de la factura
-#   Incluye campos como: Fecha, Número, Cliente, Domicilio, Ciudad, NIF, Subtotal, IVA, Total a pagar
-def extraer_datos_factura(texto_factura):
-    prompt = f"""
-    Extrae los siguientes campos del texto proporcionado y devuelve los resultados en formato JSON:
-    - Fecha
-    - Número
-    - Cliente
-    - Domicilio
-    - Ciudad
-    - NIF
-    - Subtotal
-    - IVA
-    - Total a pagar
-
-    Texto:
-    {texto_factura}
-    """
-    # MÉTODO: Envía la solicitud a la API de OpenAI
-    # client.chat.completions.create() crea una completación (respuesta) del chat
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",  # Modelo de IA a utilizar
-        messages=[{"role": "system", "content": "Eres un experto en análisis estructurado."},
-                  {"role": "user", "content": prompt}],  # Historial del chat
-        max_tokens=300  # Máximo número de tokens (palabras/piezas) en la respuesta
+# Función que abre la caché persistente de respuestas de GPT
+# Las facturas repetidas (duplicados, reenvíos, reprocesos tras un fallo) no vuelven a pagar
+# la llamada: la clave es el texto normalizado + plantilla del prompt + modelo + max_tokens.
+# Configuración: LLM_CACHE_PATH, LLM_CACHE_TTL_DAYS, LLM_CACHE_MAX_MB
+def open_llm_cache():
+    return CacheDisco(
+        os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+        ttl=float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
     )
 
-    # Obtener la respuesta y limpiar la cadena JSON
-    datos_factura_str = response.choices[0].message.content.strip()
-    datos_factura_str = datos_factura_str.replace('```json', '').replace('```', '').strip()
+# Columnas del registro de errores
+ERROR_FIELDS = ["Nombre factura", "Texto factura", "DatosGPT", "Error"]
 
-    return datos_factura_str
-
-# Función que agrega una fila de datos de factura a un archivo CSV
-# Parámetros:
-#   - file_name: nombre del archivo CSV donde guardar los datos
-#   - data: diccionario con los datos extraídos de la factura
-# Funcionalidad:
-#   - Si el archivo no existe, crea los encabezados del CSV
-#   - Agrega una nueva fila con los datos de la factura
-def add_row_csv(file_name, data):
-    file_exists = os.path.isfile(file_name)
-
-    # Abre el archivo en modo 'a' (append/agregar), crea el archivo si no existe.
-    # Parámetros:
-    # - "a": modo agregar (append), si el archivo no existe lo crea.
-    # - newline='': evita agregar líneas vacías extras al escribir en CSV.
-    with open(file_name, "a", newline='') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow(["Fecha", "Número", "Cliente", "Domicilio", "Ciudad", "NIF", "Subtotal", "IVA", "Total a pagar"])
-        row = [
-            data.get('Fecha', ''),
-            data.get('Número', ''),
-            data.get('Cliente', ''),
-            data.get('Domicilio', ''),
-            data.get('Ciudad', ''),
-            data.get('NIF', ''),
-            data.get('Subtotal', ''),
-            data.get('IVA', ''),
-            data.get('Total a pagar', '')
-        ]
-        writer.writerow(row)
-
-# Función que registra errores de procesamiento en un archivo CSV
+# Abre la salida de resultados según su extensión (.csv, .jsonl o carpeta .parquet)
 # Parámetros:
-#   - file_name: nombre del archivo CSV donde guardar los errores
-#   - data: diccionario con información del error (nombre factura, texto, datos GPT, error)
+#   - file_name: archivo (o carpeta, para Parquet) de salida
+#   - fields: columnas, en orden
+#   - types: tipos de columna (ver comun/salida_resultados.py)
+#   - on_write: función que recibe las referencias de las filas ya escritas
 # Funcionalidad:
-#   - Si el archivo no existe, crea los encabezados del CSV de errores
-#   - Agrega una nueva fila con los detalles del error encontrado
-def add_row_csv_errors(file_name, data):
-    file_exists = os.path.isfile(file_name)
-
-    # Abre el archivo en modo 'a' (append/agregar), crea el archivo si no existe.
-    # Parámetros:
-    # - "a": modo agregar (append), si el archivo no existe lo crea.
-    # - newline='': evita agregar líneas vacías extras al escribir en CSV.
-    # - encoding='utf-8': asegura que se usen caracteres UTF-8.
-    with open(file_name, "a", newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow(["Nombre factura", "Texto factura", "DatosGPT", "Error"])
-        writer.writerow([data['Nombre factura'], data['Texto factura'], data['DatosGPT'], data['Error']])
+#   - El archivo se mantiene abierto y las filas se escriben por lotes
+#     (RESULTS_BATCH_SIZE filas o cada RESULTS_FLUSH_SECONDS segundos)
+#   - Si el archivo CSV no existe, crea los encabezados
+def open_results(file_name, fields, types=None, on_write=None):
+    return abrir_salida(
+        file_name, fields, types, al_escribir=on_write,
+        tam_lote=int(os.getenv("RESULTS_BATCH_SIZE", "500")),
+        intervalo=float(os.getenv("RESULTS_FLUSH_SECONDS", "5")),
+    )
 
 """
 Sample data:
@@ -174,51 +110,242 @@ datos = {
     }
 """
 # BLOQUE PRINCIPAL DEL PROGRAMA
-# Flujo principal que procesa todas las facturas:
-# 1. Convierte PDFs a imágenes
-# 2. Procesa cada imagen con OCR
-# 3. Extrae datos estructurados con GPT
-# 4. Guarda resultados en CSV o registra errores
+# Flujo principal que procesa todas las facturas, como un pipeline de etapas que
+# trabajan a la vez, unidas por colas acotadas (ver comun/pipeline.py):
+# 1. Convierte PDFs a imágenes (pool de procesos, página a página)
+# 2. Busca cada página en la caché OCR y valida la imagen
+# 3. Procesa cada imagen con OCR (peticiones asíncronas concurrentes)
+# 4. Extrae datos estructurados con GPT (peticiones concurrentes por grupos)
+# 5. Guarda resultados en CSV o registra errores
 if __name__ == "__main__":
+    # Métricas y registro de eventos (METRICS_PORT, METRICS_FILE, LOG_JSON)
+    configurar()
+    # Inicio del lote: el informe de documentos lentos (PROFILE_SLOW_DOCS) solo muestra los de esta ejecución
+    batch_start = time.time()
+
     # Configurar rutas de archivos y carpetas
     facturas_folder = 'facturas'  # Carpeta con archivos PDF de facturas
-    output_folder = 'output_images'  # Carpeta donde se guardarán las imágenes convertidas
-    db_facturas = 'facturas_new.csv'  # Archivo CSV para guardar datos exitosos
+    output_folder = 'output_images'  # Carpeta donde se guardan las imágenes si SAVE_RENDERED_IMAGES está activo
+    # RESULTS_FORMAT: csv (por defecto), jsonl o parquet. JSONL y Parquet guardan la
+    # Fecha como fecha y Subtotal, IVA y Total a pagar como decimales
+    results_format = os.getenv("RESULTS_FORMAT", "csv")
+    db_facturas = f'facturas_new.{results_format}'  # Archivo para guardar datos exitosos
     db_errors_log = 'facturas_errors.csv'  # Archivo CSV para registrar errores
 
-    # Paso 1: Convertir PDFs a imágenes
-    convert_to_img.main(facturas_folder, output_folder)
+    # Manifiesto del lote: etapa alcanzada por cada página (renderizado, ocr, extraido,
+    # escrito) y sus salidas. Si el programa se interrumpe, la siguiente ejecución retoma
+    # cada página donde se quedó y no repite las que ya se escribieron
+    manifest = Manifiesto(os.getenv("MANIFEST_PATH", "manifiesto.sqlite"))
 
-    # Paso 2: Listar todas las imágenes generadas
-    img_files = os.listdir(output_folder)
-    print("Número de facturas a extraer:", len(img_files))
+    # Salidas de resultados y de errores: se abren una vez para todo el lote.
+    # Una página solo se marca como escrita cuando su fila ya está en el archivo
+    results_sink = open_results(db_facturas, INVOICE_FIELDS, TIPOS_FACTURA,
+                                on_write=lambda keys: manifest.registrar_varios(keys, "escrito"))
+    errors_sink = open_results(db_errors_log, ERROR_FIELDS)
 
-    # Paso 3: Procesar cada imagen de factura
-    for img_file in img_files:
-        img_path = os.path.join(output_folder, img_file)
+    # Clave de cada página en el manifiesto: hash del PDF + número de página.
+    # El hash de cada PDF se calcula una sola vez
+    pdf_hashes = {}
+    def page_key(pdf_path, page_num):
+        if pdf_path not in pdf_hashes:
+            pdf_hashes[pdf_path] = hash_contenido(pdf_path)
+        return clave_documento(pdf_hashes[pdf_path], page_num)
 
-        # Extraer texto de la imagen usando OCR de Azure
-        clean_text, emails = cognitive_azure_ocr(img_path, computervision_client)
+    # Páginas que ya pasaron el OCR o la extracción en una ejecución anterior: no se
+    # vuelven a renderizar; se retoman desde la etapa siguiente
+    resumed_ocr = []
+    resumed_extracted = []
+    def skip_page(pdf_path, page_num):
+        key = page_key(pdf_path, page_num)
+        state = manifest.retomar(key, "ocr")
+        if state is None:
+            return False
+        if not state.alcanzo("extraido"):
+            resumed_ocr.append((state.documento, state.salidas["texto"], key))
+        elif not state.alcanzo("escrito"):
+            resumed_extracted.append((key, state.salidas["datos"]))
+        # Las páginas ya escritas no necesitan nada más
+        return True
 
-        # Verificar si se pudo extraer texto
-        if clean_text == "":
-            print("No se ha podido extraer texto de la imagen.")
+    # Caché persistente de resultados OCR (clave: hash de la página + motor)
+    ocr_cache = CacheDisco(
+        os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite"),
+        max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "512")) * 1024 * 1024
+    )
+
+    # Número de procesos para renderizar páginas (por defecto, uno por núcleo)
+    render_workers = int(os.getenv("RENDER_WORKERS") or os.cpu_count() or 1)
+
+    # Guardar las imágenes en disco es opcional: por defecto las páginas viajan en memoria
+    # directamente al OCR, sin el ciclo escribir-releer PNG.
+    save_images = os.getenv("SAVE_RENDERED_IMAGES", "false").lower() in ("1", "true", "yes")
+
+    # Motor de extracción con GPT: varias peticiones simultáneas y, opcionalmente,
+    # varias facturas cortas por prompt (LLM_BATCH_SIZE > 1)
+    llm_engine = MotorExtraccionLLM(
+        INVOICE_FIELDS,
+        max_concurrencia=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        tam_lote=int(os.getenv("LLM_BATCH_SIZE", "1")),
+        cache=open_llm_cache(),
+    )
+
+    # Extracción escalonada: primero las expresiones regulares y GPT solo para los campos
+    # con baja confianza (TIERED_EXTRACTION=false para enviarlo todo a GPT)
+    tiered = os.getenv("TIERED_EXTRACTION", "true").lower() in ("1", "true", "yes")
+    tiered_extractor = ExtractorEscalonado(
+        llm_engine, umbral=float(os.getenv("REGEX_CONFIDENCE_THRESHOLD", "0.7"))
+    )
+
+    # Tamaño de cada grupo de facturas que se envía a GPT
+    llm_window = llm_engine.max_concurrencia * max(llm_engine.tam_lote, 1) * 2
+
+    # Extrae con GPT un grupo de facturas (de forma concurrente)
+    # Retorna:
+    #   - Lista de (key, datos_json) de las facturas extraídas; los errores se registran
+    def extract(invoices):
+        if not invoices:
+            return []
+        texts = [text for _, text, _ in invoices]
+        if tiered:
+            results = tiered_extractor.extraer_todos(texts)
         else:
-            # Extraer datos estructurados usando GPT
-            datos = extraer_datos_factura(clean_text)
+            results = llm_engine.extraer_todos_sync(texts)
+        extracted = []
+        for (img_file, clean_text, key), result in zip(invoices, results):
+            if isinstance(result, Exception):
+                evento("extraccion_fallida", nivel="error", documento=img_file, error=str(result))
+                # La página se queda en la etapa "ocr": se reintenta en la siguiente ejecución
+                manifest.registrar_error(key, result)
+                errors_sink.escribir({"Nombre factura": img_file, "Texto factura": clean_text, "DatosGPT": "", "Error": str(result)})
+                continue
 
+            datos = result.datos
             if datos:
                 try:
                     # Convertir respuesta de GPT a JSON
                     datos_json = json.loads(datos)
-                    # Guardar datos exitosos en CSV
-                    add_row_csv(db_facturas, datos_json)
+                    manifest.registrar(key, "extraido", datos=datos_json)
+                    extracted.append((key, datos_json))
                 except json.JSONDecodeError as e:
                     # Manejar errores de formato JSON
-                    print(f"Error al decodificar JSON: {e}")
-                    print(datos)
-                    print("Factura que ha fallado la extracción de datos: ", img_file)
-                    # Registrar error en CSV de errores
-                    add_row_csv_errors(db_errors_log, {"Nombre factura": img_file, "Texto factura": clean_text, "DatosGPT": datos, "Error": str(e)})
+                    evento("json_no_valido", nivel="error", documento=img_file, error=str(e), respuesta=datos)
+                    # Registrar error en el manifiesto y en el CSV de errores
+                    manifest.registrar_error(key, e)
+                    errors_sink.escribir({"Nombre factura": img_file, "Texto factura": clean_text, "DatosGPT": datos, "Error": str(e)})
             else:
-                print("La respuesta de extraer_datos_factura está vacía.")
\ No newline at end of file
+                evento("extraccion_vacia", nivel="warning", documento=img_file)
+        return extracted
+
+    # Páginas de OCR simultáneas en Azure
+    ocr_in_flight = int(os.getenv("AZURE_OCR_MAX_IN_FLIGHT", "16"))
+
+    # Etapa 2: busca la página en la caché OCR, así las páginas ya procesadas en
+    # ejecuciones anteriores no vuelven a enviarse a Azure
+    def check_cache(page):
+        key = page_key(page.pdf_path, page.page_num)
+        manifest.registrar(key, "renderizado", documento=page.name)
+        cache_key = clave_ocr(page.data, AZURE_OCR_ENGINE)
+        cached_text = ocr_cache.obtener(cache_key)
+        if cached_text is None and not validate_image(page.data):
+            # Si la imagen no es válida no se envía nada a Azure
+            cached_text = ""
+        return page, key, cache_key, cached_text
+
+    # Etapa 3: OCR de la página. Varias páginas se procesan a la vez y cada resultado
+    # llega en cuanto Azure termina, sin esperas fijas de 1 segundo entre consultas
+    async def ocr_page(ocr_client, item):
+        page, key, cache_key, cached_text = item
+        if cached_text is not None:
+            clean_text = cached_text
+        else:
+            try:
+                clean_text = await ocr_client.ocr(page.data)
+            except Exception as e:
+                evento("ocr_fallido", nivel="error", motor="azure", documento=page.name, error=str(e))
+                clean_text = ""
+            # Solo se guardan los OCR correctos, para reintentar los fallidos
+            if clean_text:
+                ocr_cache.guardar(cache_key, clean_text)
+
+        # Verificar si se pudo extraer texto
+        if clean_text == "":
+            evento("sin_texto", nivel="warning", documento=page.name)
+            return None
+        manifest.registrar(key, "ocr", texto=clean_text)
+        return page.name, clean_text, key
+
+    # Etapa 5: guarda los datos extraídos (se escriben por lotes)
+    def save(extracted):
+        key, datos_json = extracted
+        results_sink.escribir(datos_json, referencia=key)
+
+    # Cada etapa trabaja en cuanto recibe elementos: mientras GPT extrae un grupo, el OCR
+    # y el renderizado siguen con las páginas siguientes. Las colas entre etapas
+    # (PIPELINE_QUEUE_SIZE) limitan las páginas en memoria: si una etapa se retrasa,
+    # las anteriores esperan en lugar de acumular imágenes
+    pipeline = Pipeline([
+        # El perfil "ocr-azure" renderiza cada página una sola vez a la resolución que necesita Azure.
+        # Guardar las imágenes en disco es opcional: por defecto las páginas viajan en memoria
+        Etapa("render", functools.partial(convert_to_img.render_task,
+                                          output_folder=output_folder if save_images else None,
+                                          profile="ocr-azure"),
+              modo="procesos", workers=render_workers),
+        Etapa("cache", check_cache),
+        Etapa("ocr", ocr_page, modo="async", workers=ocr_in_flight,
+              contexto=lambda: azure_ocr_async.ClienteAzureReadAsync(endpoint, key, ocr_in_flight)),
+        # Un único hilo basta: cada grupo ya se envía a GPT de forma concurrente
+        Etapa("extraer", extract, lote=llm_window),
+        Etapa("guardar", save),
+    ],
+        tam_cola=int(os.getenv("PIPELINE_QUEUE_SIZE", str(max(2 * render_workers, ocr_in_flight)))),
+        intervalo_informe=float(os.getenv("PIPELINE_STATS_SECONDS", "0")) or None,
+    )
+
+    if save_images:
+        os.makedirs(output_folder, exist_ok=True)
+
+    # Una tarea (pdf_path, page_num) por página. Las páginas que ya pasaron el OCR en una
+    # ejecución anterior no se generan (se retoman más abajo)
+    # Si una etapa entera falla (ej: el cliente de Azure no arranca), ejecutar() relanza el
+    # error: antes de salir se escribe lo que ya se había extraído
+    try:
+        for _ in pipeline.ejecutar(convert_to_img.iter_page_tasks(facturas_folder, skip=skip_page)):
+            pass
+    except Exception:
+        results_sink.cerrar()
+        errors_sink.cerrar()
+        raise
+
+    # Páginas retomadas de una ejecución anterior: las ya extraídas solo falta escribirlas;
+    # las que tenían texto OCR se envían a GPT
+    # (page_id y no key: key es la clave de Azure que usa la etapa de OCR)
+    for page_id, datos_json in resumed_extracted:
+        results_sink.escribir(datos_json, referencia=page_id)
+    for start in range(0, len(resumed_ocr), llm_window):
+        for extracted in extract(resumed_ocr[start:start + llm_window]):
+            save(extracted)
+
+    # Métricas de cada etapa: elementos por segundo, colas y cuello de botella
+    print("Pipeline:")
+    print(pipeline.informe())
+
+    # Resumen de tokens y latencia de las llamadas a GPT, y de lo resuelto sin GPT
+    print("Extracción GPT:", llm_engine.estadisticas())
+    if tiered:
+        print("Extracción escalonada:", tiered_extractor.estadisticas())
+
+    # Escribe las filas pendientes y cierra las salidas
+    results_sink.cerrar()
+    errors_sink.cerrar()
+    print("Resultados:", results_sink.estadisticas())
+
+    # Resumen del manifiesto: páginas en cada etapa y retomadas en esta ejecución
+    print("Manifiesto:", manifest.estadisticas())
+    manifest.cerrar()
+
+    # Resumen de la caché OCR: aciertos = páginas que no se enviaron a Azure
+    print("Caché OCR:", ocr_cache.estadisticas())
+    ocr_cache.cerrar()
+
+    # Páginas más lentas del lote y sus funciones más costosas (PROFILE_SLOW_DOCS=true)
+    imprimir_informe(desde=batch_start)
@@ -1,57 +1,59 @@
 from PIL import Image, ImageEnhance, ImageFilter  # PIL para manipular imágenes
 import pytesseract  # Librería OCR
-import re  # Expresiones regulares para extraer datos
-import cv2  # OpenCV para procesamiento de imágenes
-import numpy as np  # Numpy para manejo numérico (no se usa explícito aquí)
 import os  # Para interacción con el sistema operativo
+import sys  # Para poder importar los módulos compartidos de 'comun'
+import time  # Para marcar el inicio en el informe de perfiles
+
+# Caché OCR compartida (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.cache import CacheDisco, clave_ocr
+from comun.patrones_factura import extraer_campos
+from comun.metricas import configurar, traza
+from comun.perfilado import perfilar, imprimir_informe
+from preprocesado import PipelinePreprocesado
+from ocr_tesseract import PoolTesseract
+from plantillas_roi import OCRPorPlantillas
 
 # Configura la ruta ejecutable de Tesseract para OCR
 pytesseract.pytesseract.tesseract_cmd = r'C:/Program Files/Tesseract-OCR/tesseract.exe'
 
 # Función para mejorar la calidad de la imagen antes del OCR
-def preprocesar_imagen(ruta_imagen):
-    """Mejora la imagen para mejor reconocimiento OCR"""
-    # Lee la imagen con OpenCV desde la ruta
-    img = cv2.imread(ruta_imagen)
-    
-    # Verifica si la imagen se cargó correctamente
-    if img is None:
-        # Si no se pudo cargar, lanza un error
-        raise FileNotFoundError(f"No se pudo cargar la imagen: {ruta_imagen}")
-    
-    # Convierte la imagen a escala de grises para simplificar el procesamiento
-    gris = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    # Aumenta el tamaño al doble para mejorar la precisión del OCR
-    escala = 2
-    ancho = int(gris.shape[1] * escala)
-    alto = int(gris.shape[0] * escala)
-    gris = cv2.resize(gris, (ancho, alto), interpolation=cv2.INTER_CUBIC)
-    
-    # Aplica umbralización adaptativa para resaltar los caracteres
-    umbral = cv2.adaptiveThreshold(
-        gris, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-        cv2.THRESH_BINARY, 11, 2
-    )
-    
-    # Reduce el ruido de la imagen processed (mejora OCR)
-    denoised = cv2.fastNlMeansDenoising(umbral, None, 10, 7, 21)
-    
-    # imwrite: escribir imagen en disco duro, toma los datos que están en la memoria RAM (dentro de la variable denoised) 
-    # los guarda físicamente en tu disco duro como un archivo de imagen real.
-    # denoised es una matriz numerica, con esto OpenCV (cv2) procesa mucho mas rapido que procesar "objetos de imagen".
-    cv2.imwrite("imagen_procesada.png", denoised)
-    
+def preprocesar_imagen(ruta_imagen, escala=2, denoise="nlmeans", guardar=True):
+    """Mejora la imagen para mejor reconocimiento OCR
+
+    Parámetros:
+    - ruta_imagen: ruta de la imagen, o array de Numpy ya cargado en memoria
+      (por ejemplo, una página renderizada con el perfil "ocr-tesseract" de convert_to_img)
+    - escala: factor de ampliación. Las capturas de pantalla necesitan x2; las páginas
+      renderizadas con el perfil "ocr-tesseract" ya llegan a 300 DPI en gris, así que
+      se usa escala=1 y el paso de reescalado desaparece.
+    - denoise: modo de reducción de ruido (ver preprocesado.MODOS_DENOISE)
+    - guardar: si es True, guarda la imagen procesada como 'imagen_procesada.png'
+
+    Para lotes de páginas conviene usar directamente PipelinePreprocesado.procesar_lote,
+    que reutiliza buffers y reparte las páginas en varios hilos.
+    """
+    # Con PROFILE_SLOW_DOCS=true se guarda el perfil si la imagen es lenta o usa mucha memoria
+    documento = ruta_imagen if isinstance(ruta_imagen, str) else "imagen en memoria"
+    with perfilar("preprocesado", documento, contenido=ruta_imagen), \
+            PipelinePreprocesado(escala=escala, denoise=denoise, workers=1,
+                                 carpeta_depuracion="." if guardar else None) as pipeline:
+        procesada = pipeline.procesar(ruta_imagen, nombre="imagen")
+
     # Convierte el array de Numpy a objeto PIL y lo retorna
     # Los empaqueta en un formato de "Imagen" que otras librerías (como Tesseract para OCR) entienden mejor.
-    return Image.fromarray(denoised)
+    return Image.fromarray(procesada)
 
 # ==== COMIENZA EL FLUJO DE EXTRACCIÓN DE DATOS ====
 
+# Métricas y registro de eventos (METRICS_PORT, METRICS_FILE, LOG_JSON)
+configurar()
+inicio = time.time()
+
 # Muestra mensaje de inicio
 print("Procesando imagen...")
-# Muestra el directorio actual para referencia
-print(f"Directorio actual: {os.getcwd()}")
+# Muestra el directorio actual para referencia (VERBOSE=true)
+traza(f"Directorio actual: {os.getcwd()}")
 
 # Verifica que el archivo de imagen de entrada exista en el directorio de trabajo
 if not os.path.exists("captura.png"):
@@ -63,106 +65,69 @@ if not os.path.exists("captura.png"):
     # Termina la ejecución por error
     exit(1)
 
-# Procesa la imagen para mejorarla de cara al OCR
-img_procesada = preprocesar_imagen("captura.png")
-
 # Prepara la configuración personalizada para Tesseract (OCR Engine Mode y Page Segmentation Mode)
 custom_config = r'--oem 3 --psm 6'
 
-# Intenta reconocimiento primero en español; si da error, prueba inglés
-print("Intentando extraer texto…")
-try:
-    # Intenta identificar texto en español
-    text = pytesseract.image_to_string(img_procesada, lang='spa', config=custom_config)
-    print("✓ Usando idioma: Español")
-except pytesseract.TesseractError:
-    # Si hay error de idioma, usa inglés
-    print("⚠ Idioma español no disponible, usando inglés")
-    text = pytesseract.image_to_string(img_procesada, lang='eng', config=custom_config)
-
-# Muestra el texto detectado por OCR
-print("=== TEXTO EXTRAÍDO ===")
-print(text)
+# Escala y reducción de ruido del preprocesado: forman parte de la clave porque cambian
+# el resultado del OCR. DENOISE_MODE: nlmeans (por defecto), nlmeans_antes, bilateral,
+# mediana, omitir o auto (según el ruido medido en la imagen)
+escala = 2
+denoise = os.getenv("DENOISE_MODE", "nlmeans")
+guardar_procesada = os.getenv("SAVE_PROCESSED_IMAGE", "true").lower() in ("1", "true", "yes")
+
+# OCR por regiones: con USE_ROI_TEMPLATES=true se aprende dónde están los campos de cada
+# diseño de factura (ROI_TEMPLATES_PATH) y en las siguientes del mismo diseño solo se
+# reconocen esas zonas
+usar_plantillas = os.getenv("USE_ROI_TEMPLATES", "false").lower() in ("1", "true", "yes")
+ruta_plantillas = os.getenv("ROI_TEMPLATES_PATH", "plantillas_roi.json")
+
+# Motor Tesseract que se mantiene cargado; el idioma (español, o inglés si no está
+# instalado) se comprueba una sola vez al crearlo
+ocr = PoolTesseract(idiomas=("spa", "eng"), config=custom_config, workers=1)
+traza(f"✓ Usando idioma: {ocr.idioma} (motor: {ocr.motor})")
+
+# Caché persistente: si la imagen y la configuración no cambiaron, se reutiliza el texto
+cache = CacheDisco(os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite"))
+clave = clave_ocr("captura.png", "tesseract",
+                  f"{custom_config} escala={escala} denoise={denoise} roi={usar_plantillas}", ocr.idioma)
+text = cache.obtener(clave)
+
+if text is not None:
+    traza("✓ Texto recuperado de la caché OCR")
+elif usar_plantillas:
+    # Preprocesa y reconoce solo las regiones de la plantilla (o la página completa
+    # la primera vez que aparece este diseño)
+    traza("Intentando extraer texto por regiones…")
+    roi = OCRPorPlantillas(ocr, PipelinePreprocesado(escala=escala, denoise=denoise, workers=1),
+                           ruta_plantillas)
+    resultado = roi.reconocer("captura.png")
+    text = resultado.texto
+    traza(f"✓ Origen del texto: {resultado.origen} (plantilla {resultado.plantilla})")
+
+    cache.guardar(clave, text)
+else:
+    # Procesa la imagen para mejorarla de cara al OCR
+    img_procesada = preprocesar_imagen("captura.png", escala, denoise, guardar_procesada)
+
+    traza("Intentando extraer texto…")
+    with perfilar("ocr", "captura.png"):
+        text = ocr.reconocer(img_procesada)
+
+    cache.guardar(clave, text)
+
+ocr.cerrar()
+cache.cerrar()
+
+# Muestra el texto detectado por OCR (VERBOSE=true)
+traza("=== TEXTO EXTRAÍDO ===")
+traza(text)
 # Linea divisoria en consola
-print("\n" + "="*50 + "\n")
-
-# Define patrones flexibles para buscar campos específicos (maneja errores OCR)
-patterns = {
-    # Busca fechas (soporta variaciones y caracteres confusos por OCR)
-    "fecha": [
-        r"F[ea]ch?a[:\s]+(\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})",  # Fecha tipo 01/12/2022 o similares
-        r"(\d{2}[/\-\.]\d{2}[/\-\.]\d{4})"  # Alternativa simple: 02/03/2022
-    ],
-    # Número de factura
-    "numero": [
-        r"N[uú]mero[:\s]+(\d+)",
-        r"Numero[:\s]+(\d+)"  # Considera también sin tilde
-    ],
-    # Nombre del cliente
-    "cliente": [
-        r"Cliente[:\s]+([^\n]+?)(?=\n|Domicilio)",
-        r"Cliente[:\s]+(.+?)(?=\n)"
-    ],
-    # Domicilio
-    "domicilio": [
-        r"Domicilio[:\s]+([^\n]+?)(?=\n|Ciudad)",
-        r"Dom[ie]cilio[:\s]+(.+?)(?=\n)"  # Soporta posibles errores de OCR en la palabra
-    ],
-    # Ciudad del cliente
-    "ciudad": [
-        r"Ciudad[:\s]+([^\n]+?)(?=\n|DNI|NIF)",
-        r"Ciudad[:\s]+(.+?)(?=\n)"
-    ],
-    # NIF o documento
-    "nif": [
-        r"DNI[/\s]?NIF[:\s]+([A-Z0-9]+)",
-        r"IE\s+([A-Z0-9]{7,})"
-    ],
-    # Concepto de la factura
-    "concepto": [
-        r"Publicidad[^\n]+(?:\n|$)"  # Busca cualquier línea que comience con 'Publicidad'
-    ],
-    # Subtotal
-    "subtotal": [
-        r"SUBTOTAL[:\s]+([\d.,]+)",
-        r"(?:SUBTOTAL|Subtotal)[:\s]*([\d\s.,]+?)(?=\n|IVA)"
-    ],
-    # IVA
-    "iva": [
-        r"IVA[^0-9]+([\d.,]+)",
-        r"(?:IVA|iva)[^\d]+([\d\s.,]+?)(?=\n)"
-    ],
-    # Total a pagar
-    "total_a_pagar": [
-        r"TOTAL\s*A?\s*PAGAR[:\s]+([\d.,]+)",
-        r"TOTAL[:\s]+([\d.,]+)"
-    ]
-}
-
-# Función para buscar el valor de un campo usando patrones
-# campo: el nombre del campo que se busca (por claridad, pero no se usa en el match directo)
-# lista_patrones: patrones predefinidos para cada campo
-# texto: texto sobre el cual buscar
-
-def extraer_valor(campo, lista_patrones, texto):
-    """Intenta múltiples patrones hasta encontrar uno que funcione"""
-    for patron in lista_patrones:
-        # Busca usando el patrón con flags para ignorar mayúsculas/minúsculas y saltos de línea
-        match = re.search(patron, texto, re.IGNORECASE | re.DOTALL)
-        if match:
-            valor = match.group(1).strip()  # Extrae y limpia el valor
-            # Elimina espacios y caracteres erróneos extra
-            valor = re.sub(r'\s+', ' ', valor)
-            return valor
-    # Si no encuentra, retorna "No encontrado"
-    return "No encontrado"
-
-# Diccionario para guardar los resultados extraídos
-resultados = {}
-
-# Itera sobre los patrones y extrae valores del texto detectado
-for campo, lista_patrones in patterns.items():
-    resultados[campo] = extraer_valor(campo, lista_patrones, text)
+traza("\n" + "="*50 + "\n")
+
+# Los patrones de cada campo están en comun/patrones_factura.py, compartidos con la
+# extracción escalonada (regex primero, GPT solo si hace falta)
+# Extrae todos los campos en una sola pasada por el texto detectado
+resultados = extraer_campos(text)
 
 # Muestra en consola los resultados extraídos de la factura
 print("=== DATOS EXTRAÍDOS ===")
@@ -178,4 +143,8 @@ with open("factura_extraida.txt", "w", encoding="utf-8") as f:
 
 # Notificaciones en consola de los archivos generados
 print("\n✓ Resultados guardados en 'factura_extraida.txt'")
-print("✓ Imagen procesada guardada en 'imagen_procesada.png'")
+if guardar_procesada and os.path.exists("imagen_procesada.png"):
+    print("✓ Imagen procesada guardada en 'imagen_procesada.png'")
+
+# Perfiles guardados de esta ejecución (PROFILE_SLOW_DOCS=true)
+imprimir_informe(desde=inicio)
@@ -0,0 +1,348 @@
+"""
+OCR con Tesseract manteniendo los motores cargados entre páginas.
+
+pytesseract.image_to_string lanza un proceso 'tesseract' por llamada, que vuelve a
+cargar el modelo (traineddata) cada vez; en recibos pequeños eso cuesta más que el
+propio reconocimiento. PoolTesseract evita ese coste:
+
+- Con tesserocr instalado (API C de Tesseract): un motor PyTessBaseAPI por hilo, que
+  carga el modelo una sola vez y reconoce todas las páginas que le llegan. tesserocr
+  libera el GIL durante el reconocimiento, así que los hilos trabajan en paralelo.
+- Sin tesserocr: el ejecutable 'tesseract' en modo lista. Cada worker recibe un bloque
+  de páginas y las reconoce en una sola ejecución, cargando el modelo una vez por bloque.
+  Es solo un respaldo: el ejecutable no puede quedarse abierto entre llamadas, así que
+  cada reconocer() de una sola página sigue lanzando un proceso. tesserocr es opcional
+  (pip install tesserocr; necesita libtesseract, ver requirements.txt): sin él, se avisa
+  al crear el pool.
+
+Los idiomas se comprueban una vez al crear el pool, en lugar de capturar
+TesseractError en cada página.
+"""
+import io
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np  # Numpy para manejo numérico
+import pytesseract  # Librería OCR (ejecutable y comprobación de idiomas)
+from PIL import Image  # PIL para convertir y guardar las páginas
+
+# Métricas compartidas (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.metricas import medir, evento
+
+# Tesseract usa OpenMP dentro de cada motor; como el pool ya reparte las páginas entre
+# núcleos, se limita a un hilo por motor para no repartirlos dos veces
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Orden de preferencia de idiomas (el primero disponible es el que se usa)
+IDIOMAS_PREFERIDOS = ("spa", "eng")
+
+# Línea reconocida con su caja en píxeles de la imagen: (x0, y0, x1, y1)
+LineaOCR = namedtuple('LineaOCR', ['texto', 'caja'])
+
+
+def idiomas_disponibles(motor, tessdata=None):
+    """Retorna el conjunto de idiomas instalados para el motor ("tesserocr" o "cli")."""
+    if motor == "tesserocr":
+        if tessdata:
+            return set(tesserocr.get_languages(tessdata)[1])
+        return set(tesserocr.get_languages()[1])
+    config = f'--tessdata-dir "{tessdata}"' if tessdata else ''
+    return set(pytesseract.get_languages(config=config))
+
+
+def elegir_idioma(preferidos, disponibles):
+    """
+    Retorna el primer idioma preferido que esté instalado. Admite combinaciones como
+    "spa+eng", que solo se eligen si están instalados todos sus idiomas.
+    """
+    for idioma in preferidos:
+        if all(parte in disponibles for parte in idioma.split("+")):
+            return idioma
+    raise RuntimeError(
+        f"Ningún idioma de {list(preferidos)} está instalado en Tesseract "
+        f"(disponibles: {sorted(disponibles)})"
+    )
+
+
+def _opciones_config(config):
+    """
+    Separa una configuración estilo línea de comandos ("--oem 3 --psm 6 -c clave=valor")
+    en (psm, oem, variables) para la API C.
+    """
+    psm, oem, variables = None, None, {}
+    partes = shlex.split(config)
+    i = 0
+    while i < len(partes):
+        if partes[i] == "--psm" and i + 1 < len(partes):
+            psm = int(partes[i + 1])
+            i += 1
+        elif partes[i] == "--oem" and i + 1 < len(partes):
+            oem = int(partes[i + 1])
+            i += 1
+        elif partes[i] == "-c" and i + 1 < len(partes):
+            clave, _, valor = partes[i + 1].partition("=")
+            variables[clave] = valor
+            i += 1
+        i += 1
+    return psm, oem, variables
+
+
+def _a_array(pagina):
+    """Convierte una página (array, imagen PIL, bytes o ruta) en array uint8 de 1 o 3 canales."""
+    if isinstance(pagina, np.ndarray):
+        return pagina
+    if isinstance(pagina, (bytes, bytearray)):
+        pagina = Image.open(io.BytesIO(pagina))
+    elif isinstance(pagina, str):
+        pagina = Image.open(pagina)
+    if pagina.mode not in ("L", "RGB"):
+        pagina = pagina.convert("RGB")
+    return np.asarray(pagina)
+
+
+class PoolTesseract:
+    """
+    Pool de motores Tesseract que se mantienen cargados.
+
+    Uso:
+        with PoolTesseract(config="--oem 3 --psm 6", workers=4) as ocr:
+            print("Idioma:", ocr.idioma)
+            for texto in ocr.reconocer_todas(paginas):   # mismo orden que las páginas
+                ...
+    """
+
+    def __init__(self, idiomas=IDIOMAS_PREFERIDOS, config="--oem 3 --psm 6", workers=None,
+                 motor=None, tessdata=None, paginas_por_lote=8):
+        """
+        Parámetros:
+        - idiomas: idiomas en orden de preferencia; se usa el primero instalado
+        - config: opciones de Tesseract como en pytesseract (--oem, --psm, -c clave=valor)
+        - workers: motores en paralelo (None = uno por núcleo)
+        - motor: "tesserocr", "cli" o None (tesserocr si está instalado)
+        - tessdata: carpeta de los modelos (None = la de la instalación)
+        - paginas_por_lote: páginas por ejecución del modo "cli"
+        """
+        if motor is None:
+            motor = "tesserocr" if tesserocr is not None else "cli"
+            if motor == "cli":
+                evento("tesseract_sin_api", nivel="warning",
+                       detalle="tesserocr no está instalado: cada llamada lanza 'tesseract' y recarga el modelo")
+        if motor == "tesserocr" and tesserocr is None:
+            raise RuntimeError("tesserocr no está instalado (pip install tesserocr)")
+        self.motor = motor
+        self.config = config
+        self.tessdata = tessdata
+        self.workers = workers or os.cpu_count() or 1
+        self.paginas_por_lote = max(1, paginas_por_lote)
+
+        # Comprobación de idiomas una sola vez, al arrancar
+        self.idioma = elegir_idioma(idiomas, idiomas_disponibles(motor, tessdata))
+
+        self._local = threading.local()
+        self._motores = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.paginas = 0
+        self.segundos = 0.0
+
+    def _api(self):
+        """Motor de la API C del hilo actual; se crea (y carga el modelo) la primera vez."""
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            psm, oem, variables = _opciones_config(self.config)
+            opciones = {"lang": self.idioma}
+            if self.tessdata:
+                opciones["path"] = self.tessdata
+            if psm is not None:
+                opciones["psm"] = psm
+            if oem is not None:
+                opciones["oem"] = oem
+            api = tesserocr.PyTessBaseAPI(**opciones)
+            for clave, valor in variables.items():
+                api.SetVariable(clave, valor)
+            self._local.api = api
+            with self._lock:
+                self._motores.append(api)
+        return api
+
+    def _cargar_en_api(self, pagina):
+        api = self._api()
+        array = np.ascontiguousarray(_a_array(pagina))
+        alto, ancho = array.shape[:2]
+        canales = 1 if array.ndim == 2 else array.shape[2]
+        api.SetImageBytes(array.tobytes(), ancho, alto, canales, ancho * canales)
+        return api
+
+    def _reconocer_api(self, paginas):
+        return [self._cargar_en_api(pagina).GetUTF8Text() for pagina in paginas]
+
+    def _lineas_api(self, pagina):
+        api = self._cargar_en_api(pagina)
+        api.Recognize()
+        nivel = tesserocr.RIL.TEXTLINE
+        lineas = []
+        for resultado in tesserocr.iterate_level(api.GetIterator(), nivel):
+            texto = (resultado.GetUTF8Text(nivel) or "").strip()
+            caja = resultado.BoundingBox(nivel)
+            if texto and caja:
+                lineas.append(LineaOCR(texto, tuple(caja)))
+        return lineas
+
+    def _lineas_cli(self, pagina):
+        datos = pytesseract.image_to_data(
+            Image.fromarray(_a_array(pagina)), lang=self.idioma, config=self._config_cli(),
+            output_type=pytesseract.Output.DICT
+        )
+        # Las palabras de una misma línea comparten bloque, párrafo y número de línea
+        por_linea = {}
+        for i, palabra in enumerate(datos["text"]):
+            if not palabra.strip():
+                continue
+            clave = (datos["block_num"][i], datos["par_num"][i], datos["line_num"][i])
+            x0, y0 = datos["left"][i], datos["top"][i]
+            caja = (x0, y0, x0 + datos["width"][i], y0 + datos["height"][i])
+            if clave not in por_linea:
+                por_linea[clave] = ([palabra], caja)
+                continue
+            palabras, anterior = por_linea[clave]
+            palabras.append(palabra)
+            por_linea[clave] = (palabras, (min(anterior[0], caja[0]), min(anterior[1], caja[1]),
+                                           max(anterior[2], caja[2]), max(anterior[3], caja[3])))
+        return [LineaOCR(" ".join(palabras), caja) for palabras, caja in por_linea.values()]
+
+    def _config_cli(self):
+        if self.tessdata:
+            return f'--tessdata-dir "{self.tessdata}" {self.config}'
+        return self.config
+
+    def _reconocer_cli(self, paginas):
+        """Reconoce un bloque de páginas con una sola ejecución de 'tesseract' (modo lista)."""
+        with tempfile.TemporaryDirectory(prefix="tesseract_") as carpeta:
+            rutas = []
+            for i, pagina in enumerate(paginas):
+                if isinstance(pagina, str):
+                    rutas.append(os.path.abspath(pagina))
+                    continue
+                # PNM: sin compresión, se escribe y se lee mucho más rápido que PNG
+                ruta = os.path.join(carpeta, f"{i}.pnm")
+                Image.fromarray(_a_array(pagina)).save(ruta, format="PPM")
+                rutas.append(ruta)
+            lista = os.path.join(carpeta, "paginas.txt")
+            with open(lista, "w", encoding="utf-8") as archivo:
+                archivo.write("\n".join(rutas) + "\n")
+
+            comando = [pytesseract.pytesseract.tesseract_cmd, lista, "stdout", "-l", self.idioma]
+            if self.tessdata:
+                comando += ["--tessdata-dir", self.tessdata]
+            comando += shlex.split(self.config)
+            resultado = subprocess.run(comando, capture_output=True)
+        if resultado.returncode != 0:
+            raise pytesseract.TesseractError(resultado.returncode, resultado.stderr.decode("utf-8", "replace"))
+
+        # Tesseract termina cada página con un salto de página (page_separator), así que
+        # tras el último queda un trozo vacío que no es una página
+        textos = resultado.stdout.decode("utf-8").split("\f")
+        if textos and textos[-1] == "":
+            textos.pop()
+        if len(textos) != len(paginas):
+            # Una página que Tesseract no pudo leer se omite sin error y desplazaría el
+            # texto de las siguientes: se repite el bloque página a página
+            if len(paginas) > 1:
+                return [texto for pagina in paginas for texto in self._reconocer_cli([pagina])]
+            raise RuntimeError(f"Tesseract no devolvió texto para la página: "
+                               f"{resultado.stderr.decode('utf-8', 'replace').strip()}")
+        return textos
+
+    def _reconocer_bloque(self, paginas):
+        inicio = time.perf_counter()
+        with medir("ocr", motor=self.motor):
+            if self.motor == "tesserocr":
+                textos = self._reconocer_api(paginas)
+            else:
+                textos = self._reconocer_cli(paginas)
+        with self._lock:
+            self.paginas += len(paginas)
+            self.segundos += time.perf_counter() - inicio
+        return textos
+
+    def reconocer(self, pagina):
+        """Reconoce una sola página (array, imagen PIL, bytes o ruta) y retorna su texto."""
+        return self._pool.submit(self._reconocer_bloque, [pagina]).result()[0]
+
+    def reconocer_lineas(self, pagina):
+        """
+        Reconoce una página y retorna sus líneas con la caja de cada una (lista de
+        LineaOCR, en orden de lectura). Es más lento que reconocer(); se usa para
+        localizar dónde están los campos (ver plantillas_roi.py).
+        """
+        def tarea():
+            inicio = time.perf_counter()
+            with medir("ocr_lineas", motor=self.motor):
+                lineas = self._lineas_api(pagina) if self.motor == "tesserocr" else self._lineas_cli(pagina)
+            with self._lock:
+                self.paginas += 1
+                self.segundos += time.perf_counter() - inicio
+            return lineas
+        return self._pool.submit(tarea).result()
+
+    def reconocer_todas(self, paginas):
+        """
+        Reconoce un flujo de páginas (cualquier iterable, incluso un generador).
+
+        Retorna:
+        - Generador con el texto de cada página, en el mismo orden. Como mucho hay
+          2 bloques por worker en curso, así que el flujo no se carga entero en memoria.
+        """
+        # Con la API C cada página es un bloque; con el ejecutable se agrupan para
+        # cargar el modelo una vez por bloque
+        tam_bloque = 1 if self.motor == "tesserocr" else self.paginas_por_lote
+        en_curso = deque()
+        bloque = []
+        for pagina in paginas:
+            bloque.append(pagina)
+            if len(bloque) < tam_bloque:
+                continue
+            en_curso.append(self._pool.submit(self._reconocer_bloque, bloque))
+            bloque = []
+            while len(en_curso) >= 2 * self.workers:
+                yield from en_curso.popleft().result()
+        if bloque:
+            en_curso.append(self._pool.submit(self._reconocer_bloque, bloque))
+        while en_curso:
+            yield from en_curso.popleft().result()
+
+    def estadisticas(self):
+        """Retorna el motor, el idioma, las páginas reconocidas y el tiempo medio por página."""
+        with self._lock:
+            return {
+                "motor": self.motor,
+                "idioma": self.idioma,
+                "paginas": self.paginas,
+                "segundos_por_pagina": self.segundos / self.paginas if self.paginas else 0.0,
+            }
+
+    def cerrar(self):
+        self._pool.shutdown()
+        with self._lock:
+            for api in self._motores:
+                api.End()
+            self._motores = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
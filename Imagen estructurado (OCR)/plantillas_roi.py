@@ -0,0 +1,288 @@
+"""
+OCR por regiones de interés (ROI) con plantillas de diseño por proveedor.
+
+Las facturas recurrentes de un mismo emisor (por ejemplo, las de Edesur) tienen los
+campos siempre en el mismo sitio. En lugar de reconocer la página entera ampliada x2:
+
+1. Se calcula la firma del diseño de la página con una pasada rápida de OpenCV a baja
+   resolución (bloques de texto por contornos, reducidos a una rejilla de bits)
+2. Si no hay una plantilla con una firma parecida, se reconoce la página completa con
+   las cajas de cada línea y se guarda en la plantilla la caja de cada campo encontrado
+   por los patrones regex (posición relativa al tamaño de la página)
+3. En los documentos siguientes con el mismo diseño solo se preprocesan y reconocen
+   esos recortes, a resolución completa
+4. Si con los recortes falta algún campo de la plantilla (el diseño cambió), se vuelve
+   a la página completa y la plantilla se aprende de nuevo
+
+Las plantillas se guardan en un archivo JSON para reutilizarlas entre ejecuciones.
+"""
+import json
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+
+import cv2  # OpenCV para la detección rápida de bloques de texto
+import numpy as np  # Numpy para manejo numérico
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.patrones_factura import patterns, escaner_patrones, FLAGS_PATRONES
+from preprocesado import cargar_imagen
+
+# Tamaño de la pasada de detección y de la rejilla de la firma
+ANCHO_DETECCION = 256
+LADO_REJILLA = 16
+
+# Píxeles de borde blanco que se añaden a cada recorte ya preprocesado
+BORDE_RECORTE = 16
+
+# Resultado de reconocer un documento:
+# - texto: texto reconocido (de los recortes o de la página completa)
+# - plantilla: identificador de la plantilla usada o aprendida (None si no se encontró ningún campo)
+# - origen: "plantilla" (solo recortes) o "pagina" (página completa)
+ResultadoROI = namedtuple('ResultadoROI', ['texto', 'plantilla', 'origen'])
+
+
+def _a_gris(img):
+    if img.ndim == 2:
+        return img
+    codigo = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(img, codigo)
+
+
+def firma_layout(imagen):
+    """
+    Calcula la firma del diseño de una página: qué celdas de una rejilla de
+    LADO_REJILLA x LADO_REJILLA contienen bloques de texto. Trabaja sobre una copia
+    de ANCHO_DETECCION píxeles de ancho, así que tarda unos milisegundos.
+
+    Retorna:
+    - (bits, proporcion): array de booleanos aplanado y alto/ancho de la página
+    """
+    gris = _a_gris(cargar_imagen(imagen))
+    alto, ancho = gris.shape
+    pequena = cv2.resize(gris, (ANCHO_DETECCION, max(1, round(ANCHO_DETECCION * alto / ancho))),
+                         interpolation=cv2.INTER_AREA)
+    # Tinta en blanco sobre negro; la dilatación horizontal une las letras en bloques
+    _, tinta = cv2.threshold(pequena, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    bloques = np.zeros_like(tinta)
+    contornos, _ = cv2.findContours(
+        cv2.dilate(tinta, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 3))),
+        cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    for contorno in contornos:
+        x, y, w, h = cv2.boundingRect(contorno)
+        # Descarta bordes y líneas de tablas: muy anchos y muy finos, o casi toda la página
+        if h < 2 or w > 0.95 * bloques.shape[1]:
+            continue
+        cv2.rectangle(bloques, (x, y), (x + w - 1, y + h - 1), 255, thickness=-1)
+    rejilla = cv2.resize(bloques, (LADO_REJILLA, LADO_REJILLA), interpolation=cv2.INTER_AREA)
+    return (rejilla > 64).ravel(), alto / ancho
+
+
+def distancia_firmas(bits_a, bits_b):
+    """Fracción de celdas distintas entre dos firmas (0 = idénticas)."""
+    return float(np.count_nonzero(bits_a != bits_b)) / bits_a.size
+
+
+def _unir_cajas(cajas):
+    return (min(c[0] for c in cajas), min(c[1] for c in cajas),
+            max(c[2] for c in cajas), max(c[3] for c in cajas))
+
+
+def _solapan(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def cajas_de_campos(lineas, ancho, alto, margen=0.02):
+    """
+    Localiza cada campo de los patrones en las líneas reconocidas.
+
+    Parámetros:
+    - lineas: lista de LineaOCR (texto y caja en píxeles)
+    - ancho, alto: tamaño de la imagen reconocida
+    - margen: holgura alrededor de cada caja, en fracción de la página
+
+    Retorna:
+    - (texto, cajas): el texto de la página (líneas unidas por saltos de línea) y un
+      diccionario campo -> [x0, y0, x1, y1] en fracciones de la página
+    """
+    texto = "\n".join(linea.texto for linea in lineas)
+    # Posición de inicio de cada línea dentro del texto
+    inicios = []
+    posicion = 0
+    for linea in lineas:
+        inicios.append(posicion)
+        posicion += len(linea.texto) + 1
+
+    cajas = {}
+    for campo, (valor, indice) in escaner_patrones.buscar_todos(texto).items():
+        if valor is None:
+            continue
+        match = re.search(patterns[campo][indice], texto, FLAGS_PATRONES)
+        # Líneas que abarca la coincidencia (etiqueta y valor)
+        abarcadas = [
+            linea.caja for linea, inicio in zip(lineas, inicios)
+            if inicio < match.end() and match.start() < inicio + len(linea.texto) + 1
+        ]
+        x0, y0, x1, y1 = _unir_cajas(abarcadas)
+        cajas[campo] = [max(0.0, x0 / ancho - margen), max(0.0, y0 / alto - margen),
+                        min(1.0, x1 / ancho + margen), min(1.0, y1 / alto + margen)]
+    return texto, cajas
+
+
+def regiones_de_plantilla(cajas):
+    """
+    Agrupa las cajas de los campos en regiones a reconocer: las cajas que se solapan
+    (varios campos en la misma línea o en líneas contiguas) se reconocen una sola vez.
+    Retorna las regiones en orden de lectura (de arriba abajo y de izquierda a derecha).
+    """
+    regiones = []
+    for caja in sorted(cajas.values(), key=lambda c: (c[1], c[0])):
+        caja = tuple(caja)
+        solapadas = [r for r in regiones if _solapan(r, caja)]
+        for region in solapadas:
+            regiones.remove(region)
+        regiones.append(_unir_cajas(solapadas + [caja]))
+    return sorted(regiones, key=lambda r: (r[1], r[0]))
+
+
+class OCRPorPlantillas:
+    """
+    OCR que aprende la posición de los campos por diseño de factura y, en los
+    documentos siguientes del mismo diseño, solo reconoce esas regiones.
+
+    Uso:
+        with PoolTesseract(config="--oem 3 --psm 6") as ocr:
+            roi = OCRPorPlantillas(ocr, PipelinePreprocesado(escala=2), "plantillas_roi.json")
+            resultado = roi.reconocer("factura.png")   # ResultadoROI(texto, plantilla, origen)
+            print(roi.estadisticas())
+    """
+
+    def __init__(self, ocr, preprocesado, ruta_plantillas="plantillas_roi.json",
+                 max_distancia=0.12, max_diferencia_proporcion=0.05, margen=0.02):
+        """
+        Parámetros:
+        - ocr: PoolTesseract (o cualquier objeto con reconocer_lineas y reconocer_todas)
+        - preprocesado: PipelinePreprocesado que se aplica a la página o a los recortes
+        - ruta_plantillas: archivo JSON de plantillas (None = solo en memoria)
+        - max_distancia: fracción máxima de celdas distintas para considerar que dos
+          páginas tienen el mismo diseño
+        - max_diferencia_proporcion: diferencia máxima de proporción alto/ancho
+        - margen: holgura alrededor de cada caja, en fracción de la página
+        """
+        self.ocr = ocr
+        self.preprocesado = preprocesado
+        self.ruta_plantillas = ruta_plantillas
+        self.max_distancia = max_distancia
+        self.max_diferencia_proporcion = max_diferencia_proporcion
+        self.margen = margen
+        self._lock = threading.Lock()
+        self.plantillas = []
+        if ruta_plantillas and os.path.exists(ruta_plantillas):
+            with open(ruta_plantillas, encoding="utf-8") as archivo:
+                self.plantillas = json.load(archivo)["plantillas"]
+        self.documentos = 0
+        self.con_plantilla = 0
+        self.aprendidas = 0
+        self.plantillas_fallidas = 0
+
+    def buscar_plantilla(self, bits, proporcion):
+        """Retorna la plantilla con la firma más parecida dentro de los límites, o None."""
+        mejor, mejor_distancia = None, None
+        with self._lock:
+            for plantilla in self.plantillas:
+                if abs(plantilla["proporcion"] - proporcion) > self.max_diferencia_proporcion:
+                    continue
+                distancia = distancia_firmas(np.array(plantilla["firma"], dtype=bool), bits)
+                if distancia <= self.max_distancia and (mejor is None or distancia < mejor_distancia):
+                    mejor, mejor_distancia = plantilla, distancia
+        return mejor
+
+    def _guardar(self):
+        """Escribe las plantillas en disco (archivo temporal + reemplazo atómico)."""
+        if not self.ruta_plantillas:
+            return
+        temporal = self.ruta_plantillas + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"plantillas": self.plantillas}, archivo, ensure_ascii=False)
+        os.replace(temporal, self.ruta_plantillas)
+
+    def _aprender(self, img, bits, proporcion, anterior=None):
+        """Reconoce la página completa con cajas por línea y guarda la plantilla."""
+        procesada = self.preprocesado.procesar(img, nombre="pagina")
+        lineas = self.ocr.reconocer_lineas(procesada)
+        alto, ancho = procesada.shape[:2]
+        texto, cajas = cajas_de_campos(lineas, ancho, alto, self.margen)
+        if not cajas:
+            return ResultadoROI(texto, None, "pagina")
+
+        with self._lock:
+            if anterior is not None and anterior in self.plantillas:
+                self.plantillas.remove(anterior)
+            plantilla = {
+                "id": max((p["id"] for p in self.plantillas), default=0) + 1,
+                "firma": bits.astype(int).tolist(),
+                "proporcion": proporcion,
+                "campos": cajas,
+            }
+            self.plantillas.append(plantilla)
+            self.aprendidas += 1
+            self._guardar()
+        return ResultadoROI(texto, plantilla["id"], "pagina")
+
+    def reconocer(self, imagen):
+        """
+        Reconoce una página (ruta, bytes o array) usando su plantilla si la hay.
+
+        Retorna:
+        - ResultadoROI(texto, plantilla, origen)
+        """
+        img = cargar_imagen(imagen)
+        bits, proporcion = firma_layout(img)
+        plantilla = self.buscar_plantilla(bits, proporcion)
+        with self._lock:
+            self.documentos += 1
+        if plantilla is None:
+            return self._aprender(img, bits, proporcion)
+
+        # Recorta las regiones de la plantilla de la imagen original, a resolución completa
+        alto, ancho = img.shape[:2]
+        recortes = []
+        for x0, y0, x1, y1 in regiones_de_plantilla(plantilla["campos"]):
+            recorte = img[int(y0 * alto):int(np.ceil(y1 * alto)), int(x0 * ancho):int(np.ceil(x1 * ancho))]
+            if recorte.size:
+                recortes.append(np.ascontiguousarray(recorte))
+        # Borde blanco alrededor de cada recorte: Tesseract reconoce peor el texto
+        # pegado al límite de la imagen
+        procesados = [
+            cv2.copyMakeBorder(procesado, BORDE_RECORTE, BORDE_RECORTE, BORDE_RECORTE, BORDE_RECORTE,
+                               cv2.BORDER_CONSTANT, value=255)
+            for procesado in self.preprocesado.procesar_lote(recortes)
+        ]
+        # Cada región termina en salto de línea, también la última: los patrones que
+        # acaban en \n o (?=\n) deben encontrar su campo igual que en la página completa
+        texto = "".join(t.strip() + "\n" for t in self.ocr.reconocer_todas(procesados))
+
+        # Si falta algún campo que la plantilla sí tenía, el diseño no es el mismo
+        encontrados = escaner_patrones.buscar_todos(texto)
+        if any(encontrados[campo][0] is None for campo in plantilla["campos"]):
+            with self._lock:
+                self.plantillas_fallidas += 1
+            return self._aprender(img, bits, proporcion, anterior=plantilla)
+
+        with self._lock:
+            self.con_plantilla += 1
+        return ResultadoROI(texto, plantilla["id"], "plantilla")
+
+    def estadisticas(self):
+        """Documentos reconocidos, cuántos solo con recortes, plantillas aprendidas y fallidas."""
+        with self._lock:
+            return {
+                "documentos": self.documentos,
+                "con_plantilla": self.con_plantilla,
+                "plantillas": len(self.plantillas),
+                "aprendidas": self.aprendidas,
+                "plantillas_fallidas": self.plantillas_fallidas,
+            }
@@ -0,0 +1,127 @@
+"""
+Procesado por lotes de facturas PDF en un pool de procesos.
+
+- La extracción (lectura del PDF y regex) es CPU pura: cada proceso del pool trata un
+  bloque de varios archivos para repartir el coste de cada envío entre procesos
+- Los resultados se entregan en cuanto terminan o en el orden de entrada
+- Un error en un archivo no detiene el lote: se entrega como resultado con error.
+  Si un proceso muere (por ejemplo, por un fallo de la librería de PDF), sus archivos
+  se repiten de uno en uno para encontrar el culpable y el resto sigue adelante
+
+Uso:
+    for resultado in procesar_lote(rutas, extract_invoice_info, workers=4):
+        if resultado.error is None:
+            guardar(resultado.ruta, resultado.datos)
+"""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Resultado de un archivo.
+# - indice: posición del archivo en la lista de entrada
+# - ruta: ruta del archivo
+# - datos: lo que retorna la función de extracción, o None si falló
+# - error: descripción del error, o None si todo fue bien
+# - segundos: duración de la extracción dentro del proceso (None si el proceso murió)
+ResultadoArchivo = namedtuple('ResultadoArchivo', ['indice', 'ruta', 'datos', 'error', 'segundos'],
+                              defaults=[None])
+
+# Archivos que trata cada proceso por envío
+TAMANO_BLOQUE = 4
+
+
+def _procesar_archivo(funcion, indice, ruta):
+    """Aplica la función a un archivo; cualquier excepción queda en el resultado."""
+    inicio = time.perf_counter()
+    try:
+        datos = funcion(ruta)
+    except Exception as e:
+        return ResultadoArchivo(indice, ruta, None, f"{type(e).__name__}: {e}", time.perf_counter() - inicio)
+    return ResultadoArchivo(indice, ruta, datos, None, time.perf_counter() - inicio)
+
+
+def _procesar_bloque(funcion, bloque):
+    """Tarea que ejecuta cada proceso del pool: un bloque de (indice, ruta)."""
+    return [_procesar_archivo(funcion, indice, ruta) for indice, ruta in bloque]
+
+
+def _ejecutar(funcion, bloques, workers, max_en_vuelo):
+    """
+    Envía los bloques al pool y entrega los resultados según terminan.
+
+    Retorna (al agotar el generador):
+    - Bloques cuyo proceso murió y bloques que no se llegaron a enviar
+    """
+    bloques = list(bloques)
+    rotos = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        en_vuelo = {}
+        while bloques or en_vuelo:
+            # Mantiene como máximo max_en_vuelo bloques enviados y sin recoger
+            while bloques and len(en_vuelo) < max_en_vuelo and not rotos:
+                bloque = bloques.pop(0)
+                try:
+                    en_vuelo[pool.submit(_procesar_bloque, funcion, bloque)] = bloque
+                except BrokenProcessPool:
+                    rotos.append(bloque)
+            if not en_vuelo:
+                break
+
+            terminados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for future in terminados:
+                bloque = en_vuelo.pop(future)
+                try:
+                    yield from future.result()
+                except BrokenProcessPool:
+                    rotos.append(bloque)
+    return rotos, bloques
+
+
+def _resultados_sin_orden(rutas, funcion, workers, tamano_bloque):
+    tareas = list(enumerate(rutas))
+    bloques = [tareas[i:i + tamano_bloque] for i in range(0, len(tareas), tamano_bloque)]
+    sospechosos = []
+    while bloques or sospechosos:
+        if sospechosos:
+            # Un proceso murió: sus archivos se repiten de uno en uno, sin nada más en
+            # vuelo, para saber cuál lo provoca
+            individuales = [[tarea] for bloque in sospechosos for tarea in bloque]
+            rotos, sospechosos = yield from _ejecutar(funcion, individuales, 1, 1)
+            for bloque in rotos:
+                for indice, ruta in bloque:
+                    yield ResultadoArchivo(indice, ruta, None, "El proceso terminó inesperadamente")
+        else:
+            sospechosos, bloques = yield from _ejecutar(funcion, bloques, workers, workers * 2)
+
+
+def procesar_lote(rutas, funcion, workers=None, tamano_bloque=TAMANO_BLOQUE, ordenado=False):
+    """
+    Aplica funcion(ruta) a cada archivo en un pool de procesos.
+
+    Parámetros:
+    - rutas: lista de rutas de archivos
+    - funcion: función de extracción; debe poder enviarse a otro proceso (definida a
+      nivel de módulo, o functools.partial de una de ellas)
+    - workers: número de procesos (None = uno por núcleo)
+    - tamano_bloque: archivos por envío al pool
+    - ordenado: si es True se entregan en el orden de rutas; si no, según terminan
+
+    Retorna (generador):
+    - ResultadoArchivo por cada ruta
+    """
+    workers = workers or os.cpu_count() or 1
+    resultados = _resultados_sin_orden(list(rutas), funcion, workers, max(1, tamano_bloque))
+    if not ordenado:
+        yield from resultados
+        return
+
+    # Guarda los que llegan adelantados hasta que sale el siguiente en orden
+    adelantados = {}
+    siguiente = 0
+    for resultado in resultados:
+        adelantados[resultado.indice] = resultado
+        while siguiente in adelantados:
+            yield adelantados.pop(siguiente)
+            siguiente += 1
@@ -1,8 +1,24 @@
-import PyPDF2  # Para leer pdf
 import re  # Para implementar expresiones regulares
+from decimal import Decimal, ROUND_HALF_UP  # Importes exactos, sin errores de float
 import os  # Para listar y mover archivos locales
+import sys  # Para poder importar los módulos compartidos de 'comun'
+import csv  # Para guardar los resultados en CSV
+import functools  # Para fijar argumentos de la función que ejecuta cada proceso
+import time  # Para marcar el inicio del lote en el informe de facturas lentas
 
-def extract_invoice_info(pdf_file_path):
+# Extracción de texto compartida (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.texto_pdf import leer_texto
+from comun.manifiesto import Manifiesto, clave_documento
+from comun.metricas import configurar, evento, traza, VERBOSE, ETAPA_SEGUNDOS, ERRORES
+from comun.perfilado import perfilar, imprimir_informe
+from comun.lineas_factura import leer_items
+from lote import procesar_lote, TAMANO_BLOQUE
+
+# Backend de extracción de texto: pymupdf, pypdf2 o vacío (el primero instalado)
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND") or None
+
+def extract_invoice_info(pdf_file_path, mostrar_texto=None):
     """
     FUNCIÓN PRINCIPAL: Extrae datos clave de una factura PDF usando expresiones regulares.
     
@@ -15,106 +31,113 @@ def extract_invoice_info(pdf_file_path):
     
     Parámetros:
     - pdf_file_path: Ruta del archivo PDF a procesar
+    - mostrar_texto: si es True, imprime el texto extraído (depuración); por defecto,
+      solo con VERBOSE=true
     
     Retorna:
     - Tupla con: número de factura, cliente, subtotal, total, descuento, impuesto, notas y términos
     """
     
-    # Abre el archivo PDF en modo lectura binaria
-    #rb= r:read; b: binary, Indica a Python que lea en crudo, sin convertirlo a strings.
-    with open(pdf_file_path, 'rb') as file:
-        # MÉTODO: Crear un lector PDF usando PyPDF2.PdfReader
-        # El objeto PdfReader permite acceder a las páginas y contenido del PDF
-        pdf_reader = PyPDF2.PdfReader(file)
-        
-        # Variable para acumular todo el texto del PDF
-        text = ''
-
-        # Recorre todas las páginas del PDF
-        for page_num in range(len(pdf_reader.page)):
-            # MÉTODO: Accede a cada página individualmente
-            page = pdf_reader.pages[page_num]
-            # MÉTODO: Extrae el texto de la página actual
-            text += page.extract_text()
-        
+    # MÉTODO leer_texto(): Extrae el texto página a página (PyMuPDF, o PyPDF2 si no
+    # está instalado) y lo une al final con un join, en vez de concatenar con += página a página.
+    # No se usa la parada temprana: hacen falta todas las líneas de ítems para el subtotal
+    # Con PROFILE_SLOW_DOCS=true se guarda el perfil de las facturas lentas (ej: extractos
+    # de cientos de páginas, o texto que hace retroceder mucho a las expresiones regulares).
+    # En el pool, cada proceso escribe los suyos en PROFILE_DIR
+    with perfilar("extraccion_regex", pdf_file_path):
+        text = leer_texto(pdf_file_path, backend=PDF_TEXT_BACKEND)
+
         # Imprime el texto extraído para depuración
-        print(text)
-
-        # PATRONES DE EXPRESIONES REGULARES:
-        # Cada patrón busca información específica en el texto del PDF
-        
-        # Busca el número de factura después de "INVOICE #"
-        invoice_number_pattern = r'INVOICE\s*#\s*(\d+)'
-        
-        # Busca la información del cliente después de "Bill To:"
-        bill_to_pattern = r'Bill\s*To\s*:\s*(.*)'
-        
-        # Busca los ítems de la factura: descripción, cantidad, precio unitario, total
-        items_pattern = r'(.*?)\s*(\d+)\s*(\d+)\s*(€\d+\.\d{2})'
-        
-        # Busca las notas y términos de la factura
-        notes_terms_pattern = r'Notes\s*:\s*(.*?)\s*Terms\s*:\s*(.*)'
-        
-        # Busca los porcentajes de descuento e impuesto
-        discount_tax_pattern = r'Discount\s*\((\d+)%\)\s*\|\s*Tax\s*\((\d+)%\)'
-
-        # APLICACIÓN DE EXPRESIONES REGULARES:
-
-        # MÉTODO re.search(): Busca la primera coincidencia del patrón en el texto
-        invoice_number_match = re.search(invoice_number_pattern, text)
-        bill_to_match = re.search(bill_to_pattern, text)
-        notes_terms_match = re.search(notes_terms_pattern, text)
-        match = re.search(discount_tax_pattern, text)
-        
-        # MÉTODO re.findall(): Busca TODAS las coincidencias del patrón en el texto
-        items_matches = re.findall(items_pattern, text)
-
-        # NORMALIZACIÓN DE DATOS:
-        # Convierte las coincidencias en valores utilizables
-        
-        # MÉTODO group(): Extrae grupos capturados por los paréntesis en la regex
-        # group(1) obtiene el primer grupo, group(2) el segundo, etc.
-        invoice_number = invoice_number_match.group(1) if invoice_number_match else None
-        bill_to = bill_to_match.group(1) if bill_to_match else None
-        
-        # Para notas y términos, se extraen ambos grupos
-        if notes_terms_match:
-            notes, terms = notes_terms_match.groups()  # MÉTODO groups(): retorna todos los grupos
-        else:
-            notes, terms = (None, None)
-        
-        # Extrae porcentajes de descuento e impuesto
-        discount_percentage = match.group(1) if match else None
-        tax_percentage = match.group(2) if match else None
-
-        # Variables para cálculos
-        i = 0
-        subtotal = 0
-        total = 0
-
-        # CÁLCULO DEL SUBTOTAL:
-        # Suma los montos de todos los ítems (excluyendo el último si es el total)
-        for item in items_matches:
-            if len(items_matches) - 1 != i:
-                # item[3] contiene el precio total del ítem (ej: "€100.00")
-                # Se elimina el símbolo de euro y se convierte a float
-                subtotal = subtotal + float(item[3].replace('€', ''))
-            i = i + 1
-
-        # CÁLCULOS FINANCIEROS:
-        # Aplica descuento y luego impuesto al subtotal
-        if discount_percentage:
-            total_discount = subtotal - (subtotal * int(discount_percentage) / 100)
-        else:
-            total_discount = subtotal
-        
-        if tax_percentage:
-            total = total_discount + (total_discount * int(tax_percentage) / 100)
-        else:
-            total = total_discount
+        if mostrar_texto is None:
+            mostrar_texto = VERBOSE
+        if mostrar_texto:
+            print(text)
+
+        return extract_invoice_info_from_text(text)
 
-        # Retorna todos los datos extraídos y calculados
-        return invoice_number, bill_to, subtotal, total, discount_percentage, tax_percentage, notes, terms
+def extract_invoice_info_from_text(text):
+    """
+    FUNCIÓN: Busca los datos de la factura en un texto ya extraído (por ejemplo, solo
+    de algunas páginas del PDF) y calcula los importes.
+
+    Parámetros:
+    - text: texto de la factura
+
+    Retorna:
+    - La misma tupla que extract_invoice_info (subtotal y total como Decimal)
+    """
+
+    # PATRONES DE EXPRESIONES REGULARES:
+    # Cada patrón busca información específica en el texto del PDF
+    
+    # Busca el número de factura después de "INVOICE #"
+    invoice_number_pattern = r'INVOICE\s*#\s*(\d+)'
+    
+    # Busca la información del cliente después de "Bill To:"
+    bill_to_pattern = r'Bill\s*To\s*:\s*(.*)'
+    
+    # Busca las notas y términos de la factura
+    notes_terms_pattern = r'Notes\s*:\s*(.*?)\s*Terms\s*:\s*(.*)'
+    
+    # Busca los porcentajes de descuento e impuesto
+    discount_tax_pattern = r'Discount\s*\((\d+)%\)\s*\|\s*Tax\s*\((\d+)%\)'
+
+    # APLICACIÓN DE EXPRESIONES REGULARES:
+
+    # MÉTODO re.search(): Busca la primera coincidencia del patrón en el texto
+    invoice_number_match = re.search(invoice_number_pattern, text)
+    bill_to_match = re.search(bill_to_pattern, text)
+    notes_terms_match = re.search(notes_terms_pattern, text)
+    match = re.search(discount_tax_pattern, text)
+    
+    # Los ítems (descripción, cantidad, precio unitario, importe) se leen línea a línea
+    # con comun/lineas_factura.py, en tiempo lineal: la antigua expresión regular
+    # (.*?)\s*(\d+)\s*(\d+)\s*(€\d+\.\d{2}) retrocedía mucho en páginas con muchos números.
+    # Monedas, formato de los números y tiempo máximo: ITEMS_CURRENCIES, ITEMS_LOCALE,
+    # ITEMS_MAX_SECONDS
+    tabla_items = leer_items(text)
+
+    # NORMALIZACIÓN DE DATOS:
+    # Convierte las coincidencias en valores utilizables
+    
+    # MÉTODO group(): Extrae grupos capturados por los paréntesis en la regex
+    # group(1) obtiene el primer grupo, group(2) el segundo, etc.
+    invoice_number = invoice_number_match.group(1) if invoice_number_match else None
+    bill_to = bill_to_match.group(1) if bill_to_match else None
+    
+    # Para notas y términos, se extraen ambos grupos
+    if notes_terms_match:
+        notes, terms = notes_terms_match.groups()  # MÉTODO groups(): retorna todos los grupos
+    else:
+        notes, terms = (None, None)
+    
+    # Extrae porcentajes de descuento e impuesto
+    discount_percentage = match.group(1) if match else None
+    tax_percentage = match.group(2) if match else None
+
+    # CÁLCULO DEL SUBTOTAL:
+    # Suma los importes de todos los ítems, como Decimal. Las líneas de totales
+    # ("Total 1 1 €90.00") ya vienen aparte en tabla_items.totales: no se supone
+    # que la última línea sea el total
+    subtotal = sum((item.importe for item in tabla_items.items), Decimal("0.00"))
+
+    # CÁLCULOS FINANCIEROS:
+    # Aplica descuento y luego impuesto al subtotal, redondeando a céntimos
+    centimos = Decimal("0.01")
+    if discount_percentage:
+        total_discount = subtotal - (subtotal * int(discount_percentage) / 100)
+    else:
+        total_discount = subtotal
+    total_discount = total_discount.quantize(centimos, rounding=ROUND_HALF_UP)
+
+    if tax_percentage:
+        total = total_discount + (total_discount * int(tax_percentage) / 100)
+    else:
+        total = total_discount
+    total = total.quantize(centimos, rounding=ROUND_HALF_UP)
+
+    # Retorna todos los datos extraídos y calculados
+    return invoice_number, bill_to, subtotal, total, discount_percentage, tax_percentage, notes, terms
 
 def get_files_in_folder(folder_path):
     """
@@ -136,50 +159,135 @@ def get_files_in_folder(folder_path):
             files.append(os.path.join(root, filename))
     return files
 
+def registrar_resultado(file_name, fila):
+    """
+    FUNCIÓN: Añade una fila al CSV de resultados y la fuerza a disco antes de retornar,
+    para poder mover el PDF sabiendo que su resultado ya está guardado.
+
+    Parámetros:
+    - file_name: nombre del archivo CSV
+    - fila: diccionario columna -> valor (la primera fila escrita define las columnas)
+    """
+    file_exists = os.path.isfile(file_name)
+    with open(file_name, "a", newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=list(fila))
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow(fila)
+        # MÉTODO os.fsync(): Vacía los buffers del sistema operativo al disco
+        file.flush()
+        os.fsync(file.fileno())
+
+def mover_archivo(file, carpeta):
+    """
+    FUNCIÓN: Mueve un archivo a otra carpeta (la crea si no existe).
+    """
+    # MÉTODO os.makedirs(): Crea directorios si no existen
+    # exist_ok=True evita error si la carpeta ya existe
+    os.makedirs(carpeta, exist_ok=True)
+    # MÉTODO os.replace(): Mueve el archivo (sobrescribe si ya existía uno con el mismo nombre)
+    os.replace(file, os.path.join(carpeta, os.path.basename(file)))
+
 if __name__ == "__main__":
     """
     BLOQUE PRINCIPAL DEL PROGRAMA:
-    - Procesa todos los archivos PDF en la carpeta 'documents'
+    - Procesa todos los archivos PDF en la carpeta 'documents' en un pool de procesos
     - Extrae información de cada factura
-    - Mueve los archivos procesados a 'processed_documents'
+    - Guarda cada resultado en 'facturas_estructuradas.csv' (o el error en
+      'facturas_estructuradas_errores.csv') y solo entonces mueve el PDF a
+      'processed_documents' (o a 'error_documents' si falló)
+
+    Variables de entorno:
+    - BATCH_WORKERS: número de procesos (por defecto, uno por núcleo)
+    - BATCH_CHUNK_SIZE: archivos que trata cada proceso por envío (por defecto, 4)
+    - BATCH_ORDERED: true para mostrar los resultados en el orden de los archivos
+    - MANIFEST_PATH: manifiesto SQLite con los archivos ya guardados (por hash de contenido)
+    - VERBOSE: true para mostrar los datos de cada factura
+    - PROFILE_SLOW_DOCS: true para guardar el perfil de las facturas lentas y mostrar al
+      final las más lentas (ver comun/perfilado.py)
+    - METRICS_PORT / METRICS_FILE / LOG_JSON: métricas y eventos (ver comun/metricas.py)
     """
+    configurar()
+    inicio_lote = time.time()
     
     # Ruta de la carpeta con documentos a procesar
     folder_path = 'documents'
     
-    # Obtiene lista de archivos
-    files = get_files_in_folder(folder_path)
+    # Carpetas destino para archivos procesados y para los que fallaron
+    processed_folder = 'processed_documents'
+    error_folder = 'error_documents'
+
+    # Archivos CSV de resultados y de errores
+    db_facturas = 'facturas_estructuradas.csv'
+    db_errors_log = 'facturas_estructuradas_errores.csv'
+
+    workers = int(os.getenv("BATCH_WORKERS", "0")) or None
+    tamano_bloque = int(os.getenv("BATCH_CHUNK_SIZE", str(TAMANO_BLOQUE)))
+    ordenado = os.getenv("BATCH_ORDERED", "false").lower() in ("1", "true", "yes")
+
+    # Manifiesto: un archivo cuyo resultado ya se guardó (pero el programa se detuvo
+    # antes de moverlo) no se vuelve a procesar ni a escribir en el CSV
+    manifest = Manifiesto(os.getenv("MANIFEST_PATH", "manifiesto.sqlite"))
+
+    # Obtiene lista de archivos y separa los que ya están guardados
+    files = []
+    keys = {}
+    for file in get_files_in_folder(folder_path):
+        keys[file] = clave_documento(file)
+        if manifest.retomar(keys[file], "escrito"):
+            traza("Ya guardado:", file)
+            mover_archivo(file, processed_folder)
+        else:
+            files.append(file)
+
+    # En los procesos del pool no se imprime el texto de cada PDF
+    extraer = functools.partial(extract_invoice_info, mostrar_texto=False)
+
+    procesados = fallidos = 0
+    # Procesa los archivos en paralelo; cada resultado llega en cuanto está listo
+    for resultado in procesar_lote(files, extraer, workers=workers,
+                                   tamano_bloque=tamano_bloque, ordenado=ordenado):
+        file = resultado.ruta
+        traza("File:", file)
+        # La extracción se mide dentro de cada proceso del pool y se anota aquí
+        if resultado.segundos is not None:
+            ETAPA_SEGUNDOS.observar(resultado.segundos, etapa="extraccion_regex")
 
-    # Procesa cada archivo encontrado
-    for file in files:
-        print("File:", file)
+        if resultado.error is not None:
+            # Un PDF dañado no detiene el lote: se registra el error y se aparta
+            ERRORES.inc(etapa="extraccion_regex")
+            evento("extraccion_fallida", nivel="error", documento=file, error=resultado.error)
+            registrar_resultado(db_errors_log, {"File": file, "Error": resultado.error})
+            manifest.registrar_error(keys[file], resultado.error, documento=os.path.basename(file))
+            mover_archivo(file, error_folder)
+            fallidos += 1
+            continue
 
-        # Llama a la función principal para extraer información
-        invoice_number, bill_to, subtotal, total, discount, tax, notes, terms = extract_invoice_info(file)
+        invoice_number, bill_to, subtotal, total, discount, tax, notes, terms = resultado.datos
 
         # Muestra la información extraída
-        print("Invoice Number:", invoice_number)
-        print("Bill To:", bill_to)
-        print("Subtotal:", subtotal)
-        print("Tax (%):", tax)
-        print("Discount (%):", discount)
-        print("Total:", total)
-        print("Notes:", notes)
-        print("Terms:", terms)
-
-        # PROCESAMIENTO DE ARCHIVOS:
-        # Mueve el archivo procesado a una carpeta diferente
-        
-        # Carpeta destino para archivos procesados
-        processed_folder = 'processed_documents'
-        
-        # MÉTODO os.makedirs(): Crea directorios si no existen
-        # exist_ok=True evita error si la carpeta ya existe
-        os.makedirs(processed_folder, exist_ok=True)
-        
-        # Construye la nueva ruta para el archivo
-        # MÉTODO os.path.basename(): Extrae solo el nombre del archivo de una ruta completa
-        new_file_path = os.path.join(processed_folder, os.path.basename(file))
-        
-        # MÉTODO os.rename(): Mueve el archivo a la nueva ubicación
-        os.rename(file, new_file_path)
\ No newline at end of file
+        traza("Invoice Number:", invoice_number)
+        traza("Bill To:", bill_to)
+        traza("Subtotal:", subtotal)
+        traza("Tax (%):", tax)
+        traza("Discount (%):", discount)
+        traza("Total:", total)
+        traza("Notes:", notes)
+        traza("Terms:", terms)
+
+        # Guarda el resultado en disco antes de mover el PDF: si el programa se
+        # interrumpe, el archivo sigue en 'documents' y se procesa en la siguiente ejecución
+        registrar_resultado(db_facturas, {
+            "File": os.path.basename(file), "Invoice Number": invoice_number, "Bill To": bill_to,
+            "Subtotal": subtotal, "Tax (%)": tax, "Discount (%)": discount, "Total": total,
+            "Notes": notes, "Terms": terms,
+        })
+        manifest.registrar(keys[file], "escrito", documento=os.path.basename(file))
+        mover_archivo(file, processed_folder)
+        procesados += 1
+
+    print(f"Procesados: {procesados}, con error: {fallidos}")
+    manifest.cerrar()
+
+    # Facturas más lentas del lote y sus funciones más costosas
+    imprimir_informe(desde=inicio_lote)
@@ -1,118 +1,93 @@
-import PyPDF2  # Biblioteca para leer y manipular archivos PDF
 import json    # Biblioteca para trabajar con datos en formato JSON (JavaScript Object Notation)
 import os      # Biblioteca para interactuar con el sistema operativo (archivos, directorios)
-from openai import OpenAI  # Cliente para interactuar con la API de OpenAI (GPT)
+import sys     # Para poder importar los módulos compartidos de 'comun'
+import time    # Para marcar el inicio del lote en el informe de facturas lentas
 from dotenv import load_dotenv  # Para cargar variables de entorno desde archivo .env
 
+# Módulos compartidos de la carpeta 'comun' (en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.cache import CacheDisco
+from comun.texto_pdf import leer_texto
+from comun.extraccion_llm import MotorExtraccionLLM
+from comun.metricas import configurar, evento, traza
+from comun.perfilado import perfilar, imprimir_informe
+
 # Carga las variables de entorno desde el archivo .env (generalmente contiene la API key de OpenAI)
 load_dotenv()
 
-# Crea una instancia del cliente de OpenAI para hacer solicitudes a la API
-client = OpenAI()
+# Backend de extracción de texto del PDF: pymupdf, pypdf2 o vacío (el primero instalado)
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND") or None
+
+# Campos que se piden a GPT para cada factura
+CAMPOS_FACTURA = ["Date", "Invoice number", "Client", "Subtotal", "tax", "Discount", "Notes", "Terms", "Total"]
 
-def extraer_datos_factura(texto_factura):
+def leer_texto_pdf(pdf_file_path):
     """
-    FUNCIÓN: Extrae datos estructurados de una factura usando inteligencia artificial (GPT-3.5).
-    
-    Esta función:
-    1. Construye un prompt (instrucción) para GPT con el texto de la factura
-    2. Envía el prompt a la API de OpenAI
-    3. Recibe la respuesta en formato JSON
-    4. Limpia y procesa la respuesta
+    FUNCIÓN: Extrae todo el texto de un PDF (PyMuPDF, o PyPDF2 si no está instalado).
     
     Parámetros:
-    - texto_factura: Texto completo extraído de un PDF de factura
+    - pdf_file_path: Ruta completa al archivo PDF
     
     Retorna:
-    - Cadena de texto en formato JSON con los datos extraídos
+    - Texto de todas las páginas concatenado
     """
+    # Las páginas se leen una a una y se unen al final con un join
+    return leer_texto(pdf_file_path, backend=PDF_TEXT_BACKEND)
 
-    # Construye el prompt (instrucción) para GPT
-    prompt = f"""
-    Extrae los siguientes campos del texto proporcionado y devuelve los resultados en formato JSON:
-    - Date
-    - Invoice number
-    - Client
-    - Subtotal
-    - tax
-    - Discount
-    - Notes
-    - Terms
-    - Total
-
-    Texto: 
-    {texto_factura}
+def campos_factura(datos_factura_str):
     """
+    FUNCIÓN: Convierte la respuesta JSON de GPT en la tupla de campos de la factura.
     
-    # MÉTODO: Envía la solicitud a la API de OpenAI
-    # client.chat.completions.create() crea una completación (respuesta) del chat
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",  # Modelo de IA a utilizar
-        messages=[{"role": "system", "content": "Eres un experto en analisis estructurado."},
-                  {"role": "user", "content": prompt}],  # Historial del chat
-        max_tokens=300  # Máximo número de tokens (palabras/piezas) en la respuesta
-    )
-
-    # Obtener la respuesta y limpiar la cadena JSON
-    # MÉTODO: Accede al contenido del primer mensaje de respuesta
-    datos_factura_str = response.choices[0].message.content.strip()
-
-    # MÉTODO: Elimina marcas de código (```json y ```) que GPT podría añadir
-    datos_factura_str = datos_factura_str.replace('```json','').replace('```','').strip()
-    
-    return datos_factura_str  # Retorna el JSON como cadena de texto
-
-def extract_invoice_info(pdf_file_path):
+    Retorna:
+    - Tupla con 8 valores: número de factura, cliente, subtotal, total, 
+      descuento, impuesto, notas y términos
     """
-    FUNCIÓN: Extrae información de una factura PDF, despues los extructura usando IA en lugar de regex.
-    
-    Esta función:
-    1. Abre y lee el archivo PDF
-    2. Extrae todo el texto del documento
-    3. Envía el texto a GPT para extracción estructurada
-    4. Convierte la respuesta JSON a un diccionario Python
-    5. Extrae campos individuales del diccionario
+    # MÉTODO json.loads(): Convierte una cadena JSON en un diccionario Python
+    datos_factura = json.loads(datos_factura_str)
+
+    # MÉTODO .get(): Obtiene valores del diccionario de forma segura
+    # (retorna None si la clave no existe, en lugar de dar error)
+    invoice_number = datos_factura.get('Invoice number')
+    bill_to = datos_factura.get('Client')
+    subtotal = datos_factura.get('Subtotal')
+    total = datos_factura.get('Total')
+    discount = datos_factura.get('Discount')
+    tax = datos_factura.get('tax')
+    notes = datos_factura.get('Notes')
+    terms = datos_factura.get('Terms')
+
+    # Retorna todos los valores como una tupla
+    return invoice_number, bill_to, subtotal, total, discount, tax, notes, terms
+
+def extract_invoice_info_batch(pdf_file_paths, motor):
+    """
+    FUNCIÓN: Extrae información de muchas facturas PDF a la vez, estructurándola con IA
+    en lugar de regex: lee el texto de cada PDF y las llamadas a GPT se hacen de forma
+    concurrente con el motor compartido.
     
     Parámetros:
-    - pdf_file_path: Ruta completa al archivo PDF
+    - pdf_file_paths: Lista de rutas de archivos PDF
+    - motor: MotorExtraccionLLM configurado con CAMPOS_FACTURA
     
     Retorna:
-    - Tupla con 8 valores: número de factura, cliente, subtotal, total, 
-      descuento, impuesto, notas y términos
+    - Lista (en el mismo orden) con la tupla de 8 campos de cada factura, o la
+      excepción si esa factura falló
     """
-    
-    # Abre el archivo PDF en modo lectura binaria
-    with open(pdf_file_path,'rb') as file: 
-        # MÉTODO: Crea un objeto lector PDF
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ''  # Variable para acumular todo el texto
-
-        # Recorre todas las páginas del PDF
-        for page_num in range(len(pdf_reader.pages)):
-            # MÉTODO: Accede a cada página
-            page = pdf_reader.pages[page_num]
-            # MÉTODO: Extrae texto de la página y lo añade al texto total
-            text += page.extract_text()
-        
-        # Llama a la función de IA para extraer datos estructurados
-        datos_factura_str = extraer_datos_factura(text)
-        
-        # MÉTODO json.loads(): Convierte una cadena JSON en un diccionario Python
-        datos_factura = json.loads(datos_factura_str)
-
-        # MÉTODO .get(): Obtiene valores del diccionario de forma segura
-        # (retorna None si la clave no existe, en lugar de dar error)
-        invoice_number = datos_factura.get('Invoice number')
-        bill_to = datos_factura.get('Client')
-        subtotal = datos_factura.get('Subtotal')
-        total = datos_factura.get('Total')
-        discount = datos_factura.get('Discount')
-        tax = datos_factura.get('tax')
-        notes = datos_factura.get('Notes')
-        terms = datos_factura.get('Terms')
-
-        # Retorna todos los valores como una tupla
-        return invoice_number, bill_to, subtotal, total, discount, tax, notes, terms
+    textos = []
+    for ruta in pdf_file_paths:
+        # Las llamadas a GPT son concurrentes; por documento solo se perfila la lectura
+        with perfilar("texto_pdf", ruta):
+            textos.append(leer_texto_pdf(ruta))
+    resultados = []
+    for resultado in motor.extraer_todos_sync(textos):
+        if isinstance(resultado, Exception):
+            resultados.append(resultado)
+            continue
+        try:
+            resultados.append(campos_factura(resultado.datos))
+        except json.JSONDecodeError as e:
+            resultados.append(e)
+    return resultados
 
 def get_files_in_folder(folder_path):
     """
@@ -140,30 +115,54 @@ if __name__ == '__main__':
     - Extrae información usando IA
     - Muestra resultados en consola
     - Mueve archivos procesados a 'processed_documents'
+
+    Con VERBOSE=true se muestran los datos de cada factura; METRICS_PORT, METRICS_FILE
+    y LOG_JSON activan las métricas y los eventos (ver comun/metricas.py)
     """
-    
+    configurar()
+    inicio_lote = time.time()
+
     # Ruta de la carpeta con documentos a procesar
     folder_path = 'documents'
     
     # Obtiene lista de todos los archivos
     files = get_files_in_folder(folder_path)
 
+    # Motor de extracción: las llamadas a GPT de todas las facturas se hacen de forma concurrente
+    motor = MotorExtraccionLLM(
+        CAMPOS_FACTURA,
+        mensaje_sistema="Eres un experto en analisis estructurado.",
+        max_concurrencia=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        tam_lote=int(os.getenv("LLM_BATCH_SIZE", "1")),
+        # Caché de respuestas: las facturas ya extraídas no vuelven a llamar a GPT
+        cache=CacheDisco(
+            os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            ttl=float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+        ),
+    )
+    resultados = extract_invoice_info_batch(files, motor)
+
     # Procesa cada archivo uno por uno
-    for file in files: 
-        print('File:', file)  # Muestra qué archivo se está procesando
+    for file, resultado in zip(files, resultados): 
+        traza('File:', file)  # Muestra qué archivo se está procesando
+
+        if isinstance(resultado, Exception):
+            # La factura falló: se deja en 'documents' para reintentarla
+            evento("extraccion_fallida", nivel="error", documento=file, error=str(resultado))
+            continue
         
-        # Llama a la función principal para extraer información
-        invoice_number, bill_to, subtotal, total, discount, tax, notes, terms = extract_invoice_info(file)
+        invoice_number, bill_to, subtotal, total, discount, tax, notes, terms = resultado
 
         # Muestra la información extraída
-        print("Invoice Number:", invoice_number)
-        print("Bill To:", bill_to)
-        print("Subtotal:", subtotal)
-        print("Total:", total)
-        print("Discount:", discount)
-        print("Tax:", tax)
-        print("Notes:", notes)
-        print("Terms:", terms)
+        traza("Invoice Number:", invoice_number)
+        traza("Bill To:", bill_to)
+        traza("Subtotal:", subtotal)
+        traza("Total:", total)
+        traza("Discount:", discount)
+        traza("Tax:", tax)
+        traza("Notes:", notes)
+        traza("Terms:", terms)
 
         # PROCESAMIENTO POST-EXTRACCIÓN:
         # Mueve el archivo ya procesado a otra carpeta
@@ -182,4 +181,10 @@ if __name__ == '__main__':
         os.rename(file, new_file_path)
         
         # Confirma que el archivo fue movido
-        print(f"Archivo movido a: {new_file_path}\n")
\ No newline at end of file
+        traza(f"Archivo movido a: {new_file_path}\n")
+
+    # Resumen de tokens y latencia de las llamadas a GPT
+    print("Extracción GPT:", motor.estadisticas())
+
+    # Facturas más lentas del lote y sus funciones más costosas (PROFILE_SLOW_DOCS=true)
+    imprimir_informe(desde=inicio_lote)
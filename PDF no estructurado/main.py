@@ -1,83 +1,96 @@
-from docling.document_converter import DocumentConverter
+import os  # Para leer la configuración de variables de entorno
+import sys  # Para los argumentos de línea de comandos y los módulos de 'comun'
+
+# Servicio Docling compartido (carpeta 'comun' en la raíz del repositorio)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.conversor_docling import ConversorDocling
+from comun.indice_etiquetas import IndiceEtiquetas
 
 # ==========================================
 # 1. CONFIGURACIÓN Y CONVERSIÓN
 # ==========================================
 
-# Definimos la fuente del documento (puede ser una ruta local o una URL)
-source = "sample-invoice2.pdf" 
-
-# Inicializamos el convertidor de documentos de Docling
-converter = DocumentConverter()
-
-# Ejecutamos la conversión: esto analiza el PDF y extrae su estructura
-result = converter.convert(source)
+# Definimos las fuentes de los documentos (rutas locales o URLs) como argumentos;
+# sin argumentos se usa la factura de ejemplo
+sources = sys.argv[1:] or ["sample-invoice2.pdf"]
 
-# Exportamos el resultado a un diccionario de Python, que puede contener listas.
-# ejemplo:
-#      (1) Diccionario    (2) Lista     (3) Diccionario
-#            |                |               |
-# valor = data["texts"]        [0]           ["text"]
-data = result.document.export_to_dict()
+# Etapas del pipeline que se pueden desactivar para ir más rápido:
+# - DOCLING_OCR=false en PDFs digitales (el texto ya viene en el PDF)
+# - DOCLING_TABLES=false si no se usa la estructura de las tablas
+# DOCLING_TIMEOUT: segundos máximos por documento; DOCLING_CONCURRENCY: documentos a la vez
+def _activado(nombre, por_defecto="true"):
+    return os.getenv(nombre, por_defecto).lower() in ("1", "true", "yes")
 
 # ==========================================
 # 2. LÓGICA DE EXTRACCIÓN
 # ==========================================
 
-def extract_value(texts, key):
-    """
-    Busca una etiqueta (key) en una lista de textos y devuelve el valor que le sigue.
-    
-    Args:
-        texts (list): Lista de diccionarios donde cada uno tiene una clave "text".
-        key (str): La etiqueta que estamos buscando (ej: "Invoice Number").
-        
-    Returns:
-        str o None: El texto del siguiente elemento si encuentra la clave, o None.
-    """
-    # 'enumerate' nos da el índice (i) y el objeto (item) al mismo tiempo
-    for i, item in enumerate(texts):
-        
-        # Lógica principal:
-        # 1. ¿El texto actual coincide con lo que busco (ej: "Invoice Number")?
-        # 2. ¿Existe un elemento siguiente? (i + 1 < len) para evitar errores de índice.
-        if item["text"] == key and i + 1 < len(texts):
-            
-            # Si ambas son verdad, devolvemos el texto del SIGUIENTE elemento.
-            # Asume que el PDF lee: [Etiqueta] [Valor]
-            return texts[i + 1]["text"]
-            
-    return None
+# Etiquetas que se buscan en cada factura. Se resuelven todas con un índice construido
+# en una sola pasada por data["texts"] (comun/indice_etiquetas.py), en vez de recorrer
+# la lista entera una vez por etiqueta. La búsqueda no distingue mayúsculas ni los dos
+# puntos finales, tolera pequeñas diferencias ("Invoice Numbr") y elige como valor el
+# texto más cercano a la derecha o debajo de la etiqueta según su posición en la página
+LABELS = ["Invoice Number", "Order Number", "Invoice Date", "Due Date", "Total Due", "From:", "To:"]
 
 # ==========================================
 # 3. EXTRACCIÓN DE DATOS ESPECÍFICOS
 # ==========================================
 
-# Aquí asumimos que 'data["texts"]' contiene la lista secuencial de todo el texto del PDF.
-# Llamamos a nuestra función para cada campo que nos interesa recuperar.
-
-invoice_number = extract_value(data["texts"], "Invoice Number")
-order_number   = extract_value(data["texts"], "Order Number")
-invoice_date   = extract_value(data["texts"], "Invoice Date")
-due_date       = extract_value(data["texts"], "Due Date")
-total_due      = extract_value(data["texts"], "Total Due")
-
-# Nota: En el código original 'from' es una palabra reservada en Python, 
-# así que usamos 'from_how' o similar para evitar errores de sintaxis.
-from_how       = extract_value(data["texts"], "From:")
-to             = extract_value(data["texts"], "To:")
-
-# ==========================================
-# 4. MOSTRAR RESULTADOS
-# ==========================================
-
-print("Invoice Number:", invoice_number)
-print("Order Number:", order_number)
-print("Invoice Date:", invoice_date)
-print("Due Date:", due_date)
-print("Total Due:", total_due)
-print("From:", from_how)
-print("To:", to)
+# Inicializamos el convertidor de documentos de Docling una sola vez: los modelos de
+# layout, tablas y OCR se cargan aquí y se reutilizan para todos los documentos
+converter = ConversorDocling(
+    ocr=_activado("DOCLING_OCR"),
+    tablas=_activado("DOCLING_TABLES"),
+    timeout_documento=float(os.getenv("DOCLING_TIMEOUT", "0")) or None,
+    concurrencia=int(os.getenv("DOCLING_CONCURRENCY", "1")),
+)
+
+# Ejecutamos la conversión de todos los documentos: esto analiza cada PDF y extrae su
+# estructura. Un documento que falla no detiene el resto
+for result in converter.convertir_todos(sources):
+    print("File:", result.fuente)
+    if result.error is not None:
+        print("Error:", result.error)
+        continue
+
+    # Exportamos el resultado a un diccionario de Python, que puede contener listas.
+    # ejemplo:
+    #      (1) Diccionario    (2) Lista     (3) Diccionario
+    #            |                |               |
+    # valor = data["texts"]        [0]           ["text"]
+    data = result.documento.export_to_dict()
+
+    # 'data["texts"]' contiene todos los textos del PDF con su posición ("prov").
+    # Construimos el índice y recuperamos todos los campos que nos interesan.
+    values = IndiceEtiquetas(data["texts"]).extraer(LABELS)
+
+    invoice_number = values["Invoice Number"]
+    order_number   = values["Order Number"]
+    invoice_date   = values["Invoice Date"]
+    due_date       = values["Due Date"]
+    total_due      = values["Total Due"]
+
+    # Nota: En el código original 'from' es una palabra reservada en Python, 
+    # así que usamos 'from_how' o similar para evitar errores de sintaxis.
+    from_how       = values["From:"]
+    to             = values["To:"]
+
+    # ==========================================
+    # 4. MOSTRAR RESULTADOS
+    # ==========================================
+
+    print("Invoice Number:", invoice_number)
+    print("Order Number:", order_number)
+    print("Invoice Date:", invoice_date)
+    print("Due Date:", due_date)
+    print("Total Due:", total_due)
+    print("From:", from_how)
+    print("To:", to)
+    if result.estado != "success":
+        print("Estado:", result.estado)
+
+# Tiempo de carga de los modelos y segundos acumulados por etapa (layout, ocr, table_structure...)
+print(converter.estadisticas())
 """
 ejemplo de lo que hace docling
 data = {
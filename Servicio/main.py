@@ -0,0 +1,357 @@
+"""
+Servicio de ingesta continua: vigila las carpetas de entrada y procesa cada factura en
+cuanto llega, sin recorrer las carpetas con cada ejecución programada.
+
+- Cada carpeta vigilada tiene un procesador (estructurado, ia, escaneados) o "auto": el
+  clasificador (comun/clasificador_documentos.py) mira cada PDF y manda cada página al
+  procesador más barato que la entiende: regex si es un diseño conocido, GPT si tiene
+  capa de texto, OCR solo si es un escaneo. Las imágenes van siempre al OCR local
+  (imagen). Ver procesadores.py
+- Cada procesador tiene su cola de trabajo y su hilo: los modelos y clientes se cargan
+  una sola vez y se reutilizan para todos los documentos
+- Un archivo se procesa cuando termina de escribirse (ver comun/vigilante.py)
+- Los resultados se escriben en salida_servicio/<procesador>.csv (o .jsonl/.parquet) y el
+  archivo se mueve a 'processed_documents' cuando su fila ya está en disco; si falla, el
+  error va a salida_servicio/errores.csv y el archivo a 'error_documents'
+- El manifiesto (comun/manifiesto.py) evita procesar dos veces el mismo contenido
+
+Variables de entorno:
+- SERVICE_FOLDERS: carpeta=procesador separadas por comas (por defecto
+  "documents=auto,facturas=auto"; ej: "documents=estructurado,facturas=escaneados")
+- SERVICE_DEBOUNCE_SECONDS: segundos sin cambios para dar un archivo por terminado (2)
+- SERVICE_MAX_WAIT_SECONDS: espera máxima de un PDF sin %%EOF antes de procesarlo igualmente (60)
+- SERVICE_POLL_SECONDS: intervalo de revisión de pendientes y, sin watchdog, de sondeo (1)
+- SERVICE_POLLING: true para sondear las carpetas aunque watchdog esté instalado
+- SERVICE_QUEUE_SIZE: documentos en espera por procesador (100)
+- SERVICE_WARMUP: false para cargar cada procesador con su primer documento
+- SERVICE_STATS_SECONDS: cada cuántos segundos se imprime el resumen (60; 0 = nunca)
+- SERVICE_OUTPUT_FOLDER, RESULTS_FORMAT, RESULTS_BATCH_SIZE, RESULTS_FLUSH_SECONDS, MANIFEST_PATH
+
+Uso:
+    python Servicio/main.py        (Ctrl+C para detener; termina lo que esté en curso)
+"""
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.clasificador_documentos import clasificar_pdf
+from comun.manifiesto import Manifiesto, clave_documento
+from comun.salida_resultados import abrir_salida
+from comun.vigilante import VigilanteCarpetas
+from comun.metricas import configurar, medir, evento, traza
+from comun.perfilado import imprimir_informe
+from procesadores import PROCESADORES, elegir_procesador
+
+# Columnas del registro de errores
+ERROR_FIELDS = ["Archivo", "Procesador", "Error"]
+
+# Carpeta cuyos PDF se clasifican página a página
+AUTO = "auto"
+# Procesadores a los que puede enviar el clasificador
+PROCESADORES_AUTO = ("estructurado", "ia", "escaneados")
+
+
+class DocumentoEnCurso:
+    """
+    Documento repartido entre uno o varios procesadores. Cuando terminan todas sus
+    partes se escriben sus filas; cuando todas están en disco, se mueve el archivo.
+    """
+
+    def __init__(self, ruta, clave, procesadores):
+        self.ruta = ruta
+        self.clave = clave
+        self.procesadores = list(procesadores)
+        self.partes = len(self.procesadores)
+        self.filas = {}
+        self.errores = []
+        self.escrituras = 0
+        self.lock = threading.Lock()
+
+    def terminar_parte(self, procesador, filas=None, error=None):
+        """Guarda el resultado de una parte; retorna True si era la última."""
+        with self.lock:
+            if error is not None:
+                self.errores.append(f"{procesador}: {error}")
+            elif filas:
+                self.filas.setdefault(procesador, []).extend(filas)
+            self.partes -= 1
+            return self.partes == 0
+
+    def confirmar_escritura(self):
+        """Cuenta una salida ya escrita; retorna True si era la última."""
+        with self.lock:
+            self.escrituras -= 1
+            return self.escrituras == 0
+
+
+def leer_carpetas(texto):
+    """'documents=estructurado,facturas=escaneados' -> {ruta absoluta: procesador}."""
+    por_carpeta = {}
+    for par in texto.split(","):
+        if not par.strip():
+            continue
+        carpeta, _, nombre = par.partition("=")
+        nombre = nombre.strip()
+        if nombre not in PROCESADORES and nombre != AUTO:
+            raise ValueError(f"Procesador desconocido para {carpeta}: {nombre} (opciones: {list(PROCESADORES)})")
+        por_carpeta[os.path.abspath(carpeta.strip())] = nombre
+    return por_carpeta
+
+
+def mover_archivo(file, carpeta):
+    """Mueve un archivo a otra carpeta (la crea si no existe)."""
+    os.makedirs(carpeta, exist_ok=True)
+    os.replace(file, os.path.join(carpeta, os.path.basename(file)))
+
+
+def open_results(file_name, fields, types=None, on_write=None):
+    # Por defecto se vacía cada segundo: en el servicio importa la latencia, no el tamaño del lote
+    return abrir_salida(
+        file_name, fields, types, al_escribir=on_write,
+        tam_lote=int(os.getenv("RESULTS_BATCH_SIZE", "50")),
+        intervalo=float(os.getenv("RESULTS_FLUSH_SECONDS", "1")),
+    )
+
+
+if __name__ == "__main__":
+    # Métricas (METRICS_PORT para exponer /metrics mientras el servicio está en marcha)
+    # y registro de eventos (LOG_JSON)
+    configurar()
+    started = time.time()
+
+    por_carpeta = leer_carpetas(os.getenv("SERVICE_FOLDERS", "documents=auto,facturas=auto"))
+    # De la carpeta más profunda a la menos profunda, por si una está dentro de otra
+    carpetas = sorted(por_carpeta, key=len, reverse=True)
+
+    processed_folder = 'processed_documents'
+    error_folder = 'error_documents'
+    output_folder = os.getenv("SERVICE_OUTPUT_FOLDER", "salida_servicio")
+    results_format = os.getenv("RESULTS_FORMAT", "csv")
+    os.makedirs(output_folder, exist_ok=True)
+
+    manifest = Manifiesto(os.getenv("MANIFEST_PATH", "manifiesto.sqlite"))
+
+    def done(document):
+        # Se marca como escrito y se mueve a procesados (en ese orden: si el servicio se
+        # cae entre los dos pasos, al volver a arrancar solo se mueve)
+        manifest.registrar(document.clave, "escrito", documento=os.path.basename(document.ruta))
+        try:
+            mover_archivo(document.ruta, processed_folder)
+        except FileNotFoundError:
+            # Alguien lo quitó de la carpeta antes de que se escribieran sus filas: el
+            # resultado ya está guardado, no hay nada que mover
+            evento("archivo_no_disponible", nivel="warning", documento=document.ruta)
+
+    # Cada salida avisa de los documentos cuya última fila ya está en el archivo.
+    # Un documento que falla no impide confirmar los demás del mismo lote
+    def on_write(documents):
+        for document in documents:
+            try:
+                if document.confirmar_escritura():
+                    done(document)
+            except Exception as e:
+                evento("confirmacion_fallida", nivel="error", documento=document.ruta, error=str(e))
+
+    # Procesadores que se usan: los de las carpetas (o los del clasificador) y el de imágenes
+    names = set()
+    for name in por_carpeta.values():
+        names.update(PROCESADORES_AUTO if name == AUTO else (name,))
+    processors = {name: PROCESADORES[name]() for name in names | {"imagen"}}
+    sinks = {
+        name: open_results(os.path.join(output_folder, f"{name}.{results_format}"),
+                           processor.columnas, processor.tipos, on_write=on_write)
+        for name, processor in processors.items()
+    }
+    errors_sink = open_results(os.path.join(output_folder, "errores.csv"), ERROR_FIELDS)
+
+    if os.getenv("SERVICE_WARMUP", "true").lower() in ("1", "true", "yes"):
+        for name in sorted(names):
+            print(f"Cargando procesador {name}...")
+            try:
+                processors[name].preparar()
+            except Exception as e:
+                # Sin sus dependencias (ej: el SDK de Azure) sus documentos irán a errores
+                evento("procesador_no_disponible", nivel="warning", procesador=name, error=str(e))
+
+    queue_size = int(os.getenv("SERVICE_QUEUE_SIZE", "100"))
+    queues = {name: queue.Queue(maxsize=queue_size) for name in processors}
+    incoming = queue.Queue(maxsize=queue_size)
+
+    # Cada paso se protege por separado: si no se puede registrar el error o mover el
+    # archivo (ej: está bloqueado), se anota y el hilo que llama sigue con lo demás
+    def fail(path, name, error, key=None):
+        evento("documento_fallido", nivel="error", procesador=name, documento=path, error=str(error))
+        try:
+            errors_sink.escribir({"Archivo": os.path.basename(path), "Procesador": name, "Error": str(error)})
+        except Exception as e:
+            evento("registro_error_fallido", nivel="error", documento=path, error=str(e))
+        if key is not None:
+            try:
+                manifest.registrar_error(key, error, documento=os.path.basename(path))
+            except Exception as e:
+                evento("registro_error_fallido", nivel="error", documento=path, error=str(e))
+        try:
+            if os.path.exists(path):
+                mover_archivo(path, error_folder)
+        except Exception as e:
+            evento("mover_archivo_fallido", nivel="error", documento=path, destino=error_folder, error=str(e))
+
+    # Se llama cuando terminan todas las partes de un documento
+    def finish(document):
+        if document.errores:
+            # Si falla una parte no se escribe ninguna: el documento entero va a errores
+            fail(document.ruta, "+".join(document.procesadores), "; ".join(document.errores),
+                 document.clave)
+            return
+        document.escrituras = len(document.filas)
+        if not document.filas:
+            done(document)
+            return
+        for name, rows in document.filas.items():
+            # La referencia va en la última fila de cada salida
+            for row in rows[:-1]:
+                sinks[name].escribir(row)
+            sinks[name].escribir(rows[-1], referencia=document)
+
+    # Hilo de cada procesador: toma (documento, páginas) de su cola hasta recibir None
+    def work(name):
+        processor, pending = processors[name], queues[name]
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            document, pages = item
+            try:
+                with medir("documento", procesador=name):
+                    rows = processor.procesar(document.ruta, pages)
+            except Exception as e:
+                last = document.terminar_parte(name, error=e)
+            else:
+                evento("documento_procesado", procesador=name, documento=document.ruta, filas=len(rows))
+                traza(f"[{name}] {document.ruta}: {len(rows)} fila(s)")
+                last = document.terminar_parte(name, filas=rows)
+            if last:
+                # Un error al escribir sus filas no puede detener el hilo del procesador
+                try:
+                    finish(document)
+                except Exception as e:
+                    evento("finalizacion_fallida", nivel="error", procesador=name,
+                           documento=document.ruta, error=str(e))
+
+    # Documentos y páginas enviados a cada procesador, y documentos mixtos
+    routing = {"documentos": 0, "mixtos": 0, "ya_procesados": 0, "paginas": {}}
+
+    # Reparte un archivo: descarta lo ya procesado, clasifica y encola cada parte.
+    # Si la cola de un procesador está llena, espera: los archivos siguen en la carpeta
+    def route(path):
+        name = elegir_procesador(path, por_carpeta, carpetas)
+        if name is None:
+            evento("sin_procesador", nivel="warning", documento=path)
+            return
+        try:
+            key = clave_documento(path)
+        except OSError as e:
+            # Se borró o se movió mientras esperaba en la cola
+            evento("archivo_no_disponible", nivel="warning", documento=path, error=str(e))
+            return
+        if manifest.retomar(key, "escrito"):
+            traza(f"Ya procesado (mismo contenido): {path}")
+            routing["ya_procesados"] += 1
+            mover_archivo(path, processed_folder)
+            return
+
+        if name == AUTO:
+            try:
+                classification = clasificar_pdf(path)
+            except Exception as e:
+                fail(path, AUTO, e, key)
+                return
+            parts = classification.rutas
+            for part, pages in parts.items():
+                routing["paginas"][part] = routing["paginas"].get(part, 0) + len(pages)
+            routing["mixtos"] += len(parts) > 1
+            # Un documento de un solo procesador, sin páginas en blanco, se procesa
+            # entero, sin lista de páginas. Si tiene páginas en blanco se pasa la lista:
+            # None volvería a incluirlas (y el OCR de una página vacía es un error)
+            if len(parts) == 1:
+                (only, pages), = parts.items()
+                if len(pages) == len(classification.paginas):
+                    parts = {only: None}
+            traza(f"[auto] {path} -> {', '.join(parts) or 'en blanco'}")
+        else:
+            parts = {name: None}
+        routing["documentos"] += 1
+
+        document = DocumentoEnCurso(path, key, parts)
+        if not parts:
+            finish(document)
+        for part, pages in parts.items():
+            queues[part].put((document, pages))
+
+    # Hilo que reparte: un archivo que no se puede repartir (ej: no se puede mover a
+    # procesados) se anota y el hilo sigue con los siguientes
+    def dispatch():
+        while True:
+            path = incoming.get()
+            if path is None:
+                return
+            try:
+                route(path)
+            except Exception as e:
+                evento("reparto_fallido", nivel="error", documento=path, error=str(e))
+
+    workers = [threading.Thread(target=work, args=(name,), name=f"procesador-{name}")
+               for name in processors]
+    workers.append(threading.Thread(target=dispatch, name="reparto"))
+    for worker in workers:
+        worker.start()
+
+    watcher = VigilanteCarpetas(
+        carpetas, incoming.put,
+        espera=float(os.getenv("SERVICE_DEBOUNCE_SECONDS", "2")),
+        intervalo=float(os.getenv("SERVICE_POLL_SECONDS", "1")),
+        espera_maxima=float(os.getenv("SERVICE_MAX_WAIT_SECONDS", "60")),
+        excluir=[processed_folder, error_folder, output_folder],
+        usar_eventos=os.getenv("SERVICE_POLLING", "false").lower() not in ("1", "true", "yes"),
+    )
+    watcher.iniciar()
+    print(f"Vigilando {carpetas} (modo: {watcher.modo}). Ctrl+C para detener.")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+    def report():
+        print("Vigilante:", watcher.estadisticas())
+        print("Reparto:", routing)
+        for name, processor in processors.items():
+            print(f"Procesador {name}:", {**processor.estadisticas(), "en_cola": queues[name].qsize()})
+
+    stats_seconds = float(os.getenv("SERVICE_STATS_SECONDS", "60"))
+    while not stop.wait(stats_seconds or None):
+        report()
+
+    # Parada ordenada: no se aceptan más archivos, se termina lo encolado y se escriben
+    # las filas pendientes (que mueven sus archivos a procesados)
+    print("Deteniendo el servicio...")
+    watcher.detener()
+    incoming.put(None)
+    workers[-1].join()
+    for pending in queues.values():
+        pending.put(None)
+    for worker in workers[:-1]:
+        worker.join()
+    for sink in sinks.values():
+        sink.cerrar()
+    errors_sink.cerrar()
+    for processor in processors.values():
+        processor.cerrar()
+    report()
+    print("Manifiesto:", manifest.estadisticas())
+    manifest.cerrar()
+    # Documentos más lentos desde el arranque (PROFILE_SLOW_DOCS=true)
+    imprimir_informe(desde=started)
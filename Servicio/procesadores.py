@@ -0,0 +1,311 @@
+"""
+Procesadores del servicio: cada uno envuelve uno de los flujos del repositorio y
+mantiene cargados sus modelos y clientes entre documentos.
+
+- estructurado: PDF con capa de texto y formato fijo (regex de 'PDF estructurado')
+- ia: PDF con capa de texto y formato libre (GPT, de 'PDF no estructurado (IA)')
+- escaneados: PDF escaneado (Azure Read + regex/GPT, de 'Documentos escaneados')
+- imagen: imagen suelta (Tesseract + regex, de 'Imagen estructurado (OCR)')
+
+Los modelos se cargan en preparar() (al arrancar el servicio, o con el primer documento)
+y se reutilizan; procesar(ruta, paginas) devuelve las filas de resultados del documento
+(o solo de esas páginas, cuando el clasificador reparte un documento mixto).
+"""
+import json
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+from comun.cache import CacheDisco, clave_ocr
+from comun.scripts import cargar_script
+from comun.texto_pdf import iter_paginas
+
+# Extensiones de imagen que se procesan con el OCR local
+EXTENSIONES_IMAGEN = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+class Procesador:
+    """
+    Base de los procesadores. Cada uno define nombre y columnas, e implementa
+    _cargar() (modelos y clientes) y _procesar(ruta, paginas).
+    """
+
+    nombre = None
+    columnas = []
+    tipos = None
+
+    def __init__(self):
+        self._preparado = False
+        self.documentos = 0
+        self.segundos = 0.0
+        self.segundos_carga = 0.0
+
+    def preparar(self):
+        """Carga los modelos y clientes (solo la primera vez)."""
+        if not self._preparado:
+            inicio = time.perf_counter()
+            self._cargar()
+            self.segundos_carga = time.perf_counter() - inicio
+            self._preparado = True
+
+    def _cargar(self):
+        raise NotImplementedError
+
+    def _procesar(self, ruta, paginas):
+        raise NotImplementedError
+
+    def procesar(self, ruta, paginas=None):
+        """
+        Procesa un documento.
+
+        Parámetros:
+        - ruta: ruta del documento
+        - paginas: índices de las páginas a procesar (None = todas)
+
+        Retorna:
+        - Lista de filas (diccionario columna -> valor); lanza una excepción si falla
+        """
+        self.preparar()
+        inicio = time.perf_counter()
+        try:
+            return self._procesar(ruta, paginas)
+        finally:
+            self.documentos += 1
+            self.segundos += time.perf_counter() - inicio
+
+    def estadisticas(self):
+        return {
+            "documentos": self.documentos,
+            "segundos": round(self.segundos, 3),
+            "segundos_carga": round(self.segundos_carga, 3),
+        }
+
+    def cerrar(self):
+        pass
+
+
+# Columnas de las facturas en PDF con capa de texto (las del CSV de 'PDF estructurado')
+COLUMNAS_PDF = ["Archivo", "Invoice Number", "Bill To", "Subtotal", "Tax (%)", "Discount (%)",
+                "Total", "Notes", "Terms"]
+
+
+def _texto_paginas(ruta, paginas, backend=None):
+    """Texto de algunas páginas de un PDF, unido como lo hace leer_texto."""
+    paginas = set(paginas)
+    return ''.join(texto for i, texto in enumerate(iter_paginas(ruta, backend)) if i in paginas)
+
+
+def _fila_pdf(ruta, campos):
+    invoice_number, bill_to, subtotal, total, discount, tax, notes, terms = campos
+    return {
+        "Archivo": os.path.basename(ruta), "Invoice Number": invoice_number, "Bill To": bill_to,
+        "Subtotal": subtotal, "Tax (%)": tax, "Discount (%)": discount, "Total": total,
+        "Notes": notes, "Terms": terms,
+    }
+
+
+class ProcesadorEstructurado(Procesador):
+    nombre = "estructurado"
+    columnas = COLUMNAS_PDF
+
+    def _cargar(self):
+        self.script = cargar_script("PDF estructurado", "pdf_estructurado")
+
+    def _procesar(self, ruta, paginas):
+        if paginas is None:
+            return [_fila_pdf(ruta, self.script.extract_invoice_info(ruta, mostrar_texto=False))]
+        texto = _texto_paginas(ruta, paginas, self.script.PDF_TEXT_BACKEND)
+        return [_fila_pdf(ruta, self.script.extract_invoice_info_from_text(texto))]
+
+
+class ProcesadorIA(Procesador):
+    nombre = "ia"
+    columnas = COLUMNAS_PDF
+
+    def _cargar(self):
+        from comun.extraccion_llm import MotorExtraccionLLM
+
+        self.script = cargar_script("PDF no estructurado (IA)", "pdf_no_estructurado_ia")
+        self.motor = MotorExtraccionLLM(
+            self.script.CAMPOS_FACTURA,
+            mensaje_sistema="Eres un experto en analisis estructurado.",
+            max_concurrencia=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            cache=CacheDisco(
+                os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+                ttl=float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+            ),
+        )
+
+    def _procesar(self, ruta, paginas):
+        if paginas is None:
+            texto = self.script.leer_texto_pdf(ruta)
+        else:
+            texto = _texto_paginas(ruta, paginas, self.script.PDF_TEXT_BACKEND)
+        resultado, = self.motor.extraer_todos_sync([texto])
+        if isinstance(resultado, Exception):
+            raise resultado
+        return [_fila_pdf(ruta, self.script.campos_factura(resultado.datos))]
+
+    def estadisticas(self):
+        return {**super().estadisticas(), "llm": self.motor.estadisticas() if self._preparado else {}}
+
+    def cerrar(self):
+        if self._preparado and self.motor.cache is not None:
+            self.motor.cache.cerrar()
+
+
+class ProcesadorEscaneados(Procesador):
+    """
+    PDF escaneado: cada página se renderiza en memoria, pasa por Azure Read (con caché
+    OCR) y se extrae con regex y GPT. Una fila por página, como 'Documentos escaneados'.
+    """
+
+    nombre = "escaneados"
+
+    def __init__(self):
+        super().__init__()
+        from comun.extraccion_escalonada import CAMPOS_REGEX_A_LLM
+        from comun.salida_resultados import TIPOS_FACTURA
+        # Los mismos campos que INVOICE_FIELDS de 'Documentos escaneados'
+        self.columnas = ["Archivo"] + list(CAMPOS_REGEX_A_LLM.values())
+        self.tipos = TIPOS_FACTURA
+
+    def _cargar(self):
+        from comun.extraccion_llm import MotorExtraccionLLM
+        from comun.extraccion_escalonada import ExtractorEscalonado
+
+        # Al importarlo se crean los clientes de Azure y OpenAI, que quedan abiertos
+        self.script = cargar_script("Documentos escaneados", "documentos_escaneados")
+        import convert_to_img
+        import azure_ocr_async
+        self.convert_to_img = convert_to_img
+        self.azure_ocr_async = azure_ocr_async
+
+        self.ocr_cache = CacheDisco(
+            os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite"),
+            max_bytes=int(os.getenv("OCR_CACHE_MAX_MB", "512")) * 1024 * 1024
+        )
+        self.motor = MotorExtraccionLLM(
+            self.script.INVOICE_FIELDS,
+            max_concurrencia=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            cache=self.script.open_llm_cache(),
+        )
+        self.extractor = ExtractorEscalonado(
+            self.motor, umbral=float(os.getenv("REGEX_CONFIDENCE_THRESHOLD", "0.7"))
+        )
+
+    def _procesar(self, ruta, paginas):
+        def peticiones():
+            for page in self.convert_to_img.iter_pdf_pages(ruta, profile="ocr-azure", pages=paginas):
+                cache_key = clave_ocr(page.data, self.script.AZURE_OCR_ENGINE)
+                texto = self.ocr_cache.obtener(cache_key)
+                yield (page, cache_key, texto), (page.data if texto is None else None)
+
+        leidas = []
+        resultados_ocr = self.azure_ocr_async.iter_ocr_concurrente(
+            peticiones(), self.script.endpoint, self.script.key,
+            max_en_vuelo=int(os.getenv("AZURE_OCR_MAX_IN_FLIGHT", "16"))
+        )
+        for (page, cache_key, texto_cache), texto_ocr in resultados_ocr:
+            texto = texto_cache if texto_cache is not None else texto_ocr
+            if texto_cache is None and texto_ocr:
+                self.ocr_cache.guardar(cache_key, texto_ocr)
+            if not texto:
+                raise ValueError(f"No se ha podido extraer texto de la página {page.page_num + 1}")
+            leidas.append((page.page_num, page.name, texto))
+        leidas.sort()
+
+        filas = []
+        resultados = self.extractor.extraer_todos([texto for _, _, texto in leidas])
+        for (page_num, nombre, _), resultado in zip(leidas, resultados):
+            # Una página que falla aparta el documento entero: no se escriben filas sueltas
+            if isinstance(resultado, Exception):
+                raise ValueError(f"Página {page_num + 1}: {resultado}") from resultado
+            filas.append({"Archivo": nombre, **json.loads(resultado.datos)})
+        return filas
+
+    def estadisticas(self):
+        if not self._preparado:
+            return super().estadisticas()
+        return {**super().estadisticas(), "llm": self.motor.estadisticas(),
+                "escalonada": self.extractor.estadisticas(), "cache_ocr": self.ocr_cache.estadisticas()}
+
+    def cerrar(self):
+        if self._preparado:
+            self.ocr_cache.cerrar()
+            self.motor.cache.cerrar()
+
+
+class ProcesadorImagen(Procesador):
+    """
+    Imagen suelta: preprocesado y Tesseract locales (los motores quedan cargados) y
+    campos por regex, como 'Imagen estructurado (OCR)'.
+    """
+
+    nombre = "imagen"
+
+    def __init__(self):
+        super().__init__()
+        from comun.patrones_factura import patterns
+        self.columnas = ["Archivo"] + list(patterns)
+
+    def _cargar(self):
+        carpeta = os.path.join(RAIZ, "Imagen estructurado (OCR)")
+        if carpeta not in sys.path:
+            sys.path.append(carpeta)
+        from preprocesado import PipelinePreprocesado
+        from ocr_tesseract import PoolTesseract
+        from comun.patrones_factura import extraer_campos
+
+        self.extraer_campos = extraer_campos
+        self.preprocesado = PipelinePreprocesado(escala=2, denoise=os.getenv("DENOISE_MODE", "nlmeans"),
+                                                 workers=1)
+        self.ocr = PoolTesseract(idiomas=("spa", "eng"), config=r'--oem 3 --psm 6', workers=1)
+
+    def _procesar(self, ruta, paginas):
+        texto = self.ocr.reconocer(self.preprocesado.procesar(ruta))
+        if not texto.strip():
+            raise ValueError("No se ha podido extraer texto de la imagen")
+        return [{"Archivo": os.path.basename(ruta), **self.extraer_campos(texto)}]
+
+    def estadisticas(self):
+        if not self._preparado:
+            return super().estadisticas()
+        return {**super().estadisticas(), "tesseract": self.ocr.estadisticas()}
+
+    def cerrar(self):
+        if self._preparado:
+            self.ocr.cerrar()
+
+
+PROCESADORES = {
+    procesador.nombre: procesador
+    for procesador in (ProcesadorEstructurado, ProcesadorIA, ProcesadorEscaneados, ProcesadorImagen)
+}
+
+
+def elegir_procesador(ruta, por_carpeta, carpetas):
+    """
+    Procesador de un archivo: las imágenes van siempre al OCR local; los PDF, al
+    procesador de la carpeta vigilada donde llegaron ("auto" si hay que clasificarlos).
+
+    Parámetros:
+    - ruta: ruta absoluta del archivo
+    - por_carpeta: diccionario carpeta absoluta -> nombre de procesador
+    - carpetas: carpetas vigiladas, de la más profunda a la menos profunda
+
+    Retorna:
+    - Nombre del procesador, o None si el archivo no es un documento
+    """
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension in EXTENSIONES_IMAGEN:
+        return "imagen"
+    if extension != ".pdf":
+        return None
+    for carpeta in carpetas:
+        if ruta.startswith(carpeta + os.sep):
+            return por_carpeta[carpeta]
+    return None
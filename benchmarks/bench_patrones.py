@@ -0,0 +1,109 @@
+"""
+Benchmark de la extracción por regex: bucle de re.search por patrón y por campo
+(buscar_valor) frente al escáner de una sola pasada (EscanerPatrones).
+
+Genera textos OCR simulados de varias páginas concatenadas, comprueba que ambos
+métodos devuelven exactamente lo mismo y mide el tiempo de cada uno.
+
+Uso:
+    python benchmarks/bench_patrones.py --paginas 1 10 100 --repeticiones 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comun.patrones_factura import patterns, buscar_valor, escaner_patrones
+
+# Líneas de relleno típicas del OCR de una factura (sin etiquetas de campo)
+RELLENO = [
+    "Gracias por su confianza",
+    "Forma de pago: transferencia bancaria",
+    "Referencia pedido 88231-B",
+    "Condiciones generales al dorso",
+    "Unidades    Descripcion    Precio",
+    "3   Material de oficina   45,90",
+    "Plazo de entrega 15 dias",
+]
+
+
+def pagina_factura(rng, completa=True):
+    """
+    Texto de una página. Si no es completa, faltan algunos campos (las páginas
+    de continuación solo tienen líneas de detalle), que es el peor caso del bucle.
+    """
+    lineas = [rng.choice(RELLENO) for _ in range(rng.randint(10, 30))]
+    if completa:
+        subtotal = rng.randint(100, 9000)
+        lineas += [
+            f"Fecha: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2023",
+            f"Número: {rng.randint(1000, 99999)}",
+            "Cliente: Distribuciones Garcia SL",
+            "Domicilio: Calle Mayor 12",
+            "Ciudad: Zaragoza",
+            f"DNI/NIF: B{rng.randint(10000000, 99999999)}",
+            "Publicidad en prensa regional",
+            f"SUBTOTAL: {subtotal},00",
+            f"IVA 21%: {subtotal * 21 // 100},00",
+            f"TOTAL A PAGAR: {subtotal * 121 // 100},00",
+        ]
+        rng.shuffle(lineas)
+    return "\n".join(lineas)
+
+
+def texto_multipagina(paginas, semilla=0):
+    """Concatena páginas; solo la última lleva los datos de la factura."""
+    rng = random.Random(semilla)
+    return "\n\f\n".join(pagina_factura(rng, completa=(i == paginas - 1)) for i in range(paginas))
+
+
+def con_bucle(texto):
+    return {campo: buscar_valor(lista, texto) for campo, lista in patterns.items()}
+
+
+def con_escaner(texto):
+    return escaner_patrones.buscar_todos(texto)
+
+
+def medir(funcion, texto, repeticiones):
+    """Mejor tiempo de varias repeticiones, en segundos."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(texto)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def comprobar_equivalencia(casos=300, semilla=1):
+    """Compara ambos métodos sobre textos aleatorios, incluidos textos vacíos y parciales."""
+    rng = random.Random(semilla)
+    for _ in range(casos):
+        texto = "\n".join(pagina_factura(rng, completa=rng.random() < 0.5) for _ in range(rng.randint(0, 3)))
+        # Recortes aleatorios para provocar campos a medias
+        if texto and rng.random() < 0.5:
+            inicio = rng.randrange(len(texto))
+            texto = texto[inicio:inicio + rng.randint(1, 400)]
+        esperado, obtenido = con_bucle(texto), con_escaner(texto)
+        if esperado != obtenido:
+            raise AssertionError(f"Resultados distintos para {texto!r}:\n{esperado}\n{obtenido}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de los patrones de facturas")
+    parser.add_argument("--paginas", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    comprobar_equivalencia()
+    print("Equivalencia comprobada: ambos métodos devuelven los mismos valores")
+
+    print(f"{'páginas':>8} {'caracteres':>11} {'bucle (ms)':>11} {'escáner (ms)':>13} {'mejora':>7}")
+    for paginas in args.paginas:
+        texto = texto_multipagina(paginas)
+        tiempo_bucle = medir(con_bucle, texto, args.repeticiones)
+        tiempo_escaner = medir(con_escaner, texto, args.repeticiones)
+        print(f"{paginas:>8} {len(texto):>11} {tiempo_bucle * 1000:>11.2f} "
+              f"{tiempo_escaner * 1000:>13.2f} {tiempo_bucle / tiempo_escaner:>6.2f}x")
@@ -0,0 +1,351 @@
+"""
+Benchmark de extremo a extremo de los pipelines con un corpus sintético.
+
+- Genera (o reutiliza) un corpus con benchmarks/corpus_sintetico.py: la misma semilla
+  produce los mismos documentos, así que las ejecuciones en commits distintos son comparables
+- Arranca los servidores locales que imitan Azure Read (azure_read_stub.py) y OpenAI
+  (comun/stub_openai.py), con latencias configurables: no se gasta dinero ni se depende de la red
+- Ejecuta cada pipeline en un proceso aparte (así el pico de memoria de uno no se mezcla
+  con el de otro), con las mismas etapas que su script, montadas sobre comun/pipeline.py:
+  - estructurado: texto (PyMuPDF/PyPDF2) -> regex de 'PDF estructurado'
+  - ia: texto -> GPT con los campos de 'PDF no estructurado (IA)'
+  - escaneados: renderizado -> OCR Azure -> extracción escalonada (regex + GPT)
+  - imagen: preprocesado OpenCV -> Tesseract -> regex (se omite si Tesseract no está instalado)
+- Por pipeline informa páginas por segundo, latencia p50/p95 de cada etapa, el cuello de
+  botella y el pico de memoria (RSS) del proceso y de sus procesos hijos
+- Guarda los resultados en JSON, con el commit y los parámetros, y puede compararlos con
+  una ejecución anterior
+
+Uso:
+    python benchmarks/bench_pipelines.py --documentos 20 --salida resultados.json
+    python benchmarks/bench_pipelines.py --corpus corpus --comparar bench_pipelines_1a2b3c4.json
+"""
+import argparse
+import functools
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource  # No existe en Windows: allí no se mide el pico de memoria
+except ImportError:
+    resource = None
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(RAIZ)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from comun.pipeline import Pipeline, Etapa
+from comun.scripts import cargar_script
+from comun.texto_pdf import leer_texto
+from corpus_sintetico import generar_corpus
+
+PIPELINES = ("estructurado", "ia", "escaneados", "imagen")
+
+
+def _sin_errores(resultados):
+    """Relanza el primer error de una lista de resultados del motor LLM (lo cuenta la etapa)."""
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            raise resultado
+    return resultados
+
+
+# ---- Etapas de cada pipeline ----
+# Cada función recibe el corpus y las opciones y retorna (etapas, entradas)
+
+def etapas_estructurado(corpus, args):
+    script = cargar_script("PDF estructurado", "pdf_estructurado")
+    etapas = [
+        Etapa("texto", functools.partial(leer_texto, backend=script.PDF_TEXT_BACKEND),
+              modo="procesos", workers=args.workers),
+        Etapa("regex", script.extract_invoice_info_from_text),
+    ]
+    return etapas, sorted(glob.glob(os.path.join(corpus, "estructurado", "*.pdf")))
+
+
+def etapas_ia(corpus, args):
+    from comun.extraccion_llm import MotorExtraccionLLM
+
+    script = cargar_script("PDF no estructurado (IA)", "pdf_no_estructurado_ia")
+    # Sin caché: cada ejecución debe hacer todas las llamadas
+    motor = MotorExtraccionLLM(script.CAMPOS_FACTURA, mensaje_sistema="Eres un experto en analisis estructurado.",
+                               max_concurrencia=args.llm_concurrencia)
+    etapas = [
+        Etapa("texto", functools.partial(leer_texto, backend=script.PDF_TEXT_BACKEND),
+              modo="procesos", workers=args.workers),
+        Etapa("llm", lambda textos: _sin_errores(motor.extraer_todos_sync(textos)),
+              lote=args.llm_concurrencia * 2),
+    ]
+    return etapas, sorted(glob.glob(os.path.join(corpus, "ia", "*.pdf")))
+
+
+def etapas_escaneados(corpus, args):
+    from comun.extraccion_llm import MotorExtraccionLLM
+    from comun.extraccion_escalonada import ExtractorEscalonado
+
+    script = cargar_script("Documentos escaneados", "documentos_escaneados")
+    import convert_to_img
+    import azure_ocr_async
+
+    extractor = ExtractorEscalonado(MotorExtraccionLLM(script.INVOICE_FIELDS,
+                                                       max_concurrencia=args.llm_concurrencia))
+
+    async def ocr(cliente, pagina):
+        return await cliente.ocr(pagina.data)
+
+    etapas = [
+        Etapa("render", functools.partial(convert_to_img.render_task, profile="ocr-azure"),
+              modo="procesos", workers=args.workers),
+        Etapa("ocr", ocr, modo="async", workers=args.ocr_en_vuelo,
+              contexto=lambda: azure_ocr_async.ClienteAzureReadAsync(script.endpoint, script.key,
+                                                                      args.ocr_en_vuelo)),
+        Etapa("extraer", lambda textos: _sin_errores(extractor.extraer_todos(textos)),
+              lote=args.llm_concurrencia * 2),
+    ]
+    return etapas, convert_to_img.iter_page_tasks(os.path.join(corpus, "escaneados"))
+
+
+def etapas_imagen(corpus, args):
+    carpeta = os.path.join(RAIZ, "Imagen estructurado (OCR)")
+    if carpeta not in sys.path:
+        sys.path.append(carpeta)
+    from preprocesado import PipelinePreprocesado
+    from ocr_tesseract import PoolTesseract
+    from comun.patrones_factura import extraer_campos
+
+    # Falla aquí si Tesseract no está instalado: el pipeline se da por omitido
+    ocr = PoolTesseract(idiomas=("spa", "eng"), config=r'--oem 3 --psm 6', workers=args.workers)
+    preprocesado = PipelinePreprocesado(escala=2, denoise=os.getenv("DENOISE_MODE", "nlmeans"), workers=1)
+    etapas = [
+        Etapa("preprocesado", preprocesado.procesar, workers=args.workers),
+        Etapa("ocr", ocr.reconocer, workers=args.workers),
+        Etapa("regex", extraer_campos),
+    ]
+    return etapas, sorted(glob.glob(os.path.join(corpus, "imagen", "*.png")))
+
+
+ETAPAS = {
+    "estructurado": etapas_estructurado,
+    "ia": etapas_ia,
+    "escaneados": etapas_escaneados,
+    "imagen": etapas_imagen,
+}
+
+
+# ---- Medición (en el proceso hijo) ----
+
+def _mb(maxrss):
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def pico_memoria():
+    """Pico de RSS (MB) de este proceso y del mayor de sus hijos terminados, o None."""
+    if resource is None:
+        return None, None
+    return (_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+            _mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+
+
+def medir_pipeline(nombre, corpus, args):
+    """Ejecuta un pipeline sobre su parte del corpus y retorna sus métricas."""
+    with open(os.path.join(corpus, "corpus.json"), encoding="utf-8") as archivo:
+        documentos = [d for d in json.load(archivo)["documentos"] if d["tipo"] == nombre]
+
+    inicio = time.perf_counter()
+    try:
+        etapas, entradas = ETAPAS[nombre](corpus, args)
+    except Exception as e:
+        return {"omitido": f"{type(e).__name__}: {e}"}
+    segundos_carga = time.perf_counter() - inicio
+
+    pipeline = Pipeline(etapas, tam_cola=args.tam_cola)
+    inicio = time.perf_counter()
+    resultados = sum(1 for _ in pipeline.ejecutar(entradas))
+    segundos = time.perf_counter() - inicio
+
+    paginas = sum(d["paginas"] for d in documentos)
+    rss, rss_hijos = pico_memoria()
+    return {
+        "documentos": len(documentos),
+        "paginas": paginas,
+        "resultados": resultados,
+        "segundos_carga": round(segundos_carga, 3),
+        "segundos": round(segundos, 3),
+        "paginas_por_segundo": round(paginas / segundos, 2) if segundos else 0.0,
+        "cuello_de_botella": pipeline.cuello_de_botella(),
+        "rss_pico_mb": rss,
+        "rss_pico_hijos_mb": rss_hijos,
+        "etapas": {
+            etapa: {clave: metricas[clave] for clave in (
+                "modo", "workers", "entradas", "errores", "por_segundo", "latencia_p50_s",
+                "latencia_p95_s", "utilizacion", "cola_max")}
+            for etapa, metricas in pipeline.estadisticas().items()
+        },
+    }
+
+
+# ---- Orquestación (en el proceso principal) ----
+
+def _git(*argumentos):
+    try:
+        return subprocess.run(["git", *argumentos], cwd=RAIZ, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def iniciar_stubs(latencia_ocr, latencia_llm):
+    """Arranca los servidores simulados de Azure Read y OpenAI. Retorna (servidores, variables de entorno)."""
+    sys.path.append(os.path.join(RAIZ, "Documentos escaneados"))
+    import azure_read_stub
+    from comun import stub_openai
+
+    azure, endpoint = azure_read_stub.iniciar_servidor(latencia=latencia_ocr)
+    openai, base_url = stub_openai.iniciar_servidor(latencia=latencia_llm)
+    entorno = {
+        "AZURE_VISION_ENDPOINT": endpoint,
+        "AZURE_VISION_KEY": "benchmark",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "benchmark",
+    }
+    return (azure, openai), entorno
+
+
+def ejecutar_en_proceso(nombre, corpus, args, entorno):
+    """Lanza este script con --interno para medir un pipeline en un proceso limpio."""
+    with tempfile.TemporaryDirectory() as carpeta:
+        salida = os.path.join(carpeta, "resultado.json")
+        comando = [sys.executable, os.path.abspath(__file__), "--interno", nombre, "--resultado", salida,
+                   "--corpus", corpus, "--workers", str(args.workers), "--tam-cola", str(args.tam_cola),
+                   "--ocr-en-vuelo", str(args.ocr_en_vuelo), "--llm-concurrencia", str(args.llm_concurrencia)]
+        # La salida de los scripts (trazas de depuración) no interesa
+        proceso = subprocess.run(comando, env={**os.environ, **entorno}, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, text=True)
+        if proceso.returncode != 0 or not os.path.exists(salida):
+            return {"error": proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else
+                    f"código de salida {proceso.returncode}"}
+        with open(salida, encoding="utf-8") as archivo:
+            return json.load(archivo)
+
+
+def imprimir_resumen(resultados):
+    print(f"{'pipeline':<13} {'docs':>5} {'págs':>5} {'seg':>7} {'págs/s':>8} {'cuello':>12} "
+          f"{'RSS MB':>7} {'hijos MB':>9}")
+    for nombre, r in resultados.items():
+        if "paginas" not in r:
+            print(f"{nombre:<13} {r.get('omitido') or r.get('error')}")
+            continue
+        print(f"{nombre:<13} {r['documentos']:>5} {r['paginas']:>5} {r['segundos']:>7} "
+              f"{r['paginas_por_segundo']:>8} {r['cuello_de_botella'] or '-':>12} "
+              f"{r['rss_pico_mb'] or '-':>7} {r['rss_pico_hijos_mb'] or '-':>9}")
+        for etapa, m in r["etapas"].items():
+            print(f"    {etapa:<12} p50 {m['latencia_p50_s'] * 1000:>8.1f} ms   "
+                  f"p95 {m['latencia_p95_s'] * 1000:>8.1f} ms   {m['por_segundo']:>8}/s   "
+                  f"util. {m['utilizacion']:.0%}   errores {m['errores']}")
+
+
+def comparar(base, actual):
+    """Imprime la variación de páginas/s y de p95 por etapa respecto a una ejecución anterior."""
+    print(f"Comparación con {base['commit'] or 'ejecución anterior'} ({base['fecha']}):")
+    if base["corpus"]["semilla"] != actual["corpus"]["semilla"] or \
+            base["corpus"]["paginas"] != actual["corpus"]["paginas"]:
+        print("  Aviso: los corpus son distintos (semilla o páginas); las cifras no son comparables")
+    for nombre, r in actual["pipelines"].items():
+        anterior = base["pipelines"].get(nombre, {})
+        if "paginas_por_segundo" not in r or "paginas_por_segundo" not in anterior:
+            continue
+        cambio = r["paginas_por_segundo"] / anterior["paginas_por_segundo"] if anterior["paginas_por_segundo"] else 0
+        print(f"  {nombre:<13} {anterior['paginas_por_segundo']:>8} -> {r['paginas_por_segundo']:>8} págs/s "
+              f"({cambio:.2f}x)")
+        for etapa, m in r["etapas"].items():
+            previa = anterior["etapas"].get(etapa)
+            if previa:
+                print(f"      {etapa:<12} p95 {previa['latencia_p95_s'] * 1000:>8.1f} -> "
+                      f"{m['latencia_p95_s'] * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de los pipelines con un corpus sintético")
+    parser.add_argument("--corpus", help="carpeta del corpus (si no tiene corpus.json, se genera en ella)")
+    parser.add_argument("--documentos", type=int, default=20, help="documentos de cada tipo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--max-paginas", type=int, default=3)
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=PIPELINES)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="procesos de renderizado/texto e hilos de OCR local")
+    parser.add_argument("--tam-cola", type=int, default=32)
+    parser.add_argument("--ocr-en-vuelo", type=int, default=16)
+    parser.add_argument("--llm-concurrencia", type=int, default=8)
+    parser.add_argument("--latencia-ocr", type=float, default=0.3, help="segundos por página del Azure simulado")
+    parser.add_argument("--latencia-llm", type=float, default=0.5, help="segundos por respuesta del OpenAI simulado")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto, bench_pipelines_<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    # Uso interno: medir un pipeline en un proceso hijo
+    parser.add_argument("--interno", choices=PIPELINES, help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno:
+        metricas = medir_pipeline(args.interno, args.corpus, args)
+        with open(args.resultado, "w", encoding="utf-8") as archivo:
+            json.dump(metricas, archivo)
+        sys.exit(0)
+
+    temporal = None
+    if args.corpus is None:
+        temporal = tempfile.TemporaryDirectory()
+        args.corpus = temporal.name
+    if os.path.exists(os.path.join(args.corpus, "corpus.json")):
+        with open(os.path.join(args.corpus, "corpus.json"), encoding="utf-8") as archivo:
+            corpus = json.load(archivo)
+        segundos_corpus = None
+        print(f"Corpus existente en {args.corpus}")
+    else:
+        inicio = time.perf_counter()
+        corpus = generar_corpus(args.corpus, args.documentos, args.semilla, args.max_paginas, args.pipelines)
+        segundos_corpus = round(time.perf_counter() - inicio, 2)
+        print(f"Corpus generado en {segundos_corpus} s: {len(corpus['documentos'])} documentos")
+
+    servidores, entorno = iniciar_stubs(args.latencia_ocr, args.latencia_llm)
+    resultados = {}
+    try:
+        for nombre in args.pipelines:
+            print(f"Midiendo {nombre}...")
+            resultados[nombre] = ejecutar_en_proceso(nombre, args.corpus, args, entorno)
+    finally:
+        for servidor in servidores:
+            servidor.shutdown()
+        if temporal is not None:
+            temporal.cleanup()
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    informe = {
+        "commit": commit,
+        "cambios_sin_commit": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {clave: valor for clave, valor in vars(args).items()
+                       if clave not in ("corpus", "salida", "comparar", "interno", "resultado")},
+        "corpus": {"semilla": corpus["semilla"], "documentos": len(corpus["documentos"]),
+                   "paginas": sum(d["paginas"] for d in corpus["documentos"]),
+                   "segundos_generacion": segundos_corpus},
+        "pipelines": resultados,
+    }
+    salida = args.salida or f"bench_pipelines_{commit or 'sin_git'}.json"
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(informe, archivo, ensure_ascii=False, indent=2)
+
+    imprimir_resumen(resultados)
+    print(f"Resultados guardados en {salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            comparar(json.load(archivo), informe)
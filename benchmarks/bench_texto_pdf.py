@@ -0,0 +1,128 @@
+"""
+Benchmark de la extracción de texto de PDFs con capa de texto: el bucle original de
+PyPDF2 con text += page.extract_text() frente a comun.texto_pdf (PyPDF2 o PyMuPDF,
+páginas unidas con join) y frente a la parada temprana en cuanto están los campos.
+
+Genera extractos de 50 a 200 páginas con PyMuPDF (INVOICE #, Bill To:, líneas con
+importes en €, Discount/Tax, Notes/Terms), comprueba que extract_invoice_info de
+"PDF estructurado" da los mismos datos con ambos backends y mide el tiempo de cada uno.
+
+Uso:
+    python benchmarks/bench_texto_pdf.py --paginas 50 100 200 --repeticiones 3
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF, para generar los PDFs de prueba
+import PyPDF2
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(RAIZ)
+from comun.texto_pdf import leer_texto
+
+# Campos de cabecera para la parada temprana (están en la primera página)
+CAMPOS_CABECERA = [r'INVOICE\s*#\s*(\d+)', r'Bill\s*To\s*:\s*(.*)']
+
+PRODUCTOS = ["Consultoria", "Licencia anual", "Soporte tecnico", "Formacion", "Hosting", "Mantenimiento"]
+
+
+def generar_extracto(ruta, paginas, semilla=0):
+    """Crea un PDF de varias páginas: cabecera en la primera, totales en la última."""
+    rng = random.Random(semilla)
+    documento = fitz.open()
+    # Las fuentes base de PDF no tienen el símbolo €: se incrusta la fuente Unicode de PyMuPDF
+    fuente = fitz.Font("cjk").buffer
+    for numero in range(paginas):
+        pagina = documento.new_page()
+        pagina.insert_font(fontname="F0", fontbuffer=fuente)
+        lineas = []
+        if numero == 0:
+            lineas += [f"INVOICE # {rng.randint(1000, 99999)}", "Bill To: Distribuciones Garcia SL", ""]
+        for _ in range(35):
+            cantidad, precio = rng.randint(1, 9), rng.randint(5, 500)
+            lineas.append(f"{rng.choice(PRODUCTOS)} {cantidad} {precio} €{cantidad * precio:.2f}")
+        if numero == paginas - 1:
+            lineas += ["", f"Discount ({rng.randint(0, 20)}%) | Tax ({rng.choice([4, 10, 21])}%)",
+                       "Notes: Gracias por su confianza", "Terms: Pago a 30 dias"]
+        pagina.insert_text((50, 50), "\n".join(lineas), fontname="F0", fontsize=9)
+    documento.save(ruta)
+    documento.close()
+
+
+def original_pypdf2(ruta):
+    """El bucle que usaban los scripts: concatenación con += página a página."""
+    with open(ruta, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        text = ''
+        for page_num in range(len(pdf_reader.pages)):
+            text += pdf_reader.pages[page_num].extract_text()
+        return text
+
+
+def cargar_extract_invoice_info():
+    """Importa extract_invoice_info de 'PDF estructurado/main.py' (la carpeta tiene espacios)."""
+    carpeta = os.path.join(RAIZ, "PDF estructurado")
+    # main.py importa sus módulos hermanos (lote.py) como lo haría ejecutado desde su carpeta
+    if carpeta not in sys.path:
+        sys.path.append(carpeta)
+    spec = importlib.util.spec_from_file_location("pdf_estructurado", os.path.join(carpeta, "main.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def comprobar_equivalencia(ruta):
+    """Los datos de la factura no deben depender del backend de texto."""
+    modulo = cargar_extract_invoice_info()
+    resultados = {}
+    # extract_invoice_info imprime el texto completo: se descarta durante la comprobación
+    salida = sys.stdout
+    try:
+        with open(os.devnull, "w") as nulo:
+            sys.stdout = nulo
+            for backend in ("pypdf2", "pymupdf"):
+                modulo.PDF_TEXT_BACKEND = backend
+                resultados[backend] = modulo.extract_invoice_info(ruta)
+    finally:
+        sys.stdout = salida
+    if resultados["pypdf2"] != resultados["pymupdf"]:
+        raise AssertionError(f"Resultados distintos según el backend:\n{resultados}")
+
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo de varias repeticiones, en segundos."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la extracción de texto de PDFs")
+    parser.add_argument("--paginas", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    metodos = {
+        "pypdf2 +=": lambda ruta: original_pypdf2(ruta),
+        "pypdf2 join": lambda ruta: leer_texto(ruta, backend="pypdf2"),
+        "pymupdf": lambda ruta: leer_texto(ruta, backend="pymupdf"),
+        "pymupdf cabecera": lambda ruta: leer_texto(ruta, backend="pymupdf", campos_requeridos=CAMPOS_CABECERA),
+    }
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        print(f"{'páginas':>8} " + " ".join(f"{nombre + ' (ms)':>22}" for nombre in metodos))
+        for paginas in args.paginas:
+            ruta = os.path.join(carpeta, f"extracto_{paginas}.pdf")
+            generar_extracto(ruta, paginas)
+            comprobar_equivalencia(ruta)
+            tiempos = [medir(lambda: funcion(ruta), args.repeticiones) for funcion in metodos.values()]
+            print(f"{paginas:>8} " + " ".join(f"{t * 1000:>22.1f}" for t in tiempos))
+    print("Equivalencia comprobada: extract_invoice_info da los mismos datos con ambos backends")
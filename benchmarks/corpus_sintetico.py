@@ -0,0 +1,268 @@
+"""
+Generador de corpus sintéticos de facturas para los benchmarks de los pipelines.
+
+Con la misma semilla se generan exactamente los mismos documentos, así que dos
+ejecuciones del benchmark (por ejemplo, en commits distintos) miden el mismo trabajo.
+
+Tipos de documento (una carpeta por tipo dentro del corpus):
+- estructurado: PDF con capa de texto en el formato de 'PDF estructurado' (INVOICE #,
+  Bill To:, líneas de ítems con importes en €, Discount/Tax, Notes/Terms)
+- ia: PDF con capa de texto con los campos en español (Fecha, Número, Cliente, NIF,
+  SUBTOTAL, IVA, TOTAL A PAGAR...), para 'PDF no estructurado (IA)'
+- escaneados: los mismos campos en español, rasterizados en gris con ruido (fondo no
+  blanco, grano y motas), sin capa de texto, para 'Documentos escaneados'
+- imagen: una página escaneada suelta en PNG, como la captura de 'Imagen estructurado (OCR)'
+
+En corpus.json se guardan los parámetros y, por documento, su tipo, páginas y los
+valores de los campos que se escribieron.
+
+Uso:
+    python benchmarks/corpus_sintetico.py corpus --documentos 50 --semilla 0
+"""
+import argparse
+import json
+import os
+import random
+
+import fitz  # PyMuPDF
+import numpy as np  # Para añadir el ruido a las páginas rasterizadas
+
+TIPOS = ("estructurado", "ia", "escaneados", "imagen")
+
+PRODUCTOS = ["Consultoria", "Licencia anual", "Soporte tecnico", "Formacion", "Hosting", "Mantenimiento"]
+CLIENTES = ["Distribuciones Garcia SL", "Talleres Ruiz e Hijos", "Panaderia La Espiga",
+            "Construcciones Norte SA", "Clinica Dental Sonrisa", "Libreria Cervantes"]
+CALLES = ["Calle Mayor 12", "Avda. de la Constitucion 45", "Plaza España 3", "Calle del Sol 78"]
+CIUDADES = ["Zaragoza", "Sevilla", "Valladolid", "Murcia", "Oviedo", "Alicante"]
+RELLENO = [
+    "Gracias por su confianza",
+    "Forma de pago: transferencia bancaria",
+    "Condiciones generales al dorso",
+    "Plazo de entrega 15 dias",
+]
+
+# Resolución de las páginas escaneadas (la habitual de un escáner de oficina en modo rápido)
+DPI_ESCANEO = 150
+
+# Las fuentes base de PDF no tienen el símbolo €: se incrusta la fuente Unicode de PyMuPDF
+_FUENTE = None
+
+
+def _fuente():
+    global _FUENTE
+    if _FUENTE is None:
+        _FUENTE = fitz.Font("cjk").buffer
+    return _FUENTE
+
+
+def _guardar(documento, ruta):
+    """
+    Guarda el PDF de forma reproducible: sin fechas ni identificador nuevo, y solo con
+    los caracteres usados de la fuente (la fuente completa ocupa unos 3 MB por archivo).
+    """
+    documento.subset_fonts()
+    documento.set_metadata({})
+    documento.save(ruta, garbage=3, deflate=True, no_new_id=True)
+    documento.close()
+
+
+def _escribir_pagina(documento, lineas, tamano=9):
+    pagina = documento.new_page()
+    pagina.insert_font(fontname="F0", fontbuffer=_fuente())
+    pagina.insert_text((50, 60), "\n".join(lineas), fontname="F0", fontsize=tamano)
+    return pagina
+
+
+def campos_estructurado(rng):
+    """Valores de una factura en el formato de 'PDF estructurado'."""
+    return {
+        "invoice_number": str(rng.randint(1000, 99999)),
+        "bill_to": rng.choice(CLIENTES),
+        "discount": rng.randint(0, 20),
+        "tax": rng.choice([4, 10, 21]),
+        "notes": "Gracias por su confianza",
+        "terms": "Pago a 30 dias",
+    }
+
+
+def generar_estructurado(ruta, rng, paginas=1):
+    """PDF con capa de texto: cabecera en la primera página, totales en la última."""
+    campos = campos_estructurado(rng)
+    documento = fitz.open()
+    for numero in range(paginas):
+        lineas = []
+        if numero == 0:
+            lineas += [f"INVOICE # {campos['invoice_number']}", f"Bill To: {campos['bill_to']}", ""]
+        for _ in range(rng.randint(10, 35)):
+            cantidad, precio = rng.randint(1, 9), rng.randint(5, 500)
+            lineas.append(f"{rng.choice(PRODUCTOS)} {cantidad} {precio} €{cantidad * precio:.2f}")
+        if numero == paginas - 1:
+            lineas += ["", f"Discount ({campos['discount']}%) | Tax ({campos['tax']}%)",
+                       f"Notes: {campos['notes']}", f"Terms: {campos['terms']}"]
+        _escribir_pagina(documento, lineas)
+    _guardar(documento, ruta)
+    return campos
+
+
+def campos_espanol(rng):
+    """Valores de una factura con los campos de comun/patrones_factura.py."""
+    subtotal = rng.randint(100, 9000)
+    return {
+        "fecha": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2023",
+        "numero": str(rng.randint(1000, 99999)),
+        "cliente": rng.choice(CLIENTES),
+        "domicilio": rng.choice(CALLES),
+        "ciudad": rng.choice(CIUDADES),
+        "nif": f"B{rng.randint(10000000, 99999999)}",
+        "subtotal": f"{subtotal},00",
+        "iva": f"{subtotal * 21 // 100},00",
+        "total": f"{subtotal * 121 // 100},00",
+    }
+
+
+def lineas_espanol(rng, campos, completa=True):
+    """Líneas de una página en español; las de continuación solo llevan detalle."""
+    lineas = []
+    if completa:
+        lineas += [
+            f"Fecha: {campos['fecha']}",
+            f"Número: {campos['numero']}",
+            f"Cliente: {campos['cliente']}",
+            f"Domicilio: {campos['domicilio']}",
+            f"Ciudad: {campos['ciudad']}",
+            f"DNI/NIF: {campos['nif']}",
+            "",
+        ]
+    lineas.append("Unidades    Descripcion    Precio")
+    for _ in range(rng.randint(5, 15)):
+        lineas.append(f"{rng.randint(1, 9)}   {rng.choice(PRODUCTOS)}   {rng.randint(5, 500)},{rng.randint(0, 99):02d}")
+    lineas += ["", rng.choice(RELLENO)]
+    if completa:
+        lineas += [
+            "Publicidad en prensa regional",
+            f"SUBTOTAL: {campos['subtotal']}",
+            f"IVA 21%: {campos['iva']}",
+            f"TOTAL A PAGAR: {campos['total']}",
+        ]
+    return lineas
+
+
+def _documento_espanol(rng, paginas):
+    campos = campos_espanol(rng)
+    documento = fitz.open()
+    for numero in range(paginas):
+        # Los datos van en la primera página; el resto son hojas de detalle
+        _escribir_pagina(documento, lineas_espanol(rng, campos, completa=(numero == 0)), tamano=11)
+    return documento, campos
+
+
+def generar_ia(ruta, rng, paginas=1):
+    """PDF con capa de texto y los campos en español."""
+    documento, campos = _documento_espanol(rng, paginas)
+    _guardar(documento, ruta)
+    return campos
+
+
+def ensuciar(gris, rng):
+    """
+    Simula un escaneo: fondo gris irregular, grano y motas. gris es un array 2D uint8;
+    el ruido sale de un generador de Numpy con semilla tomada de rng (reproducible).
+    """
+    generador = np.random.default_rng(rng.randrange(2 ** 32))
+    alto, ancho = gris.shape
+    imagen = gris.astype(np.int16)
+    # Fondo: papel algo más oscuro por un lado (iluminación irregular del escáner)
+    imagen -= np.linspace(0, rng.randint(10, 40), ancho, dtype=np.int16)[np.newaxis, :]
+    # Grano
+    imagen += generador.normal(0, rng.uniform(6, 14), size=(alto, ancho)).astype(np.int16)
+    # Motas oscuras (polvo, restos de grapas)
+    motas = generador.random((alto, ancho)) < 0.0015
+    imagen[motas] = generador.integers(0, 90, size=int(motas.sum()))
+    return np.clip(imagen, 0, 255).astype(np.uint8)
+
+
+def rasterizar(pagina, rng, dpi=DPI_ESCANEO, formato="png"):
+    """Rasteriza una página en gris y la ensucia. Retorna los bytes de la imagen (png o jpg)."""
+    pix = pagina.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    gris = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    sucia = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, ensuciar(gris, rng).tobytes(), False)
+    if formato == "jpg":
+        return sucia.tobytes("jpg", jpg_quality=75)
+    return sucia.tobytes(formato)
+
+
+def generar_escaneado(ruta, rng, paginas=1, dpi=DPI_ESCANEO):
+    """
+    PDF solo con imágenes: cada página es el escaneo con ruido de una página en español.
+    Las páginas van en JPEG, como las guardan los escáneres (con PNG el ruido no se comprime).
+    """
+    original, campos = _documento_espanol(rng, paginas)
+    documento = fitz.open()
+    for pagina in original:
+        nueva = documento.new_page(width=pagina.rect.width, height=pagina.rect.height)
+        nueva.insert_image(nueva.rect, stream=rasterizar(pagina, rng, dpi, "jpg"))
+    original.close()
+    _guardar(documento, ruta)
+    return campos
+
+
+def generar_imagen(ruta, rng, dpi=DPI_ESCANEO):
+    """PNG de una página escaneada con ruido y los campos en español."""
+    original, campos = _documento_espanol(rng, 1)
+    with open(ruta, "wb") as archivo:
+        archivo.write(rasterizar(original[0], rng, dpi))
+    original.close()
+    return campos
+
+
+def generar_corpus(carpeta, documentos=20, semilla=0, max_paginas=3, tipos=TIPOS, dpi=DPI_ESCANEO):
+    """
+    Genera el corpus en carpeta/<tipo>/ y escribe carpeta/corpus.json.
+
+    Parámetros:
+    - carpeta: carpeta de salida (se crea si no existe)
+    - documentos: documentos de cada tipo
+    - semilla: semilla de los generadores aleatorios
+    - max_paginas: páginas máximas de cada PDF (entre 1 y max_paginas)
+    - tipos: tipos de documento a generar (ver TIPOS)
+    - dpi: resolución de las páginas escaneadas
+
+    Retorna:
+    - El contenido de corpus.json (diccionario)
+    """
+    generadores = {
+        "estructurado": lambda ruta, rng, paginas: generar_estructurado(ruta, rng, paginas),
+        "ia": lambda ruta, rng, paginas: generar_ia(ruta, rng, paginas),
+        "escaneados": lambda ruta, rng, paginas: generar_escaneado(ruta, rng, paginas, dpi),
+        "imagen": lambda ruta, rng, paginas: generar_imagen(ruta, rng, dpi),
+    }
+    corpus = {"semilla": semilla, "documentos_por_tipo": documentos, "max_paginas": max_paginas,
+              "dpi": dpi, "documentos": []}
+    for tipo in tipos:
+        os.makedirs(os.path.join(carpeta, tipo), exist_ok=True)
+        # Un generador por tipo: añadir o quitar un tipo no cambia los documentos de los demás
+        rng = random.Random(f"{semilla}-{tipo}")
+        extension = ".png" if tipo == "imagen" else ".pdf"
+        for numero in range(documentos):
+            paginas = 1 if tipo == "imagen" else rng.randint(1, max_paginas)
+            archivo = os.path.join(tipo, f"{tipo}_{numero:04d}{extension}")
+            campos = generadores[tipo](os.path.join(carpeta, archivo), rng, paginas)
+            corpus["documentos"].append({"archivo": archivo, "tipo": tipo, "paginas": paginas, "campos": campos})
+    with open(os.path.join(carpeta, "corpus.json"), "w", encoding="utf-8") as archivo:
+        json.dump(corpus, archivo, ensure_ascii=False, indent=2)
+    return corpus
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un corpus sintético de facturas")
+    parser.add_argument("carpeta")
+    parser.add_argument("--documentos", type=int, default=20, help="documentos de cada tipo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--max-paginas", type=int, default=3)
+    parser.add_argument("--tipos", nargs="+", default=list(TIPOS), choices=TIPOS)
+    parser.add_argument("--dpi", type=int, default=DPI_ESCANEO)
+    args = parser.parse_args()
+
+    corpus = generar_corpus(args.carpeta, args.documentos, args.semilla, args.max_paginas, args.tipos, args.dpi)
+    paginas = sum(documento["paginas"] for documento in corpus["documentos"])
+    print(f"{len(corpus['documentos'])} documentos ({paginas} páginas) en {args.carpeta}")
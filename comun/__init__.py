@@ -0,0 +1,6 @@
+"""
+Módulos compartidos entre los distintos pipelines de extracción de facturas.
+
+Las carpetas de cada pipeline tienen espacios en el nombre y no son paquetes de Python,
+así que cada script añade la raíz del repositorio a sys.path para importar 'comun'.
+"""
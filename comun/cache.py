@@ -0,0 +1,246 @@
+"""
+Caché persistente en disco para resultados costosos (OCR, llamadas a IA).
+
+- Almacenamiento en SQLite (incluido en Python, sin dependencias extra)
+- Claves direccionadas por contenido: hash de la imagen/texto + configuración del motor
+- Desalojo LRU cuando el tamaño total supera un límite en bytes
+- Caducidad opcional (TTL) de las entradas
+- Contadores de aciertos y fallos para medir su efectividad
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from comun.metricas import CACHE
+
+
+def hash_contenido(contenido):
+    """
+    Calcula el hash SHA-256 de un contenido.
+
+    Parámetros:
+    - contenido: bytes, texto o ruta de un archivo en disco
+
+    Retorna:
+    - Cadena hexadecimal con el hash
+    """
+    sha = hashlib.sha256()
+    if isinstance(contenido, (bytes, bytearray)):
+        sha.update(contenido)
+    elif os.path.isfile(contenido):
+        # Lee el archivo por bloques para no cargar imágenes grandes completas en memoria
+        with open(contenido, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(1024 * 1024), b''):
+                sha.update(bloque)
+    else:
+        sha.update(contenido.encode('utf-8'))
+    return sha.hexdigest()
+
+
+def clave_ocr(imagen, motor, config='', idioma=''):
+    """
+    Construye la clave de caché de un resultado OCR.
+
+    Parámetros:
+    - imagen: bytes de la imagen o ruta al archivo
+    - motor: nombre del motor OCR (ej: "tesseract", "azure-read")
+    - config: configuración del motor (ej: "--oem 3 --psm 6")
+    - idioma: idioma(s) del OCR (ej: "spa")
+
+    Retorna:
+    - Clave única: cambia si cambia el contenido de la página o la configuración
+    """
+    return hash_contenido(imagen) + ':' + hash_contenido(f'{motor}|{config}|{idioma}')[:16]
+
+
+def normalizar_texto(texto):
+    """
+    Normaliza el texto de una factura para que pequeñas diferencias de formato
+    (espacios, saltos de línea, formas Unicode equivalentes) no cambien la clave.
+    No se cambian mayúsculas/minúsculas: forman parte de los valores extraídos.
+    """
+    texto = unicodedata.normalize('NFKC', texto)
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def clave_llm(texto, plantilla, modelo, max_tokens):
+    """
+    Construye la clave de caché de una respuesta del LLM.
+
+    Parámetros:
+    - texto: texto de la factura (OCR o PDF); se normaliza antes de calcular el hash
+    - plantilla: plantilla del prompt (incluye campos pedidos y mensaje de sistema)
+    - modelo: nombre del modelo (ej: "gpt-3.5-turbo")
+    - max_tokens: límite de tokens de la respuesta
+    """
+    return hash_contenido(normalizar_texto(texto)) + ':' + hash_contenido(
+        f'{plantilla}|{modelo}|{max_tokens}'
+    )[:16]
+
+
+class CacheDisco:
+    """
+    Caché clave -> texto persistida en un archivo SQLite.
+
+    Uso:
+        with CacheDisco('ocr_cache.sqlite') as cache:
+            texto = cache.obtener(clave)
+            if texto is None:
+                texto = ocr(...)
+                cache.guardar(clave, texto)
+
+    Es segura para usarse desde varios hilos del mismo proceso.
+    """
+
+    def __init__(self, ruta, max_bytes=512 * 1024 * 1024, ttl=None):
+        """
+        Parámetros:
+        - ruta: archivo SQLite donde se guarda la caché (se crea si no existe)
+        - max_bytes: tamaño máximo de los valores almacenados; al superarlo se
+          eliminan las entradas usadas hace más tiempo (LRU)
+        - ttl: segundos de validez de cada entrada desde que se guardó (None = sin caducidad)
+        """
+        self.ruta = ruta
+        # Nombre de la caché en las métricas (ej: "ocr_cache")
+        self.nombre = os.path.splitext(os.path.basename(ruta))[0]
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self.expirados = 0
+        self._lock = threading.Lock()
+
+        # check_same_thread=False: la conexión se comparte entre hilos, protegida por el lock
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        # WAL permite lecturas mientras otro proceso escribe
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' clave TEXT PRIMARY KEY,'
+            ' valor TEXT NOT NULL,'
+            ' tamano INTEGER NOT NULL,'
+            ' ultimo_acceso REAL NOT NULL,'
+            ' creado REAL NOT NULL DEFAULT 0)'
+        )
+        # Cachés creadas antes de existir la caducidad: se añade la columna 'creado'
+        columnas = [fila[1] for fila in self._conexion.execute('PRAGMA table_info(cache)')]
+        if 'creado' not in columnas:
+            self._conexion.execute('ALTER TABLE cache ADD COLUMN creado REAL NOT NULL DEFAULT 0')
+        self._conexion.execute('CREATE INDEX IF NOT EXISTS idx_acceso ON cache (ultimo_acceso)')
+        self._conexion.commit()
+
+        # Tamaño total actual, para no recalcularlo en cada escritura
+        self._tamano_total = self._conexion.execute(
+            'SELECT COALESCE(SUM(tamano), 0) FROM cache'
+        ).fetchone()[0]
+
+    def obtener(self, clave):
+        """
+        Retorna el valor guardado para la clave, o None si no existe.
+        """
+        with self._lock:
+            fila = self._conexion.execute(
+                'SELECT valor, tamano, creado FROM cache WHERE clave = ?', (clave,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                CACHE.inc(cache=self.nombre, resultado="fallo")
+                return None
+
+            ahora = time.time()
+            valor, tamano, creado = fila
+            if self.ttl is not None and ahora - creado > self.ttl:
+                # Entrada caducada: se elimina y cuenta como fallo
+                self._conexion.execute('DELETE FROM cache WHERE clave = ?', (clave,))
+                self._conexion.commit()
+                self._tamano_total -= tamano
+                self.expirados += 1
+                self.fallos += 1
+                CACHE.inc(cache=self.nombre, resultado="fallo")
+                return None
+
+            # Actualiza la marca de uso para el desalojo LRU
+            self._conexion.execute(
+                'UPDATE cache SET ultimo_acceso = ? WHERE clave = ?', (ahora, clave)
+            )
+            self._conexion.commit()
+            self.aciertos += 1
+            CACHE.inc(cache=self.nombre, resultado="acierto")
+            return valor
+
+    def guardar(self, clave, valor):
+        """
+        Guarda (o reemplaza) el valor de una clave y aplica el límite de tamaño.
+        """
+        tamano = len(valor.encode('utf-8'))
+        with self._lock:
+            anterior = self._conexion.execute(
+                'SELECT tamano FROM cache WHERE clave = ?', (clave,)
+            ).fetchone()
+            ahora = time.time()
+            self._conexion.execute(
+                'INSERT OR REPLACE INTO cache (clave, valor, tamano, ultimo_acceso, creado) VALUES (?, ?, ?, ?, ?)',
+                (clave, valor, tamano, ahora, ahora)
+            )
+            self._tamano_total += tamano - (anterior[0] if anterior else 0)
+            self._desalojar()
+            self._conexion.commit()
+
+    def _desalojar(self):
+        """
+        Elimina las entradas caducadas y, si aún se supera max_bytes, las menos
+        usadas recientemente. Se llama con el lock adquirido.
+        """
+        if self.ttl is not None and self._tamano_total > self.max_bytes:
+            limite = time.time() - self.ttl
+            caducado = self._conexion.execute(
+                'SELECT COALESCE(SUM(tamano), 0) FROM cache WHERE creado < ?', (limite,)
+            ).fetchone()[0]
+            if caducado:
+                self._conexion.execute('DELETE FROM cache WHERE creado < ?', (limite,))
+                self._tamano_total -= caducado
+
+        if self._tamano_total <= self.max_bytes:
+            return
+
+        exceso = self._tamano_total - self.max_bytes
+        liberado = 0
+        claves = []
+        for clave, tamano in self._conexion.execute(
+            'SELECT clave, tamano FROM cache ORDER BY ultimo_acceso'
+        ):
+            claves.append((clave,))
+            liberado += tamano
+            if liberado >= exceso:
+                break
+
+        self._conexion.executemany('DELETE FROM cache WHERE clave = ?', claves)
+        self._tamano_total -= liberado
+
+    def estadisticas(self):
+        """
+        Retorna un diccionario con aciertos, fallos (incluidos los caducados),
+        tasa de aciertos y tamaño en bytes.
+        """
+        total = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'expirados': self.expirados,
+            'tasa_aciertos': self.aciertos / total if total else 0.0,
+            'bytes': self._tamano_total,
+        }
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
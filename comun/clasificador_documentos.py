@@ -0,0 +1,178 @@
+"""
+Clasificador rápido de PDFs: decide qué procesador necesita cada página antes de
+gastar OCR o llamadas al LLM.
+
+- Por cada página se mide el texto de la capa de texto (caracteres no blancos) y la
+  fracción de la página cubierta por imágenes, sin renderizar nada
+- Página con capa de texto suficiente: se procesa con el texto del PDF. Si el documento
+  coincide con un diseño conocido (DISENOS) va al procesador de ese diseño (regex);
+  si no, al LLM
+- Página cubierta por imágenes y con poco o ningún texto: es un escaneo y necesita OCR
+- Página sin texto ni imágenes: si tiene trazos vectoriales (texto convertido en curvas)
+  necesita OCR; si no, está en blanco y no se procesa
+- Un documento mixto (por ejemplo, factura digital + albarán escaneado) se reparte
+  página a página
+
+Uso:
+    clasificacion = clasificar_pdf("factura.pdf")
+    for procesador, paginas in clasificacion.rutas.items():
+        ...
+
+    python -m comun.clasificador_documentos factura1.pdf factura2.pdf
+"""
+import re
+import sys
+from collections import namedtuple
+
+import fitz
+
+# Caracteres (sin contar espacios) a partir de los cuales la capa de texto se considera
+# útil. Los escaneos con una capa OCR vacía o con solo un sello suelen quedar por debajo
+MIN_CARACTERES = 50
+
+# Fracción de la página cubierta por imágenes a partir de la cual, sin texto, es un escaneo
+MIN_COBERTURA_IMAGEN = 0.3
+
+# Trazos vectoriales a partir de los cuales una página sin texto ni imágenes se trata
+# como texto dibujado (necesita OCR) y no como página en blanco
+MIN_TRAZOS = 50
+
+# Tipos de página
+TEXTO = "texto"
+ESCANEADA = "escaneada"
+VACIA = "vacia"
+
+# Diseños de proveedor conocidos: nombre -> (procesador, marcas). Un documento tiene el
+# diseño si su texto contiene todas las marcas; entonces sus páginas con texto van al
+# procesador del diseño en lugar de al LLM
+DISENOS = {
+    # Las facturas que entiende la regex de 'PDF estructurado'. Las marcas son las de la
+    # cabecera, que está en la primera página (los totales pueden ir en otra)
+    "invoice_regex": ("estructurado", [
+        r'INVOICE\s*#\s*\d+',
+        r'Bill\s*To\s*:',
+    ]),
+}
+
+# Procesador de cada tipo de página (las de texto sin diseño conocido van al LLM)
+PROCESADOR_TEXTO = "ia"
+PROCESADOR_ESCANEADA = "escaneados"
+
+# Clasificación de una página
+# - pagina: índice (empezando en 0)
+# - tipo: TEXTO, ESCANEADA o VACIA
+# - caracteres: caracteres no blancos de la capa de texto
+# - cobertura_imagen: fracción (0-1) de la página cubierta por imágenes
+ClasificacionPagina = namedtuple('ClasificacionPagina', ['pagina', 'tipo', 'caracteres', 'cobertura_imagen'])
+
+# Clasificación de un documento
+# - paginas: ClasificacionPagina de cada página
+# - diseno: nombre del diseño conocido, o None
+# - rutas: diccionario procesador -> índices de página, en orden
+ClasificacionDocumento = namedtuple('ClasificacionDocumento', ['ruta', 'paginas', 'diseno', 'rutas'])
+
+_BLANCOS = re.compile(r'\s+')
+
+
+def _compilar(disenos):
+    return {nombre: (procesador, [re.compile(marca) for marca in marcas])
+            for nombre, (procesador, marcas) in disenos.items()}
+
+
+_DISENOS_COMPILADOS = _compilar(DISENOS)
+
+
+def cobertura_imagenes(pagina):
+    """
+    Fracción de la página cubierta por imágenes (0-1). Se usan las cajas donde se
+    dibuja cada imagen, sin decodificarlas; los solapes se cuentan una vez si una
+    caja contiene a la otra (el caso habitual: fondo + sello).
+    """
+    area_pagina = abs(pagina.rect)
+    if not area_pagina:
+        return 0.0
+    cajas = []
+    for info in pagina.get_image_info():
+        caja = fitz.Rect(info["bbox"]) & pagina.rect
+        if caja.is_empty or any(caja in otra for otra in cajas):
+            continue
+        cajas = [otra for otra in cajas if otra not in caja] + [caja]
+    return min(1.0, sum(abs(caja) for caja in cajas) / area_pagina)
+
+
+def clasificar_pagina(pagina, min_caracteres=MIN_CARACTERES, min_cobertura=MIN_COBERTURA_IMAGEN):
+    """
+    Clasifica una página de PyMuPDF.
+
+    Retorna:
+    - (ClasificacionPagina, texto de la página)
+    """
+    texto = pagina.get_text()
+    caracteres = len(_BLANCOS.sub('', texto))
+    cobertura = cobertura_imagenes(pagina)
+    if caracteres >= min_caracteres:
+        tipo = TEXTO
+    elif cobertura >= min_cobertura:
+        tipo = ESCANEADA
+    elif caracteres:
+        # Página digital con poco texto (ej: la última, con solo los totales)
+        tipo = TEXTO
+    elif cobertura or len(pagina.get_drawings()) >= MIN_TRAZOS:
+        # Solo se miran los trazos en este caso, el único en que hacen falta
+        tipo = ESCANEADA
+    else:
+        tipo = VACIA
+    return ClasificacionPagina(pagina.number, tipo, caracteres, round(cobertura, 3)), texto
+
+
+def diseno_conocido(texto, disenos=None):
+    """Nombre del primer diseño cuyas marcas aparecen todas en el texto, o None."""
+    compilados = _DISENOS_COMPILADOS if disenos is None else _compilar(disenos)
+    for nombre, (_, marcas) in compilados.items():
+        if all(marca.search(texto) for marca in marcas):
+            return nombre
+    return None
+
+
+def clasificar_pdf(ruta, min_caracteres=MIN_CARACTERES, min_cobertura=MIN_COBERTURA_IMAGEN, disenos=None):
+    """
+    Clasifica las páginas de un PDF y decide el procesador de cada una.
+
+    Parámetros:
+    - ruta: ruta del PDF
+    - min_caracteres, min_cobertura: umbrales de página con texto y de página escaneada
+    - disenos: diccionario de diseños como DISENOS (por defecto, DISENOS)
+
+    Retorna:
+    - ClasificacionDocumento
+    """
+    disenos = DISENOS if disenos is None else disenos
+    paginas = []
+    textos = []
+    with fitz.open(ruta) as documento:
+        for pagina in documento:
+            clasificacion, texto = clasificar_pagina(pagina, min_caracteres, min_cobertura)
+            paginas.append(clasificacion)
+            if clasificacion.tipo == TEXTO:
+                textos.append(texto)
+
+    # El diseño se reconoce con el texto de todas las páginas con capa de texto
+    diseno = diseno_conocido("".join(textos), disenos) if textos else None
+    procesador_texto = disenos[diseno][0] if diseno else PROCESADOR_TEXTO
+
+    rutas = {}
+    for pagina in paginas:
+        if pagina.tipo == TEXTO:
+            rutas.setdefault(procesador_texto, []).append(pagina.pagina)
+        elif pagina.tipo == ESCANEADA:
+            rutas.setdefault(PROCESADOR_ESCANEADA, []).append(pagina.pagina)
+    return ClasificacionDocumento(ruta, paginas, diseno, rutas)
+
+
+if __name__ == "__main__":
+    for ruta in sys.argv[1:]:
+        clasificacion = clasificar_pdf(ruta)
+        print(f"{ruta}: diseño={clasificacion.diseno} rutas={clasificacion.rutas}")
+        for pagina in clasificacion.paginas:
+            print(f"  página {pagina.pagina + 1}: {pagina.tipo} "
+                  f"({pagina.caracteres} caracteres, {pagina.cobertura_imagen:.0%} imagen)")
@@ -0,0 +1,153 @@
+"""
+Servicio de conversión de documentos con Docling que mantiene los modelos cargados.
+
+- Los modelos de layout, tablas y OCR se cargan una sola vez al crear el servicio
+  (initialize_pipeline), no en cada documento ni en cada ejecución de un bucle
+- convertir_todos() convierte muchos documentos con convert_all, con concurrencia
+  limitada y un tiempo máximo por documento
+- Tiempos por etapa (layout, ocr, table_structure...) de cada documento y acumulados
+- Las etapas que no hacen falta se pueden desactivar: tablas, y OCR en PDFs digitales
+  (con capa de texto), que es la etapa más lenta
+
+Uso:
+    servicio = ConversorDocling(ocr=False, tablas=False, timeout_documento=60)
+    for resultado in servicio.convertir_todos(["factura1.pdf", "factura2.pdf"]):
+        if resultado.error is None:
+            datos = resultado.documento.export_to_dict()
+    print(servicio.estadisticas())
+"""
+import threading
+import time
+from collections import namedtuple, defaultdict
+
+from docling.datamodel.base_models import ConversionStatus, InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.datamodel.settings import settings
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+# Resultado de un documento.
+# - fuente: ruta o URL del documento
+# - documento: DoclingDocument convertido (None si falló)
+# - estado: "success", "partial_success" (por ejemplo, si se agotó el tiempo), "failure"...
+# - tiempos: diccionario etapa -> segundos (vacío si no se miden)
+# - error: descripción del error, o None
+ResultadoDocling = namedtuple('ResultadoDocling', ['fuente', 'documento', 'estado', 'tiempos', 'error'])
+
+
+class ConversorDocling:
+    """
+    Conversor Docling de larga duración: se crea una vez y se reutiliza para todos los
+    documentos. Se puede compartir entre hilos; las conversiones se serializan y la
+    concurrencia la reparte Docling internamente.
+    """
+
+    def __init__(self, ocr=True, tablas=True, timeout_documento=None, concurrencia=1,
+                 hilos_por_documento=None, medir_tiempos=True):
+        """
+        Parámetros:
+        - ocr: aplicar OCR a las imágenes y páginas escaneadas. En PDFs digitales el texto
+          ya viene en el PDF y se puede desactivar
+        - tablas: reconocer la estructura de las tablas
+        - timeout_documento: segundos máximos por documento (None = sin límite). Al
+          agotarse, Docling entrega las páginas ya convertidas como "partial_success"
+        - concurrencia: documentos que se convierten a la vez en convertir_todos()
+        - hilos_por_documento: hilos de los modelos por documento (None = los de Docling)
+        - medir_tiempos: registrar los tiempos de cada etapa
+        """
+        self.concurrencia = max(1, concurrencia)
+        self.medir_tiempos = medir_tiempos
+
+        opciones = PdfPipelineOptions()
+        opciones.do_ocr = ocr
+        opciones.do_table_structure = tablas
+        opciones.document_timeout = timeout_documento
+        if hilos_por_documento:
+            opciones.accelerator_options.num_threads = hilos_por_documento
+
+        # Ajustes globales de Docling: lotes de documentos y registro de tiempos
+        settings.perf.doc_batch_size = self.concurrencia
+        settings.perf.doc_batch_concurrency = self.concurrencia
+        settings.debug.profile_pipeline_timings = medir_tiempos
+
+        self._convertidor = DocumentConverter(
+            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=opciones)}
+        )
+        # Carga los modelos ahora, no en el primer documento
+        inicio = time.perf_counter()
+        self._convertidor.initialize_pipeline(InputFormat.PDF)
+        self.segundos_carga = time.perf_counter() - inicio
+
+        # Un lock para las conversiones (solo mientras Docling convierte, nunca mientras
+        # quien consume convertir_todos tiene un resultado en sus manos) y otro para los
+        # contadores, que se pueden consultar durante una conversión
+        self._lock_conversion = threading.Lock()
+        self._lock_estadisticas = threading.Lock()
+        self._tiempos_totales = defaultdict(float)
+        self._contadores = defaultdict(int)
+
+    def _tiempos(self, resultado):
+        """Segundos por etapa de un ConversionResult (suma de todas las páginas)."""
+        if not self.medir_tiempos:
+            return {}
+        return {etapa: sum(item.times) for etapa, item in resultado.timings.items()}
+
+    def _resultado(self, fuente, resultado):
+        estado = resultado.status.value
+        tiempos = self._tiempos(resultado)
+        error = None
+        if resultado.status not in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS):
+            error = "; ".join(e.error_message for e in resultado.errors) or estado
+        documento = resultado.document if error is None else None
+
+        with self._lock_estadisticas:
+            self._contadores[estado] += 1
+            for etapa, segundos in tiempos.items():
+                self._tiempos_totales[etapa] += segundos
+        return ResultadoDocling(fuente, documento, estado, tiempos, error)
+
+    def convertir(self, fuente):
+        """
+        Convierte un documento (ruta o URL).
+
+        Retorna:
+        - ResultadoDocling
+        """
+        return list(self.convertir_todos([fuente]))[0]
+
+    def convertir_todos(self, fuentes):
+        """
+        Convierte varios documentos; un documento que falla no detiene el resto.
+
+        Parámetros:
+        - fuentes: rutas o URLs
+
+        Retorna (generador):
+        - ResultadoDocling por cada fuente, en el mismo orden
+        """
+        fuentes = list(fuentes)
+        # convert_all es perezoso: cada next() convierte bajo el lock y el resultado se
+        # entrega fuera de él. Un consumidor lento, o uno que deja de iterar sin cerrar el
+        # generador, no bloquea las conversiones de los demás hilos
+        resultados = self._convertidor.convert_all(fuentes, raises_on_error=False)
+        try:
+            for fuente in fuentes:
+                with self._lock_conversion:
+                    resultado = next(resultados, None)
+                if resultado is None:
+                    return
+                yield self._resultado(fuente, resultado)
+        finally:
+            with self._lock_conversion:
+                resultados.close()
+
+    def estadisticas(self):
+        """
+        Retorna documentos por estado, segundos acumulados por etapa y el tiempo de carga
+        de los modelos.
+        """
+        with self._lock_estadisticas:
+            return {
+                "documentos": dict(self._contadores),
+                "segundos_por_etapa": dict(self._tiempos_totales),
+                "segundos_carga": self.segundos_carga,
+            }
@@ -0,0 +1,243 @@
+"""
+Extracción escalonada: expresiones regulares primero, LLM solo para lo que falte.
+
+1. Se aplican los patrones de comun/patrones_factura.py y se puntúa la confianza
+   de cada campo (qué patrón coincidió, si el valor tiene el formato esperado y si
+   Subtotal + IVA cuadran con el Total)
+2. Solo los campos por debajo del umbral se piden al LLM, y solo esos campos van
+   en el prompt
+3. Las facturas bien formadas se resuelven sin ninguna llamada de red
+"""
+import asyncio
+import json
+import re
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from comun.patrones_factura import escaner_patrones
+
+# Campo de los patrones -> nombre del campo en el prompt del LLM y en el CSV
+CAMPOS_REGEX_A_LLM = {
+    "fecha": "Fecha",
+    "numero": "Número",
+    "cliente": "Cliente",
+    "domicilio": "Domicilio",
+    "ciudad": "Ciudad",
+    "nif": "NIF",
+    "subtotal": "Subtotal",
+    "iva": "IVA",
+    "total_a_pagar": "Total a pagar",
+}
+
+# Confianza según el patrón que encontró el valor: el principal es el más preciso
+CONFIANZA_PATRON_PRINCIPAL = 0.9
+CONFIANZA_PATRON_ALTERNATIVO = 0.6
+
+# Etiquetas que no deberían aparecer dentro de un valor de texto (señal de que la
+# regex se comió la línea siguiente)
+_ETIQUETAS = re.compile(r"\b(?:Fecha|N[uú]mero|Cliente|Domicilio|Ciudad|NIF|DNI|SUBTOTAL|IVA|TOTAL)\b", re.IGNORECASE)
+
+# Resultado de una factura:
+# - datos: cadena JSON con los campos (mismo formato que la respuesta del LLM)
+# - origen: campo -> "regex" o "llm"
+# - confianza: campo -> confianza de la regex (0 a 1)
+ResultadoEscalonado = namedtuple('ResultadoEscalonado', ['datos', 'origen', 'confianza'])
+
+
+def _a_decimal(valor):
+    """Convierte importes como '1.234,56', '1,234.56' o '52.00' a Decimal (o None)."""
+    if not valor:
+        return None
+    limpio = re.sub(r"[^\d.,]", "", valor)
+    if "," in limpio and "." in limpio:
+        # El último separador es el decimal
+        if limpio.rfind(",") > limpio.rfind("."):
+            limpio = limpio.replace(".", "").replace(",", ".")
+        else:
+            limpio = limpio.replace(",", "")
+    elif "," in limpio:
+        limpio = limpio.replace(",", ".")
+    try:
+        return Decimal(limpio)
+    except InvalidOperation:
+        return None
+
+
+def _formato_valido(campo, valor):
+    """Comprueba que el valor tiene la forma esperada para su campo."""
+    if campo == "fecha":
+        partes = re.split(r"[/\-.]", valor)
+        if len(partes) != 3 or not all(p.isdigit() for p in partes):
+            return False
+        dia, mes = int(partes[0]), int(partes[1])
+        return 1 <= dia <= 31 and 1 <= mes <= 12
+    if campo == "numero":
+        return valor.isdigit()
+    if campo == "nif":
+        return len(valor) >= 7 and valor.isalnum()
+    if campo in ("subtotal", "iva", "total_a_pagar"):
+        return _a_decimal(valor) is not None
+    # Campos de texto libre: longitud razonable y sin otras etiquetas dentro
+    return 2 <= len(valor) <= 120 and not _ETIQUETAS.search(valor)
+
+
+def _cuadran_importes(subtotal, iva, total):
+    """
+    Comprueba si Subtotal, IVA y Total son coherentes. El IVA puede venir como
+    importe (subtotal + iva = total) o como porcentaje (subtotal * (1 + iva/100) = total).
+    """
+    subtotal, iva, total = _a_decimal(subtotal), _a_decimal(iva), _a_decimal(total)
+    if None in (subtotal, iva, total):
+        return False
+    tolerancia = Decimal("0.02")
+    return (abs(subtotal + iva - total) <= tolerancia
+            or abs(subtotal * (1 + iva / 100) - total) <= tolerancia)
+
+
+def extraer_con_confianza(texto):
+    """
+    Aplica los patrones regex y puntúa cada campo.
+
+    Retorna:
+    - Diccionario campo_regex -> (valor o None, confianza entre 0 y 1)
+    """
+    # Todos los campos en una sola pasada por el texto
+    encontrados = escaner_patrones.buscar_todos(texto)
+    resultados = {}
+    for campo in CAMPOS_REGEX_A_LLM:
+        valor, indice = encontrados[campo]
+        if valor is None:
+            resultados[campo] = (None, 0.0)
+            continue
+        confianza = CONFIANZA_PATRON_PRINCIPAL if indice == 0 else CONFIANZA_PATRON_ALTERNATIVO
+        if not _formato_valido(campo, valor):
+            confianza *= 0.3
+        resultados[campo] = (valor, confianza)
+
+    # Si los importes cuadran entre sí, los tres son fiables; si están los tres pero
+    # no cuadran, alguno está mal leído y se rebaja la confianza de todos
+    campos_importe = ("subtotal", "iva", "total_a_pagar")
+    importes = [resultados[c][0] for c in campos_importe]
+    if _cuadran_importes(*importes):
+        for campo in campos_importe:
+            resultados[campo] = (resultados[campo][0], 1.0)
+    elif None not in importes:
+        for campo in campos_importe:
+            resultados[campo] = (resultados[campo][0], resultados[campo][1] * 0.5)
+    return resultados
+
+
+class ExtractorEscalonado:
+    """
+    Combina la extracción por regex con el LLM.
+
+    Uso:
+        extractor = ExtractorEscalonado(motor_llm, umbral=0.7)
+        resultados = extractor.extraer_todos(textos)
+        print(extractor.estadisticas())
+    """
+
+    def __init__(self, motor_llm, umbral=0.7):
+        """
+        Parámetros:
+        - motor_llm: MotorExtraccionLLM con los campos completos (CAMPOS_REGEX_A_LLM)
+        - umbral: confianza mínima para aceptar el valor de la regex sin consultar al LLM
+        """
+        self.motor_llm = motor_llm
+        self.umbral = umbral
+        self.documentos = 0
+        self.documentos_sin_llm = 0
+        self.campos_regex = 0
+        self.campos_llm = 0
+
+    def extraer_todos(self, textos):
+        """
+        Extrae los campos de todas las facturas.
+
+        Retorna:
+        - Lista de ResultadoEscalonado en el mismo orden que los textos. Si la
+          llamada al LLM de una factura falla, su posición contiene la excepción.
+        """
+        resultados = [None] * len(textos)
+
+        # Facturas agrupadas por el conjunto de campos que hay que pedir al LLM:
+        # cada grupo usa un prompt con solo esos campos
+        por_campos = {}
+        for i, texto in enumerate(textos):
+            regex = extraer_con_confianza(texto)
+            datos = {}
+            origen = {}
+            faltan = []
+            for campo_regex, campo_llm in CAMPOS_REGEX_A_LLM.items():
+                valor, confianza = regex[campo_regex]
+                if confianza >= self.umbral:
+                    datos[campo_llm] = valor
+                    origen[campo_llm] = "regex"
+                else:
+                    faltan.append(campo_llm)
+            confianzas = {CAMPOS_REGEX_A_LLM[c]: regex[c][1] for c in regex}
+            resultados[i] = ResultadoEscalonado(datos, origen, confianzas)
+
+            self.documentos += 1
+            self.campos_regex += len(datos)
+            if faltan:
+                por_campos.setdefault(tuple(faltan), []).append(i)
+            else:
+                self.documentos_sin_llm += 1
+
+        # Todos los grupos se envían al LLM a la vez, con un solo cliente y un solo
+        # semáforo: entre todos no superan max_concurrencia peticiones simultáneas
+        grupos = []
+        for faltan, indices in por_campos.items():
+            motor = self.motor_llm.con_campos(list(faltan))
+            textos_grupo = [textos[i] for i in indices]
+            grupos.append((motor, textos_grupo, *motor._desde_cache(textos_grupo)))
+
+        async def consultar_llm():
+            semaforo = asyncio.Semaphore(self.motor_llm.max_concurrencia)
+            async with self.motor_llm._cliente() as cliente:
+                await asyncio.gather(*(
+                    motor._extraer_pendientes(cliente, semaforo, textos_grupo, respuestas, pendientes)
+                    for motor, textos_grupo, respuestas, pendientes in grupos if pendientes
+                ))
+
+        if any(pendientes for _, _, _, pendientes in grupos):
+            asyncio.run(consultar_llm())
+        for (faltan, indices), (_, _, respuestas, _) in zip(por_campos.items(), grupos):
+            for i, respuesta in zip(indices, respuestas):
+                if isinstance(respuesta, Exception):
+                    resultados[i] = respuesta
+                    continue
+                try:
+                    del_llm = json.loads(respuesta.datos)
+                except json.JSONDecodeError as e:
+                    resultados[i] = e
+                    continue
+                if not isinstance(del_llm, dict):
+                    resultados[i] = ValueError(f"La respuesta del LLM no es un objeto JSON: {respuesta.datos[:100]}")
+                    continue
+                for campo in faltan:
+                    resultados[i].datos[campo] = del_llm.get(campo, "")
+                    resultados[i].origen[campo] = "llm"
+                self.campos_llm += len(faltan)
+
+        # Los datos se entregan como JSON, igual que la respuesta del LLM
+        return [
+            r if isinstance(r, Exception)
+            else r._replace(datos=json.dumps(
+                {c: r.datos.get(c, "") for c in CAMPOS_REGEX_A_LLM.values()}, ensure_ascii=False
+            ))
+            for r in resultados
+        ]
+
+    def estadisticas(self):
+        """
+        Retorna cuántas facturas y campos se resolvieron solo con regex y cuántos
+        necesitaron al LLM.
+        """
+        return {
+            "documentos": self.documentos,
+            "documentos_sin_llm": self.documentos_sin_llm,
+            "campos_regex": self.campos_regex,
+            "campos_llm": self.campos_llm,
+        }
@@ -0,0 +1,320 @@
+"""
+Extracción de campos de facturas con un LLM compatible con la API de OpenAI.
+
+- Construcción del prompt compartida por todos los pipelines (mismo texto, mismos campos)
+- MotorExtraccionLLM: peticiones concurrentes con un cliente asíncrono limitado por semáforo
+- Modo lote: varias facturas cortas en un único prompt, separando después la respuesta
+  estructurada por documento
+- Contabilidad de tokens y latencia por petición
+- Caché opcional de respuestas (comun/cache.py) para facturas repetidas o reprocesadas
+
+Para pruebas locales basta con apuntar base_url (o OPENAI_BASE_URL) al servidor de
+comun/stub_openai.py.
+"""
+import asyncio
+import copy
+import json
+import time
+from collections import namedtuple
+
+from openai import AsyncOpenAI
+
+from comun.cache import clave_llm
+from comun.metricas import medir, TOKENS_LLM
+
+MODELO_POR_DEFECTO = "gpt-3.5-turbo"
+MENSAJE_SISTEMA = "Eres un experto en análisis estructurado."
+
+# Prefijo de los identificadores de documento dentro de un prompt por lotes
+PREFIJO_DOCUMENTO = "factura_"
+
+# Resultado de extraer un documento.
+# - datos: cadena JSON con los campos, ya sin las marcas de código (ver limpiar_respuesta)
+# - tokens_entrada, tokens_salida, latencia: de la petición que lo resolvió
+# - documentos_en_peticion: cuántas facturas compartieron esa petición (1 si no fue por lotes,
+#   0 si la respuesta salió de la caché sin llamar al LLM)
+ResultadoExtraccion = namedtuple(
+    'ResultadoExtraccion',
+    ['datos', 'tokens_entrada', 'tokens_salida', 'latencia', 'documentos_en_peticion']
+)
+
+
+def construir_prompt(texto_factura, campos):
+    """
+    Construye el prompt de extracción para una factura.
+
+    Parámetros:
+    - texto_factura: texto plano de la factura (OCR o PDF)
+    - campos: lista de nombres de campo a extraer (ej: ["Fecha", "Número", ...])
+    """
+    lista_campos = "\n".join(f"    - {campo}" for campo in campos)
+    return f"""
+    Extrae los siguientes campos del texto proporcionado y devuelve los resultados en formato JSON:
+{lista_campos}
+
+    Texto:
+    {texto_factura}
+    """
+
+
+def construir_prompt_lote(textos, campos):
+    """
+    Construye un único prompt con varias facturas, cada una con su identificador.
+    La respuesta esperada es un objeto JSON {identificador: {campos...}}.
+    """
+    lista_campos = "\n".join(f"    - {campo}" for campo in campos)
+    identificadores = [f"{PREFIJO_DOCUMENTO}{i + 1}" for i in range(len(textos))]
+    bloques = "\n".join(
+        f"    === {identificador} ===\n    {texto}"
+        for identificador, texto in zip(identificadores, textos)
+    )
+    return f"""
+    Extrae los siguientes campos de CADA una de las facturas del texto proporcionado:
+{lista_campos}
+
+    Devuelve un único objeto JSON cuyas claves sean los identificadores de factura
+    ({", ".join(identificadores)}) y cuyos valores sean objetos JSON con los campos.
+
+    Facturas:
+{bloques}
+    """
+
+
+def limpiar_respuesta(contenido):
+    """
+    Elimina las marcas de código (```json y ```) que el modelo podría añadir.
+    """
+    return contenido.strip().replace('```json', '').replace('```', '').strip()
+
+
+class MotorExtraccionLLM:
+    """
+    Motor de extracción concurrente.
+
+    Uso:
+        motor = MotorExtraccionLLM(["Fecha", "Número", "Total a pagar"], max_concurrencia=8)
+        resultados = motor.extraer_todos_sync(textos)   # una ResultadoExtraccion por texto
+        print(motor.estadisticas())
+    """
+
+    def __init__(self, campos, modelo=MODELO_POR_DEFECTO, max_tokens=300,
+                 max_concurrencia=8, mensaje_sistema=MENSAJE_SISTEMA,
+                 tam_lote=1, max_caracteres_lote=3000, base_url=None, api_key=None,
+                 cache=None):
+        """
+        Parámetros:
+        - campos: campos a extraer de cada factura
+        - modelo, max_tokens: parámetros de la llamada (max_tokens es por documento)
+        - max_concurrencia: máximo de peticiones simultáneas al LLM
+        - mensaje_sistema: rol del sistema en la conversación
+        - tam_lote: máximo de facturas por prompt (1 = sin modo lote)
+        - max_caracteres_lote: solo se agrupan facturas cuyo texto no supere este tamaño
+        - base_url, api_key: para apuntar a otro servidor compatible (ej: el stub local)
+        - cache: CacheDisco opcional; las respuestas se reutilizan si coinciden el texto
+          normalizado, la plantilla del prompt, el modelo y max_tokens
+        """
+        self.campos = list(campos)
+        self.modelo = modelo
+        self.max_tokens = max_tokens
+        self.max_concurrencia = max_concurrencia
+        self.mensaje_sistema = mensaje_sistema
+        self.tam_lote = tam_lote
+        self.max_caracteres_lote = max_caracteres_lote
+        self.base_url = base_url
+        self.api_key = api_key
+        self.cache = cache
+
+        # Registro de cada petición: documentos, tokens de entrada/salida y latencia
+        self.peticiones = []
+
+    def con_campos(self, campos):
+        """
+        Retorna una copia del motor que pide solo los campos indicados. Comparte la
+        configuración, la caché y el registro de peticiones con el original.
+        """
+        motor = copy.copy(self)
+        motor.campos = list(campos)
+        return motor
+
+    def _clave_cache(self, texto):
+        """
+        Clave de caché de un texto. La plantilla incluye el mensaje de sistema y el
+        prompt con los campos, de modo que cambiar cualquiera invalida la caché.
+        """
+        plantilla = self.mensaje_sistema + construir_prompt("{texto_factura}", self.campos)
+        return clave_llm(texto, plantilla, self.modelo, self.max_tokens)
+
+    def _guardar_en_cache(self, texto, resultado):
+        """
+        Guarda la respuesta solo si es un objeto JSON, para no fijar respuestas erróneas
+        (ej: una lista o "n/a", que fallarían igual en cada ejecución).
+        """
+        if self.cache is None or isinstance(resultado, Exception):
+            return
+        try:
+            datos = json.loads(resultado.datos)
+        except json.JSONDecodeError:
+            return
+        if isinstance(datos, dict):
+            self.cache.guardar(self._clave_cache(texto), resultado.datos)
+
+    async def _completar(self, cliente, semaforo, prompt, max_tokens, documentos):
+        """
+        Envía una petición de chat y registra sus tokens y latencia.
+        Retorna (contenido_limpio, registro_de_la_peticion).
+        """
+        async with semaforo:
+            inicio = time.perf_counter()
+            with medir("llm", modelo=self.modelo):
+                response = await cliente.chat.completions.create(
+                    model=self.modelo,
+                    messages=[{"role": "system", "content": self.mensaje_sistema},
+                              {"role": "user", "content": prompt}],
+                    max_tokens=max_tokens
+                )
+            latencia = time.perf_counter() - inicio
+
+        uso = response.usage
+        registro = {
+            "documentos": documentos,
+            "tokens_entrada": uso.prompt_tokens if uso else 0,
+            "tokens_salida": uso.completion_tokens if uso else 0,
+            "latencia": latencia,
+        }
+        self.peticiones.append(registro)
+        TOKENS_LLM.inc(registro["tokens_entrada"], tipo="entrada", modelo=self.modelo)
+        TOKENS_LLM.inc(registro["tokens_salida"], tipo="salida", modelo=self.modelo)
+        return limpiar_respuesta(response.choices[0].message.content or ""), registro
+
+    async def _extraer_uno(self, cliente, semaforo, texto):
+        contenido, registro = await self._completar(
+            cliente, semaforo, construir_prompt(texto, self.campos), self.max_tokens, 1
+        )
+        return ResultadoExtraccion(contenido, registro["tokens_entrada"],
+                                   registro["tokens_salida"], registro["latencia"], 1)
+
+    async def _extraer_grupo(self, cliente, semaforo, textos):
+        """
+        Extrae varias facturas con un solo prompt. Si la respuesta no se puede separar
+        por documento, las facturas afectadas se repiten de forma individual.
+        """
+        contenido, registro = await self._completar(
+            cliente, semaforo, construir_prompt_lote(textos, self.campos),
+            self.max_tokens * len(textos), len(textos)
+        )
+        try:
+            por_documento = json.loads(contenido)
+        except json.JSONDecodeError:
+            por_documento = {}
+        if not isinstance(por_documento, dict):
+            por_documento = {}
+
+        resultados = []
+        for i, texto in enumerate(textos):
+            datos = por_documento.get(f"{PREFIJO_DOCUMENTO}{i + 1}")
+            if isinstance(datos, dict):
+                resultados.append(ResultadoExtraccion(
+                    json.dumps(datos, ensure_ascii=False), registro["tokens_entrada"],
+                    registro["tokens_salida"], registro["latencia"], len(textos)
+                ))
+            else:
+                # Respuesta incompleta para este documento: se pide por separado
+                resultados.append(await self._extraer_uno(cliente, semaforo, texto))
+        return resultados
+
+    def _agrupar(self, textos):
+        """
+        Reparte los índices de los textos en grupos: las facturas cortas se agrupan
+        hasta tam_lote; las largas van siempre solas.
+        """
+        grupos = []
+        actual = []
+        for i, texto in enumerate(textos):
+            if self.tam_lote <= 1 or len(texto) > self.max_caracteres_lote:
+                grupos.append([i])
+                continue
+            actual.append(i)
+            if len(actual) == self.tam_lote:
+                grupos.append(actual)
+                actual = []
+        if actual:
+            grupos.append(actual)
+        return grupos
+
+    def _cliente(self):
+        return AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+
+    def _desde_cache(self, textos):
+        """
+        Resuelve los textos que ya están en la caché.
+        Retorna (resultados, pendientes): los resultados tienen None en los pendientes.
+        """
+        resultados = [None] * len(textos)
+        pendientes = []
+        for i, texto in enumerate(textos):
+            datos = self.cache.obtener(self._clave_cache(texto)) if self.cache is not None else None
+            if datos is None:
+                pendientes.append(i)
+            else:
+                resultados[i] = ResultadoExtraccion(datos, 0, 0, 0.0, 0)
+        return resultados, pendientes
+
+    async def _extraer_pendientes(self, cliente, semaforo, textos, resultados, pendientes):
+        """
+        Extrae los textos pendientes y completa resultados. El cliente y el semáforo los
+        recibe de fuera para que varias llamadas (ej: un motor por conjunto de campos)
+        compartan el mismo límite de peticiones simultáneas.
+        """
+        async def resolver(grupo):
+            try:
+                if len(grupo) == 1:
+                    salida = [await self._extraer_uno(cliente, semaforo, textos[grupo[0]])]
+                else:
+                    salida = await self._extraer_grupo(cliente, semaforo, [textos[i] for i in grupo])
+            except Exception as e:
+                salida = [e] * len(grupo)
+            for i, resultado in zip(grupo, salida):
+                resultados[i] = resultado
+                self._guardar_en_cache(textos[i], resultado)
+
+        # Los grupos se forman solo con los textos que no estaban en caché
+        grupos = [[pendientes[j] for j in grupo]
+                  for grupo in self._agrupar([textos[i] for i in pendientes])]
+        await asyncio.gather(*(resolver(grupo) for grupo in grupos))
+
+    async def extraer_todos(self, textos):
+        """
+        Extrae los campos de todos los textos de forma concurrente.
+
+        Retorna:
+        - Lista de ResultadoExtraccion en el mismo orden que los textos. Si una
+          petición falla, su posición contiene la excepción.
+        """
+        resultados, pendientes = self._desde_cache(textos)
+        if pendientes:
+            async with self._cliente() as cliente:
+                await self._extraer_pendientes(cliente, asyncio.Semaphore(self.max_concurrencia),
+                                               textos, resultados, pendientes)
+        return resultados
+
+    def extraer_todos_sync(self, textos):
+        """Versión síncrona de extraer_todos, para usar desde scripts no asyncio."""
+        return asyncio.run(self.extraer_todos(textos))
+
+    def estadisticas(self):
+        """
+        Retorna el total de peticiones, documentos, tokens, la latencia media y máxima
+        y, si hay caché, su tasa de aciertos.
+        """
+        latencias = [p["latencia"] for p in self.peticiones]
+        cache = self.cache.estadisticas() if self.cache is not None else {}
+        return {
+            "cache_aciertos": cache.get("aciertos", 0),
+            "cache_tasa_aciertos": cache.get("tasa_aciertos", 0.0),
+            "peticiones": len(self.peticiones),
+            "documentos": sum(p["documentos"] for p in self.peticiones),
+            "tokens_entrada": sum(p["tokens_entrada"] for p in self.peticiones),
+            "tokens_salida": sum(p["tokens_salida"] for p in self.peticiones),
+            "latencia_media": sum(latencias) / len(latencias) if latencias else 0.0,
+            "latencia_maxima": max(latencias, default=0.0),
+        }
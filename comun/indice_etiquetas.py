@@ -0,0 +1,258 @@
+"""
+Índice de etiquetas sobre los textos de un documento de Docling (data["texts"]).
+
+- Se construye en una sola pasada: texto normalizado de la etiqueta -> posiciones
+- Búsqueda sin distinguir mayúsculas, acentos ni los dos puntos finales, y aproximada
+  (difflib) cuando no hay coincidencia exacta
+- El valor se elige por cercanía en la página usando las cajas de procedencia
+  (prov[].bbox): a la derecha en la misma línea o justo debajo, no solo el texto
+  siguiente de la lista. Sin cajas se usa el siguiente, como hacía extract_value
+- "Etiqueta: valor" en un mismo texto también se reconoce
+
+Uso:
+    indice = IndiceEtiquetas(data["texts"])
+    campos = indice.extraer(["Invoice Number", "Due Date", "From:"])
+"""
+import bisect
+import difflib
+import re
+import unicodedata
+from collections import namedtuple
+
+# Longitud máxima de un texto que puede ser una etiqueta (los más largos solo son valores)
+MAX_LONGITUD_ETIQUETA = 40
+
+_NO_PALABRA = re.compile(r'[^\w#%]+')
+
+# Caja de un texto en coordenadas con el eje y hacia abajo (y0 arriba, y1 abajo)
+Caja = namedtuple('Caja', ['pagina', 'x0', 'y0', 'x1', 'y1'])
+
+
+def normalizar_etiqueta(texto):
+    """
+    Normaliza una etiqueta: sin acentos, en minúsculas, sin signos de puntuación
+    y con los espacios colapsados ("Invoice  Number:" -> "invoice number").
+    """
+    if not texto.isascii():
+        texto = unicodedata.normalize('NFKD', texto)
+        texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    # Cada tramo de espacios y signos se convierte en un único espacio
+    return _NO_PALABRA.sub(' ', texto.lower()).strip()
+
+
+def _caja(item):
+    """Caja de la primera procedencia del texto, o None si no tiene."""
+    prov = item.get("prov") or []
+    if not prov or not prov[0].get("bbox"):
+        return None
+    bbox = prov[0]["bbox"]
+    izquierda, derecha = bbox["l"], bbox["r"]
+    # Docling suele dar las cajas con origen abajo a la izquierda (t > b): se invierte
+    # el eje y para que "debajo" sea siempre una y mayor
+    if bbox.get("coord_origin", "BOTTOMLEFT").upper() == "BOTTOMLEFT":
+        arriba, abajo = -bbox["t"], -bbox["b"]
+    else:
+        arriba, abajo = bbox["t"], bbox["b"]
+    if arriba > abajo:
+        arriba, abajo = abajo, arriba
+    return Caja(prov[0].get("page_no", 1), izquierda, arriba, derecha, abajo)
+
+
+class IndiceEtiquetas:
+    """
+    Índice de los textos de un documento para buscar el valor de cada etiqueta.
+    """
+
+    def __init__(self, textos, similitud_minima=0.85, lineas_debajo=3.0):
+        """
+        Parámetros:
+        - textos: lista data["texts"] de export_to_dict() (diccionarios con "text" y "prov")
+        - similitud_minima: similitud (0-1) para aceptar una etiqueta aproximada
+        - lineas_debajo: distancia máxima de un valor debajo de su etiqueta, en alturas
+          de la etiqueta
+        """
+        self.textos = textos
+        self.similitud_minima = similitud_minima
+        self.lineas_debajo = lineas_debajo
+
+        # etiqueta normalizada -> posiciones; "Etiqueta: valor" -> (posición, valor)
+        self._posiciones = {}
+        self._en_linea = {}
+        # Texto normalizado de cada posición (None si es demasiado largo para ser etiqueta)
+        self._normalizados = []
+        # Posiciones de cada página; las cajas se calculan solo para las páginas donde
+        # se busca un valor
+        self._posiciones_pagina = {}
+        self._cajas = {}
+        self._por_pagina = {}
+        self._bordes = {}
+
+        for i, item in enumerate(textos):
+            texto = item.get("text") or ""
+            normalizado = normalizar_etiqueta(texto) if len(texto) <= MAX_LONGITUD_ETIQUETA else None
+            self._normalizados.append(normalizado)
+            if normalizado is not None:
+                self._posiciones.setdefault(normalizado, []).append(i)
+
+            etiqueta, dos_puntos, valor = texto.partition(':')
+            if dos_puntos and valor.strip() and len(etiqueta) <= MAX_LONGITUD_ETIQUETA:
+                self._en_linea.setdefault(normalizar_etiqueta(etiqueta), []).append((i, valor.strip()))
+
+            prov = item.get("prov")
+            if prov:
+                self._posiciones_pagina.setdefault(prov[0].get("page_no", 1), []).append(i)
+
+        # Etiquetas aproximadas ya resueltas, por índice, y claves de cada índice por
+        # palabra (se construyen la primera vez que una etiqueta no aparece tal cual)
+        self._aproximadas_posiciones = {}
+        self._aproximadas_en_linea = {}
+        self._claves_por_palabra = {}
+
+    def _caja_de(self, i):
+        """Caja del texto i (None si no tiene procedencia); prepara su página la primera vez."""
+        prov = self.textos[i].get("prov")
+        if not prov:
+            return None
+        pagina = prov[0].get("page_no", 1)
+        if pagina not in self._por_pagina:
+            fila = []
+            for j in self._posiciones_pagina.get(pagina, []):
+                caja = self._cajas[j] = _caja(self.textos[j])
+                if caja is not None:
+                    fila.append((caja.y0, j))
+            fila.sort()
+            self._por_pagina[pagina] = fila
+            self._bordes[pagina] = [y0 for y0, _ in fila]
+        return self._cajas.get(i)
+
+    def _resolver(self, normalizado, claves, cache):
+        """Clave del índice para una etiqueta: exacta o, si no hay, la más parecida."""
+        if normalizado in claves:
+            return normalizado
+        if normalizado not in cache:
+            # Solo se comparan las claves que comparten alguna palabra con la etiqueta y
+            # tienen una longitud parecida: difflib sobre miles de textos es lento
+            por_palabra = self._claves_por_palabra.get(id(claves))
+            if por_palabra is None:
+                por_palabra = self._claves_por_palabra[id(claves)] = {}
+                for clave in claves:
+                    for palabra in set(clave.split()):
+                        por_palabra.setdefault(palabra, []).append(clave)
+            margen = (1 - self.similitud_minima) * len(normalizado) * 2 + 1
+            candidatas = {clave for palabra in set(normalizado.split())
+                          for clave in por_palabra.get(palabra, ())
+                          if abs(len(clave) - len(normalizado)) <= margen}
+            parecidas = difflib.get_close_matches(normalizado, candidatas, n=1,
+                                                  cutoff=self.similitud_minima)
+            cache[normalizado] = parecidas[0] if parecidas else None
+        return cache[normalizado]
+
+    def posiciones(self, etiqueta):
+        """Posiciones en textos donde aparece la etiqueta (exacta o aproximada)."""
+        clave = self._resolver(normalizar_etiqueta(etiqueta), self._posiciones,
+                              self._aproximadas_posiciones)
+        return self._posiciones.get(clave, []) if clave is not None else []
+
+    def _vecino(self, i, excluir):
+        """
+        Texto más cercano a la derecha en la misma línea, o debajo, del texto i.
+        Retorna su posición o None.
+        """
+        caja = self._cajas[i]
+        alto = max(caja.y1 - caja.y0, 1e-6)
+        fila = self._por_pagina[caja.pagina]
+        bordes = self._bordes[caja.pagina]
+
+        # Solo se miran los textos cuyo borde superior está entre media línea por encima
+        # de la etiqueta y lineas_debajo alturas por debajo
+        desde = bisect.bisect_left(bordes, caja.y0 - alto / 2)
+        hasta = bisect.bisect_right(bordes, caja.y1 + alto * self.lineas_debajo)
+
+        mejor, mejor_distancia = None, None
+        for _, j in fila[desde:hasta]:
+            if j == i or self._normalizados[j] == '' or self._normalizados[j] in excluir:
+                continue
+            otra = self._cajas[j]
+            solape_vertical = min(caja.y1, otra.y1) - max(caja.y0, otra.y0)
+            solape_horizontal = min(caja.x1, otra.x1) - max(caja.x0, otra.x0)
+            if solape_vertical >= 0.5 * min(alto, otra.y1 - otra.y0) and otra.x0 >= caja.x1 - alto:
+                # A la derecha, en la misma línea
+                distancia = max(otra.x0 - caja.x1, 0)
+            elif otra.y0 >= caja.y1 - alto / 2 and solape_horizontal > 0:
+                # Debajo, en la misma columna
+                distancia = max(otra.y0 - caja.y1, 0)
+            else:
+                continue
+            if mejor_distancia is None or distancia < mejor_distancia:
+                mejor, mejor_distancia = j, distancia
+        return mejor
+
+    def _siguiente(self, i, excluir):
+        """
+        Sin cajas de procedencia: el texto que sigue a la etiqueta, como el extract_value
+        original. Si la etiqueta forma parte de una fila de etiquetas seguidas (una
+        cabecera), los valores vienen detrás de la fila en el mismo orden: a la etiqueta
+        k-ésima de la fila le corresponde el k-ésimo texto tras ella.
+        """
+        inicio = i
+        while inicio > 0 and self._normalizados[inicio - 1] in excluir:
+            inicio -= 1
+        fin = i + 1
+        while fin < len(self.textos) and self._normalizados[fin] in excluir:
+            fin += 1
+        j = fin + (i - inicio)
+        if j >= len(self.textos) or self._normalizados[j] in excluir:
+            return None
+        return j
+
+    def _valor_en_posiciones(self, posiciones, excluir):
+        for i in posiciones:
+            if self._caja_de(i) is not None:
+                j = self._vecino(i, excluir)
+            else:
+                j = self._siguiente(i, excluir)
+            if j is not None:
+                return self.textos[j]["text"]
+        return None
+
+    def valor(self, etiqueta, excluir=()):
+        """
+        Busca una etiqueta y devuelve el valor que le corresponde.
+
+        Orden de búsqueda: la etiqueta exacta como texto propio (y su vecino), la exacta
+        en un "Etiqueta: valor", y solo después las aproximadas. Así "Order Number: 77"
+        no se toma por la etiqueta "Order Number" con el texto de al lado como valor.
+
+        Parámetros:
+        - etiqueta: texto de la etiqueta (ej: "Invoice Number")
+        - excluir: etiquetas normalizadas que no pueden ser un valor (las otras
+          etiquetas que se buscan, por ejemplo en una fila de cabeceras)
+
+        Retorna:
+        - Texto del valor, o None si no se encuentra
+        """
+        normalizado = normalizar_etiqueta(etiqueta)
+        valor = self._valor_en_posiciones(self._posiciones.get(normalizado, []), excluir)
+        if valor is not None:
+            return valor
+        if normalizado in self._en_linea:
+            return self._en_linea[normalizado][0][1]
+
+        # Aproximadas
+        valor = self._valor_en_posiciones(self.posiciones(etiqueta), excluir)
+        if valor is not None:
+            return valor
+        clave = self._resolver(normalizado, self._en_linea, self._aproximadas_en_linea)
+        if clave is not None:
+            return self._en_linea[clave][0][1]
+        return None
+
+    def extraer(self, etiquetas):
+        """
+        Resuelve varias etiquetas con el mismo índice.
+
+        Retorna:
+        - Diccionario etiqueta -> valor (None si no se encuentra)
+        """
+        excluir = frozenset(normalizar_etiqueta(e) for e in etiquetas)
+        return {etiqueta: self.valor(etiqueta, excluir) for etiqueta in etiquetas}
@@ -0,0 +1,253 @@
+"""
+Lectura de la tabla de ítems de una factura: descripción, cantidad, precio unitario e
+importe de cada línea, con los importes como Decimal.
+
+Sustituye a la expresión regular r'(.*?)\\s*(\\d+)\\s*(\\d+)\\s*(€\\d+\\.\\d{2})' sobre todo el
+texto, que retrocede mucho en páginas largas con muchos números:
+- Cada línea se divide en palabras una sola vez y se lee de derecha a izquierda
+  (importe, precio unitario, cantidad; el resto es la descripción): tiempo lineal
+- Símbolos de moneda configurables, delante o detrás del número, pegados o separados
+  ("€100.00", "100,00 €", "EUR 100.00"), y negativos con el signo antes o después del
+  símbolo ("-€10.00", "€-10.00"). Dos importes sin espacio entre ellos ("50€100.00",
+  como los deja PyPDF2 con las columnas juntas) se separan por el símbolo
+- Formato de los números por locale: "en" (1,234.56), "es" (1.234,56) o "auto" (el
+  último separador con dos decimales es el decimal)
+- Las líneas de totales ("Total", "Subtotal"...) no son ítems: se devuelven aparte en
+  lugar de suponer que la última coincidencia es el total
+- Límite de tiempo por documento (ITEMS_MAX_SECONDS): si se supera, se devuelve lo leído
+  hasta entonces, marcado como incompleto
+
+Cada ítem ocupa una línea del texto (como los extrae PyMuPDF de estas facturas).
+
+Configuración por defecto (variables de entorno):
+- ITEMS_CURRENCIES: símbolos de moneda separados por comas (por defecto: €,$,£,EUR,USD,GBP)
+- ITEMS_LOCALE: en (por defecto), es o auto
+- ITEMS_MAX_SECONDS: tiempo máximo por documento (por defecto, 2)
+
+Uso:
+    tabla = leer_items(texto)
+    subtotal = sum(item.importe for item in tabla.items)
+"""
+import os
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from comun.metricas import evento
+
+# Ítem de la tabla.
+# - descripcion: texto antes de los números ('' si la línea solo tiene números)
+# - cantidad, precio_unitario, importe: Decimal
+# - moneda: símbolo que acompaña al importe
+# - linea: número de línea en el texto (empezando en 0)
+Item = namedtuple('Item', ['descripcion', 'cantidad', 'precio_unitario', 'importe', 'moneda', 'linea'])
+
+# Resultado de leer un documento.
+# - items: ítems en el orden del texto
+# - totales: líneas con forma de ítem cuya descripción es un total (ej: "Total 1 1 €90.00")
+# - completa: False si se cortó por el límite de tiempo
+TablaItems = namedtuple('TablaItems', ['items', 'totales', 'completa'])
+
+MONEDAS = tuple(simbolo.strip() for simbolo in
+                os.getenv("ITEMS_CURRENCIES", "€,$,£,EUR,USD,GBP").split(",") if simbolo.strip())
+LOCALE = os.getenv("ITEMS_LOCALE", "en")
+MAX_SEGUNDOS = float(os.getenv("ITEMS_MAX_SECONDS", "2"))
+
+# Separadores (miles, decimal) de cada locale; "auto" se decide en cada número
+SEPARADORES = {"en": (",", "."), "es": (".", ",")}
+
+# Descripciones que indican una línea de totales, no un ítem (en minúsculas)
+ETIQUETAS_TOTAL = ("total", "subtotal", "sub-total", "suma", "importe total")
+
+# Líneas entre comprobaciones del límite de tiempo
+_LINEAS_POR_COMPROBACION = 256
+
+_DIGITOS = frozenset("0123456789")
+
+
+def _separar_moneda(palabra, monedas):
+    """
+    Retorna (moneda, número) si la palabra empieza o termina por un símbolo; si no, (None, palabra).
+    El signo puede ir delante del símbolo ("-€10.00") o detrás ("€-10.00"): el número lo conserva.
+    """
+    signo = ""
+    if palabra.startswith("-"):
+        signo, palabra = "-", palabra[1:]
+    for simbolo in monedas:
+        if palabra.startswith(simbolo):
+            return simbolo, signo + palabra[len(simbolo):]
+        if palabra.endswith(simbolo):
+            return simbolo, signo + palabra[:-len(simbolo)]
+    return None, signo + palabra
+
+
+def _partir_palabra(palabra, monedas):
+    """
+    Separa los importes pegados por un símbolo de moneda entre cifras, como los deja
+    PyPDF2 cuando las columnas están muy juntas: "50€100.00" -> ["50", "€100.00"] y, si
+    la moneda va detrás, "5.00€10.00€" -> ["5.00€", "10.00€"].
+    """
+    for simbolo in monedas:
+        inicio = palabra.find(simbolo, 1)
+        while inicio != -1:
+            fin = inicio + len(simbolo)
+            if (fin < len(palabra) and palabra[inicio - 1] in _DIGITOS
+                    and (palabra[fin] in _DIGITOS or palabra[fin] == "-")):
+                # El símbolo va con el importe de la derecha, salvo que la palabra use la
+                # moneda detrás del número (termina en el símbolo)
+                corte = fin if palabra.endswith(simbolo) else inicio
+                return [palabra[:corte]] + _partir_palabra(palabra[corte:], monedas)
+            inicio = palabra.find(simbolo, inicio + 1)
+    return [palabra]
+
+
+def _separador_decimal_auto(numero):
+    """Separador decimal de un número en formato desconocido (None si es entero)."""
+    coma, punto = numero.rfind(","), numero.rfind(".")
+    ultimo = max(coma, punto)
+    if ultimo == -1:
+        return None
+    separador = numero[ultimo]
+    # Con los dos separadores, el último es el decimal; con uno solo, es decimal si
+    # aparece una vez y le siguen dos cifras o menos ("12,5" y "1.234,56", no "1,234")
+    if coma != -1 and punto != -1:
+        return separador
+    if numero.count(separador) == 1 and len(numero) - ultimo - 1 <= 2:
+        return separador
+    return None
+
+
+def a_numero(palabra, locale="en"):
+    """
+    Convierte una palabra ya sin moneda en Decimal según el locale; None si no es un número.
+    Solo recorre la palabra: no hay expresiones regulares que puedan retroceder.
+    """
+    negativo = palabra.startswith("-")
+    if negativo:
+        palabra = palabra[1:]
+    if not palabra or palabra[0] not in _DIGITOS or palabra[-1] not in _DIGITOS:
+        return None
+    if locale == "auto":
+        decimal = _separador_decimal_auto(palabra)
+        miles = {",": ".", ".": ","}.get(decimal, ",.")
+    else:
+        miles, decimal = SEPARADORES[locale]
+    partes = palabra.split(decimal) if decimal else [palabra]
+    if len(partes) > 2:
+        return None
+    entera = partes[0]
+    for separador in miles:
+        entera = entera.replace(separador, "")
+    if not entera or not _DIGITOS.issuperset(entera):
+        return None
+    if len(partes) == 2:
+        if not partes[1] or not _DIGITOS.issuperset(partes[1]):
+            return None
+        entera += "." + partes[1]
+    try:
+        valor = Decimal(entera)
+    except InvalidOperation:
+        return None
+    return -valor if negativo else valor
+
+
+def _leer_importe(palabras, fin, monedas, locale):
+    """
+    Lee un importe que termina en palabras[fin - 1]: "€100.00", "100.00€", "100.00 €" o "€ 100.00".
+    Retorna (valor, moneda, inicio) o None; inicio es la primera palabra del importe.
+    """
+    if fin <= 0:
+        return None
+    moneda, numero = _separar_moneda(palabras[fin - 1], monedas)
+    inicio = fin - 1
+    if moneda is not None and not numero:
+        # Símbolo suelto detrás del número
+        inicio -= 1
+        if inicio < 0:
+            return None
+        numero = palabras[inicio]
+    valor = a_numero(numero, locale)
+    if valor is None:
+        return None
+    if moneda is None and inicio > 0 and palabras[inicio - 1] in monedas:
+        # Símbolo suelto delante del número
+        inicio -= 1
+        moneda = palabras[inicio]
+    return valor, moneda, inicio
+
+
+def leer_linea(linea, monedas=MONEDAS, locale=LOCALE, moneda_obligatoria=True):
+    """
+    Lee una línea de ítem: [descripción] cantidad precio_unitario importe.
+
+    Parámetros:
+    - linea: texto de una línea
+    - monedas: símbolos de moneda aceptados
+    - locale: "en", "es" o "auto"
+    - moneda_obligatoria: si es True, el importe debe llevar un símbolo de moneda (así no
+      se confunden con ítems las líneas de números sueltos, como fechas o teléfonos)
+
+    Retorna:
+    - (descripcion, cantidad, precio_unitario, importe, moneda), o None si no es un ítem
+    """
+    palabras = []
+    for palabra in linea.split():
+        palabras.extend(_partir_palabra(palabra, monedas))
+    if len(palabras) < 3:
+        return None
+    importe = _leer_importe(palabras, len(palabras), monedas, locale)
+    if importe is None or (moneda_obligatoria and importe[1] is None):
+        return None
+    valor_importe, moneda, inicio = importe
+    # El precio unitario puede llevar también la moneda
+    precio = _leer_importe(palabras, inicio, monedas, locale)
+    if precio is None:
+        return None
+    valor_precio, _, inicio = precio
+    if inicio <= 0:
+        return None
+    cantidad = a_numero(palabras[inicio - 1], locale)
+    if cantidad is None:
+        return None
+    return " ".join(palabras[:inicio - 1]), cantidad, valor_precio, valor_importe, moneda
+
+
+def es_total(descripcion):
+    """True si la descripción es la de una línea de totales."""
+    return descripcion.lower().rstrip(":").strip() in ETIQUETAS_TOTAL
+
+
+def leer_items(texto, monedas=None, locale=None, max_segundos=None, moneda_obligatoria=True):
+    """
+    Lee la tabla de ítems de un texto, línea a línea.
+
+    Parámetros:
+    - texto: texto de la factura
+    - monedas, locale, max_segundos: por defecto, los de las variables de entorno
+      (max_segundos=0 desactiva el límite)
+    - moneda_obligatoria: ver leer_linea
+
+    Retorna:
+    - TablaItems con los ítems, las líneas de totales y si se leyó el texto completo
+    """
+    monedas = MONEDAS if monedas is None else tuple(monedas)
+    # Los símbolos largos primero: "EUR" antes que "E" si ambos están configurados
+    monedas = tuple(sorted(monedas, key=len, reverse=True))
+    locale = locale or LOCALE
+    if locale != "auto" and locale not in SEPARADORES:
+        raise ValueError(f"Locale no soportado: {locale} (usar {', '.join(SEPARADORES)} o auto)")
+    max_segundos = MAX_SEGUNDOS if max_segundos is None else max_segundos
+
+    items, totales = [], []
+    limite = time.perf_counter() + max_segundos if max_segundos else None
+    for numero, linea in enumerate(texto.splitlines()):
+        if limite is not None and numero % _LINEAS_POR_COMPROBACION == 0 and time.perf_counter() > limite:
+            evento("items_incompletos", nivel="warning", lineas_leidas=numero, items=len(items),
+                   max_segundos=max_segundos)
+            return TablaItems(items, totales, False)
+        leida = leer_linea(linea, monedas, locale, moneda_obligatoria)
+        if leida is None:
+            continue
+        item = Item(*leida, numero)
+        (totales if es_total(item.descripcion) else items).append(item)
+    return TablaItems(items, totales, True)
@@ -0,0 +1,207 @@
+"""
+Manifiesto de procesamiento: hasta qué etapa llegó cada documento en un lote.
+
+- Almacenamiento en SQLite, como la caché (comun/cache.py)
+- Cada documento (o página) se identifica por el hash de su contenido: si el archivo
+  cambia, es un documento nuevo; si no cambia, se retoma donde se quedó
+- Etapas en orden: renderizado -> ocr -> extraido -> escrito. Con cada etapa se guardan
+  sus salidas (texto OCR, datos extraídos...) para retomar sin repetir las anteriores
+- Un error se registra sin cambiar la etapa alcanzada: en la siguiente ejecución se
+  reintenta desde ahí
+
+Uso:
+    with Manifiesto("manifiesto.sqlite") as manifiesto:
+        clave = clave_documento("factura.pdf", pagina=0)
+        estado = manifiesto.estado(clave)
+        if estado is None or not estado.alcanzo("ocr"):
+            texto = ocr(...)
+            manifiesto.registrar(clave, "ocr", documento="factura.pdf", texto=texto)
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from comun.cache import hash_contenido
+
+# Etapas del procesamiento, en orden
+ETAPAS = ("renderizado", "ocr", "extraido", "escrito")
+# "pendiente": documento registrado (por un error) sin ninguna etapa completada
+PENDIENTE = "pendiente"
+_NIVEL = {PENDIENTE: -1, **{etapa: nivel for nivel, etapa in enumerate(ETAPAS)}}
+
+
+def clave_documento(contenido, pagina=None):
+    """
+    Clave de un documento en el manifiesto.
+
+    Parámetros:
+    - contenido: ruta del archivo, bytes o un hash ya calculado (64 caracteres hexadecimales)
+    - pagina: número de página, si se registra cada página por separado
+
+    Retorna:
+    - Hash del contenido (más ":página" si se indica)
+    """
+    if isinstance(contenido, str) and len(contenido) == 64 and all(c in '0123456789abcdef' for c in contenido):
+        hash_documento = contenido
+    else:
+        hash_documento = hash_contenido(contenido)
+    return hash_documento if pagina is None else f"{hash_documento}:{pagina}"
+
+
+class EstadoDocumento(namedtuple('EstadoDocumento', ['clave', 'documento', 'etapa', 'salidas', 'error'])):
+    """
+    Estado de un documento en el manifiesto.
+    - etapa: última etapa completada (una de ETAPAS, o PENDIENTE)
+    - salidas: diccionario con las salidas guardadas en cada etapa
+    - error: último error, o None
+    """
+
+    def alcanzo(self, etapa):
+        """True si el documento completó la etapa indicada (o una posterior)."""
+        return _NIVEL[self.etapa] >= _NIVEL[etapa]
+
+
+class Manifiesto:
+    """
+    Registro persistente del avance de cada documento.
+    Es seguro para usarse desde varios hilos del mismo proceso.
+    """
+
+    def __init__(self, ruta):
+        """
+        Parámetros:
+        - ruta: archivo SQLite del manifiesto (se crea si no existe)
+        """
+        self.ruta = ruta
+        self.retomados = 0
+        self._lock = threading.Lock()
+
+        # check_same_thread=False: la conexión se comparte entre hilos, protegida por el lock
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        # WAL: cada registro es un commit corto; NORMAL no pierde datos si el proceso se cae
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('PRAGMA synchronous=NORMAL')
+        self._conexion.execute(
+            'CREATE TABLE IF NOT EXISTS documentos ('
+            ' clave TEXT PRIMARY KEY,'
+            ' documento TEXT,'
+            ' etapa TEXT NOT NULL,'
+            ' salidas TEXT NOT NULL,'
+            ' error TEXT,'
+            ' actualizado REAL NOT NULL)'
+        )
+        self._conexion.execute('CREATE INDEX IF NOT EXISTS idx_etapa ON documentos (etapa)')
+        self._conexion.commit()
+
+    def estado(self, clave):
+        """
+        Retorna el EstadoDocumento de la clave, o None si nunca se registró.
+        """
+        with self._lock:
+            fila = self._conexion.execute(
+                'SELECT documento, etapa, salidas, error FROM documentos WHERE clave = ?', (clave,)
+            ).fetchone()
+        if fila is None:
+            return None
+        documento, etapa, salidas, error = fila
+        return EstadoDocumento(clave, documento, etapa, json.loads(salidas), error)
+
+    def retomar(self, clave, etapa):
+        """
+        Retorna el estado si el documento ya completó la etapa (y cuenta que se retoma),
+        o None si hay que procesarlo.
+        """
+        estado = self.estado(clave)
+        if estado is None or not estado.alcanzo(etapa):
+            return None
+        with self._lock:
+            self.retomados += 1
+        return estado
+
+    def _registrar(self, clave, etapa, documento, salidas):
+        # Se llama con el lock adquirido. La etapa nunca retrocede y las salidas se
+        # combinan con las de etapas anteriores
+        fila = self._conexion.execute(
+            'SELECT documento, etapa, salidas FROM documentos WHERE clave = ?', (clave,)
+        ).fetchone()
+        if fila is not None:
+            documento = documento or fila[0]
+            if _NIVEL[fila[1]] > _NIVEL[etapa]:
+                etapa = fila[1]
+            salidas = {**json.loads(fila[2]), **salidas}
+        self._conexion.execute(
+            'INSERT OR REPLACE INTO documentos (clave, documento, etapa, salidas, error, actualizado)'
+            ' VALUES (?, ?, ?, ?, NULL, ?)',
+            (clave, documento, etapa, json.dumps(salidas, ensure_ascii=False, default=str), time.time())
+        )
+
+    def registrar(self, clave, etapa, documento=None, **salidas):
+        """
+        Registra que el documento completó una etapa.
+
+        Parámetros:
+        - clave: clave del documento (ver clave_documento)
+        - etapa: una de ETAPAS
+        - documento: nombre legible (archivo, página...)
+        - salidas: salidas de la etapa que se guardan para retomar (deben ser serializables a JSON)
+        """
+        if etapa not in ETAPAS:
+            raise ValueError(f"Etapa desconocida: {etapa} (opciones: {ETAPAS})")
+        with self._lock:
+            self._registrar(clave, etapa, documento, salidas)
+            self._conexion.commit()
+
+    def registrar_varios(self, claves, etapa):
+        """Registra la misma etapa para varios documentos en una sola transacción."""
+        with self._lock:
+            for clave in claves:
+                self._registrar(clave, etapa, None, {})
+            self._conexion.commit()
+
+    def registrar_error(self, clave, error, documento=None):
+        """
+        Guarda el último error del documento sin cambiar la etapa alcanzada.
+        """
+        with self._lock:
+            cursor = self._conexion.execute(
+                'UPDATE documentos SET error = ?, actualizado = ? WHERE clave = ?',
+                (str(error), time.time(), clave)
+            )
+            if cursor.rowcount == 0:
+                # Falló antes de completar ninguna etapa: se reintenta desde el principio
+                self._conexion.execute(
+                    'INSERT INTO documentos (clave, documento, etapa, salidas, error, actualizado)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (clave, documento, PENDIENTE, '{}', str(error), time.time())
+                )
+            self._conexion.commit()
+
+    def estadisticas(self):
+        """
+        Retorna el número de documentos en cada etapa, los que tienen error y los
+        retomados en esta ejecución.
+        """
+        with self._lock:
+            por_etapa = dict(self._conexion.execute(
+                'SELECT etapa, COUNT(*) FROM documentos GROUP BY etapa'
+            ).fetchall())
+            con_error = self._conexion.execute(
+                'SELECT COUNT(*) FROM documentos WHERE error IS NOT NULL'
+            ).fetchone()[0]
+        return {
+            **{etapa: por_etapa.get(etapa, 0) for etapa in (PENDIENTE,) + ETAPAS},
+            'con_error': con_error,
+            'retomados': self.retomados,
+        }
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
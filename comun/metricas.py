@@ -0,0 +1,321 @@
+"""
+Métricas y registro estructurado compartidos por todos los pipelines.
+
+- Contadores e histogramas con etiquetas, seguros entre hilos, en un registro global
+- Exportación en formato de texto de Prometheus:
+  - METRICS_PORT: servidor HTTP local que sirve GET /metrics
+  - METRICS_FILE: archivo que se reescribe cada METRICS_FILE_SECONDS segundos y al salir
+    (para el "textfile collector" de node_exporter, o para revisarlo a mano)
+- Eventos en JSON, una línea por evento (evento()):
+  - LOG_JSON: archivo donde se escriben todos los eventos ("-" = salida de errores)
+  - Sin LOG_JSON, solo los avisos y errores, en la salida de errores
+- traza(): los mensajes de depuración de los bucles (antes print) solo se muestran
+  con VERBOSE=true
+
+Los procesos de un pool tienen su propio registro, que no se exporta: las etapas que
+corren en procesos se miden desde el proceso principal (comun/pipeline.py).
+
+Uso:
+    configurar()  # al arrancar el script: lee las variables de entorno
+    with medir("ocr", motor="azure"):
+        texto = ...
+    BYTES.inc(len(imagen), operacion="subido", destino="azure")
+    evento("factura_extraida", archivo=nombre, campos=9)
+"""
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites de los histogramas de duración (segundos): de milisegundos (regex, caché) a
+# minutos (OCR de una página grande con reintentos)
+CUBETAS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _clave(etiquetas):
+    return tuple(sorted((nombre, str(valor)) for nombre, valor in etiquetas.items()))
+
+
+def _formatear_etiquetas(clave, extra=()):
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ""
+    # Escapes del formato de texto de Prometheus
+    escapar = lambda valor: valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Valor que solo crece (documentos, bytes, tokens...), uno por combinación de etiquetas."""
+
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def inc(self, valor=1, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas):
+        with self._lock:
+            return self._valores.get(_clave(etiquetas), 0)
+
+    def _lineas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f"{self.nombre}{_formatear_etiquetas(clave)} {_numero(valor)}" for clave, valor in valores]
+
+
+class Histograma:
+    """Distribución de valores (duraciones) en cubetas acumuladas, como los de Prometheus."""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, cubetas=CUBETAS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.cubetas = tuple(sorted(cubetas))
+        self._lock = threading.Lock()
+        # clave -> [cuentas por cubeta (no acumuladas) + desbordadas, suma, total]
+        self._series = {}
+
+    def observar(self, valor, **etiquetas):
+        clave = _clave(etiquetas)
+        posicion = len(self.cubetas)
+        for i, limite in enumerate(self.cubetas):
+            if valor <= limite:
+                posicion = i
+                break
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.cubetas) + 1), 0.0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def resumen(self, **etiquetas):
+        """(observaciones, suma) de una combinación de etiquetas."""
+        with self._lock:
+            serie = self._series.get(_clave(etiquetas))
+            return (serie[2], serie[1]) if serie else (0, 0.0)
+
+    def _lineas(self):
+        with self._lock:
+            series = sorted((clave, (list(s[0]), s[1], s[2])) for clave, s in self._series.items())
+        lineas = []
+        for clave, (cuentas, suma, total) in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.cubetas, cuentas):
+                acumulado += cuenta
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave, [('le', _numero(limite))])} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave, [('le', '+Inf')])} {total}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} {total}")
+        return lineas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas con nombre; contador() e histograma() las crean la primera vez."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    def _obtener(self, clase, nombre, ayuda, *argumentos):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, *argumentos)
+            elif not isinstance(metrica, clase):
+                raise ValueError(f"La métrica {nombre} ya existe con otro tipo ({metrica.tipo})")
+            return metrica
+
+    def contador(self, nombre, ayuda=""):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda="", cubetas=CUBETAS_SEGUNDOS):
+        return self._obtener(Histograma, nombre, ayuda, cubetas)
+
+    def texto_prometheus(self):
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            metricas = sorted(self._metricas.items())
+        lineas = []
+        for nombre, metrica in metricas:
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {metrica.tipo}")
+            lineas.extend(metrica._lineas())
+        return "\n".join(lineas) + "\n"
+
+    def escribir_archivo(self, ruta):
+        """Escribe las métricas en un archivo; se reemplaza de golpe para no leerlo a medias."""
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(self.texto_prometheus())
+        os.replace(temporal, ruta)
+
+
+# Registro global y métricas comunes de los pipelines
+metricas = RegistroMetricas()
+
+ETAPA_SEGUNDOS = metricas.histograma(
+    "facturas_etapa_segundos", "Duración de cada llamada a una etapa (render, preprocesado, ocr, llm, escritura...)")
+PIPELINE_SEGUNDOS = metricas.histograma(
+    "facturas_pipeline_etapa_segundos", "Duración por elemento de cada etapa de comun/pipeline.py")
+ERRORES = metricas.contador("facturas_errores_total", "Llamadas a una etapa que terminaron con excepción")
+BYTES = metricas.contador("facturas_bytes_total", "Bytes leídos, escritos y subidos (etiqueta operacion)")
+TOKENS_LLM = metricas.contador("facturas_llm_tokens_total", "Tokens del LLM (etiqueta tipo: entrada o salida)")
+CACHE = metricas.contador("facturas_cache_consultas_total", "Consultas a las cachés en disco (resultado: acierto o fallo)")
+REINTENTOS = metricas.contador("facturas_reintentos_total", "Peticiones repetidas tras un 429/5xx o un fallo de red")
+FILAS = metricas.contador("facturas_filas_escritas_total", "Filas escritas en las salidas de resultados")
+
+
+@contextmanager
+def medir(etapa, **etiquetas):
+    """
+    Mide la duración del bloque en facturas_etapa_segundos{etapa=...}; si el bloque
+    lanza una excepción, se cuenta además en facturas_errores_total.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ERRORES.inc(etapa=etapa, **etiquetas)
+        raise
+    finally:
+        ETAPA_SEGUNDOS.observar(time.perf_counter() - inicio, etapa=etapa, **etiquetas)
+
+
+# ---- Exportación ----
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        cuerpo = self.server.registro.texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def iniciar_servidor(puerto, host="127.0.0.1", registro=None):
+    """
+    Sirve las métricas en http://host:puerto/metrics desde un hilo en segundo plano.
+
+    Retorna:
+    - El servidor (servidor.shutdown() para detenerlo)
+    """
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    servidor.registro = registro or metricas
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return servidor
+
+
+def exportar_a_archivo(ruta, intervalo=15.0, registro=None):
+    """Reescribe el archivo de métricas cada intervalo segundos y una última vez al salir."""
+    registro = registro or metricas
+
+    def bucle():
+        while True:
+            time.sleep(intervalo)
+            registro.escribir_archivo(ruta)
+
+    threading.Thread(target=bucle, name="metricas-archivo", daemon=True).start()
+    atexit.register(registro.escribir_archivo, ruta)
+
+
+# ---- Registro de eventos ----
+
+_registro_eventos = logging.getLogger("facturas")
+_registro_eventos.addHandler(logging.NullHandler())
+_registro_eventos.propagate = False
+
+NIVELES = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento: fecha, nivel, evento y sus campos."""
+
+    def format(self, record):
+        linea = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname.lower(),
+            "evento": record.getMessage(),
+            **getattr(record, "campos", {}),
+        }
+        if record.exc_info:
+            linea["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+
+def evento(nombre, nivel="info", **campos):
+    """Registra un evento estructurado (ej: evento("ocr_fallido", nivel="error", archivo=...))."""
+    _registro_eventos.log(NIVELES[nivel], nombre, extra={"campos": campos})
+
+
+# Mensajes de depuración por documento en consola (VERBOSE=true)
+VERBOSE = os.getenv("VERBOSE", "false").lower() in ("1", "true", "yes")
+
+
+def traza(*args, **kwargs):
+    """print() que solo escribe con VERBOSE=true."""
+    if VERBOSE:
+        print(*args, **kwargs)
+
+
+_configurado = False
+
+
+def configurar():
+    """
+    Configura la exportación y los eventos a partir de las variables de entorno
+    (METRICS_PORT, METRICS_FILE, METRICS_FILE_SECONDS, LOG_JSON, LOG_LEVEL).
+    Solo tiene efecto la primera vez.
+    """
+    global _configurado
+    if _configurado:
+        return
+    _configurado = True
+
+    destino = os.getenv("LOG_JSON")
+    if destino:
+        manejador = logging.StreamHandler(sys.stderr) if destino == "-" else logging.FileHandler(destino, encoding="utf-8")
+        manejador.setLevel(NIVELES.get(os.getenv("LOG_LEVEL", "info").lower(), logging.INFO))
+    else:
+        # Sin archivo de eventos, los avisos y errores siguen viéndose en la consola
+        manejador = logging.StreamHandler(sys.stderr)
+        manejador.setLevel(logging.WARNING)
+    manejador.setFormatter(FormatoJSON())
+    _registro_eventos.addHandler(manejador)
+    _registro_eventos.setLevel(logging.DEBUG)
+
+    puerto = os.getenv("METRICS_PORT")
+    if puerto:
+        iniciar_servidor(int(puerto), os.getenv("METRICS_HOST", "127.0.0.1"))
+    archivo = os.getenv("METRICS_FILE")
+    if archivo:
+        exportar_a_archivo(archivo, float(os.getenv("METRICS_FILE_SECONDS", "15")))
@@ -0,0 +1,311 @@
+"""
+Patrones de expresiones regulares para extraer los campos de facturas en español.
+
+Los usa el pipeline de Tesseract (Imagen estructurado (OCR)) y la extracción escalonada
+(comun/extraccion_escalonada.py), que prueba estos patrones antes de llamar al LLM.
+
+EscanerPatrones compila la tabla completa una sola vez y encuentra todos los campos en
+una única pasada por el texto, con el mismo resultado que probar cada lista de patrones
+en orden con buscar_valor (benchmarks/bench_patrones.py compara ambos).
+"""
+import re  # Expresiones regulares para extraer datos
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants  # Python 3.11+
+except ImportError:
+    import sre_parse, sre_constants
+
+FLAGS_PATRONES = re.IGNORECASE | re.DOTALL
+
+# Define patrones flexibles para buscar campos específicos (maneja errores OCR)
+patterns = {
+    # Busca fechas (soporta variaciones y caracteres confusos por OCR)
+    "fecha": [
+        r"F[ea]ch?a[:\s]+(\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})",  # Fecha tipo 01/12/2022 o similares
+        r"(\d{2}[/\-\.]\d{2}[/\-\.]\d{4})"  # Alternativa simple: 02/03/2022
+    ],
+    # Número de factura
+    "numero": [
+        r"N[uú]mero[:\s]+(\d+)",
+        r"Numero[:\s]+(\d+)"  # Considera también sin tilde
+    ],
+    # Nombre del cliente
+    "cliente": [
+        r"Cliente[:\s]+([^\n]+?)(?=\n|Domicilio)",
+        r"Cliente[:\s]+(.+?)(?=\n)"
+    ],
+    # Domicilio
+    "domicilio": [
+        r"Domicilio[:\s]+([^\n]+?)(?=\n|Ciudad)",
+        r"Dom[ie]cilio[:\s]+(.+?)(?=\n)"  # Soporta posibles errores de OCR en la palabra
+    ],
+    # Ciudad del cliente
+    "ciudad": [
+        r"Ciudad[:\s]+([^\n]+?)(?=\n|DNI|NIF)",
+        r"Ciudad[:\s]+(.+?)(?=\n)"
+    ],
+    # NIF o documento
+    "nif": [
+        r"DNI[/\s]?NIF[:\s]+([A-Z0-9]+)",
+        r"IE\s+([A-Z0-9]{7,})"
+    ],
+    # Concepto de la factura
+    "concepto": [
+        r"Publicidad[^\n]+(?:\n|$)"  # Busca cualquier línea que comience con 'Publicidad'
+    ],
+    # Subtotal
+    "subtotal": [
+        r"SUBTOTAL[:\s]+([\d.,]+)",
+        r"(?:SUBTOTAL|Subtotal)[:\s]*([\d\s.,]+?)(?=\n|IVA)"
+    ],
+    # IVA
+    "iva": [
+        r"IVA[^0-9]+([\d.,]+)",
+        r"(?:IVA|iva)[^\d]+([\d\s.,]+?)(?=\n)"
+    ],
+    # Total a pagar
+    "total_a_pagar": [
+        r"TOTAL\s*A?\s*PAGAR[:\s]+([\d.,]+)",
+        r"TOTAL[:\s]+([\d.,]+)"
+    ]
+}
+
+# Función para buscar el valor de un campo usando patrones
+# campo: el nombre del campo que se busca (por claridad, pero no se usa en el match directo)
+# lista_patrones: patrones predefinidos para cada campo
+# texto: texto sobre el cual buscar
+
+def buscar_valor(lista_patrones, texto):
+    """
+    Igual que extraer_valor, pero indica también qué patrón encontró el valor
+    (0 = el principal; los siguientes son alternativas menos precisas).
+
+    Retorna:
+    - (valor, indice_patron), o (None, None) si ningún patrón coincide
+    """
+    for indice, patron in enumerate(lista_patrones):
+        # Busca usando el patrón con flags para ignorar mayúsculas/minúsculas y saltos de línea
+        match = re.search(patron, texto, FLAGS_PATRONES)
+        if match:
+            # Extrae y limpia el valor (los patrones sin grupo, como "concepto",
+            # devuelven la coincidencia completa)
+            valor = match.group(1) if match.re.groups else match.group(0)
+            return _limpiar(valor), indice
+    return None, None
+
+def _limpiar(valor):
+    """Elimina espacios y caracteres erróneos extra."""
+    return re.sub(r'\s+', ' ', valor.strip())
+
+def extraer_valor(campo, lista_patrones, texto):
+    """Intenta múltiples patrones hasta encontrar uno que funcione"""
+    valor, _ = buscar_valor(lista_patrones, texto)
+    if valor is not None:
+        return valor
+    # Si no encuentra, retorna "No encontrado"
+    return "No encontrado"
+
+
+def _plegar(texto):
+    """
+    Pliega mayúsculas/minúsculas conservando la longitud, para que las posiciones
+    del texto plegado coincidan con las del original. Retorna None si no es posible
+    (caracteres como 'ß' o 'İ' cambian de longitud al plegarse).
+    """
+    # 'ı' (i sin punto) coincide con 'i' en re.IGNORECASE, pero casefold no la cambia
+    plegado = texto.casefold().replace('ı', 'i')
+    return plegado if len(plegado) == len(texto) else None
+
+
+def _plegar_patron(patron):
+    """
+    Pliega los caracteres literales de un patrón sin tocar los escapes (\\d, \\s...)
+    ni la sintaxis de grupos con nombre ((?P<nombre>...), (?P=nombre)).
+    """
+    return re.sub(r'\\.|\(\?P[<=][^>)]*[>)]|.',
+                  lambda m: m.group(0) if len(m.group(0)) > 1 else m.group(0).casefold(),
+                  patron, flags=re.DOTALL)
+
+
+def _primeros_caracteres(elementos):
+    """
+    Clases de caracteres (como fragmentos de [...]) por las que puede empezar una
+    coincidencia del patrón ya analizado por sre_parse. Retorna None si no se puede
+    acotar (patrones que pueden empezar por cualquier carácter o coincidir vacíos).
+    """
+    if not len(elementos):
+        return None
+    op, av = elementos[0]
+    if op is sre_constants.LITERAL:
+        return {re.escape(chr(av))}
+    if op is sre_constants.IN:
+        fragmentos = set()
+        for op_clase, av_clase in av:
+            if op_clase is sre_constants.LITERAL:
+                fragmentos.add(re.escape(chr(av_clase)))
+            elif op_clase is sre_constants.RANGE:
+                fragmentos.add(f"{re.escape(chr(av_clase[0]))}-{re.escape(chr(av_clase[1]))}")
+            elif op_clase is sre_constants.CATEGORY and av_clase in _CATEGORIAS:
+                fragmentos.add(_CATEGORIAS[av_clase])
+            else:
+                return None
+        return fragmentos
+    if op is sre_constants.SUBPATTERN:
+        _, flags_activados, flags_desactivados, subpatron = av
+        return None if flags_activados or flags_desactivados else _primeros_caracteres(subpatron)
+    if op is sre_constants.BRANCH:
+        fragmentos = set()
+        for rama in av[1]:
+            primeros = _primeros_caracteres(rama)
+            if primeros is None:
+                return None
+            fragmentos |= primeros
+        return fragmentos
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+        return _primeros_caracteres(av[2])
+    return None
+
+
+_CATEGORIAS = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_WORD: r"\w",
+}
+
+
+class EscanerPatrones:
+    """
+    Busca todos los campos de una tabla de patrones en una sola pasada por el texto.
+
+    Con re.IGNORECASE, una alternancia de muchos patrones es más lenta que buscarlos
+    uno a uno, porque el motor de re deja de descartar posiciones por su primer carácter.
+    Por eso el escáner pliega el texto a minúsculas una vez y recorre el texto plegado
+    con una alternancia de todos los patrones (también plegados) sin IGNORECASE. Cada
+    posición donde empieza algún patrón se confirma con los patrones originales, así
+    que el resultado es exactamente el de probar cada lista en orden con buscar_valor.
+    Si se conocen los caracteres por los que empieza cada patrón, la alternancia se
+    precede de esa clase, que el motor sí usa para saltar posiciones.
+
+    Al encontrar el patrón k de un campo se descartan sus alternativas k+1, k+2...
+    (ya no pueden ganar); cuando aparece el patrón principal el campo queda resuelto
+    y deja de buscarse. La pasada termina cuando no quedan patrones activos.
+
+    Uso:
+        escaner = EscanerPatrones(patterns)
+        resultados = escaner.buscar_todos(texto)   # campo -> (valor, indice_patron)
+    """
+
+    def __init__(self, tabla_patrones):
+        """
+        Parámetros:
+        - tabla_patrones: diccionario campo -> lista de patrones en orden de prioridad
+        """
+        self.tabla_patrones = tabla_patrones
+        # Cada patrón con su campo y su posición en la lista de prioridad
+        self._patrones = [
+            (campo, indice, re.compile(patron, FLAGS_PATRONES), _plegar_patron(patron))
+            for campo, lista in tabla_patrones.items()
+            for indice, patron in enumerate(lista)
+        ]
+        # Patrones que dejan de buscarse cuando coincide cada uno: él mismo y las
+        # alternativas de menor prioridad de su campo
+        self._descartados_por = [
+            frozenset(j for j, (campo_j, indice_j, _, _) in enumerate(self._patrones)
+                      if campo_j == campo and indice_j >= indice)
+            for campo, indice, _, _ in self._patrones
+        ]
+        # Caracteres (plegados) por los que puede empezar cada patrón, o None si no se sabe
+        self._primeros = [
+            _primeros_caracteres(sre_parse.parse(plegado, re.DOTALL))
+            for _, _, _, plegado in self._patrones
+        ]
+        # Carácter -> patrones que pueden empezar por él (se rellena al escanear)
+        self._por_caracter = {}
+        # El escáner con todos los patrones se compila al crear el objeto; los de los
+        # subconjuntos que van quedando activos, la primera vez que se necesitan
+        self._disparador = lru_cache(maxsize=None)(self._compilar_disparador)
+        self._disparador(tuple(range(len(self._patrones))))
+
+    def _compilar_disparador(self, activos):
+        """Alternancia de los patrones activos (plegados), sin IGNORECASE."""
+        alternancia = "|".join(f"(?:{self._patrones[i][3]})" for i in activos)
+        primeros = set()
+        for i in activos:
+            if self._primeros[i] is None:
+                return re.compile(alternancia, re.DOTALL)
+            primeros |= self._primeros[i]
+        # Consume el primer carácter (búsqueda rápida por clase) y vuelve atrás para
+        # comprobar la alternancia desde esa posición
+        return re.compile(f"[{''.join(sorted(primeros))}](?<=(?=(?:{alternancia})).)", re.DOTALL)
+
+    def _patrones_por_caracter(self, caracter):
+        """Identificadores de los patrones que pueden empezar por el carácter (plegado)."""
+        ids = self._por_caracter.get(caracter)
+        if ids is None:
+            ids = frozenset(
+                i for i, primeros in enumerate(self._primeros)
+                if primeros is None or re.fullmatch(f"[{''.join(primeros)}]", caracter, re.DOTALL)
+            )
+            self._por_caracter[caracter] = ids
+        return ids
+
+    def buscar_todos(self, texto):
+        """
+        Retorna un diccionario campo -> (valor, indice_patron), o (None, None) si
+        ningún patrón del campo coincide.
+        """
+        plegado = _plegar(texto)
+        if plegado is None:
+            return {campo: buscar_valor(lista, texto) for campo, lista in self.tabla_patrones.items()}
+
+        # Mejor coincidencia de cada campo: (indice_patron, match)
+        mejores = {}
+        activos = tuple(range(len(self._patrones)))
+        posicion = 0
+        while activos:
+            candidato = self._disparador(activos).search(plegado, posicion)
+            if candidato is None:
+                break
+            posicion = candidato.start()
+
+            # Solo se confirman con el patrón original los que pueden empezar por este carácter
+            posibles = self._patrones_por_caracter(plegado[posicion])
+            descartar = set()
+            for i in activos:
+                if i not in posibles or i in descartar:
+                    continue
+                match = self._patrones[i][2].match(texto, posicion)
+                if match is not None:
+                    mejores[self._patrones[i][0]] = (self._patrones[i][1], match)
+                    descartar |= self._descartados_por[i]
+            if descartar:
+                activos = tuple(j for j in activos if j not in descartar)
+            posicion += 1
+
+        resultados = {}
+        for campo in self.tabla_patrones:
+            if campo not in mejores:
+                resultados[campo] = (None, None)
+                continue
+            indice, match = mejores[campo]
+            valor = match.group(1) if match.re.groups else match.group(0)
+            resultados[campo] = (_limpiar(valor), indice)
+        return resultados
+
+
+# Escáner de la tabla de patrones por defecto, compilado al importar el módulo
+escaner_patrones = EscanerPatrones(patterns)
+
+
+def extraer_campos(texto):
+    """
+    Extrae todos los campos de la tabla de patrones en una sola pasada.
+
+    Retorna:
+    - Diccionario campo -> valor, o "No encontrado" (como extraer_valor)
+    """
+    return {
+        campo: valor if valor is not None else "No encontrado"
+        for campo, (valor, _) in escaner_patrones.buscar_todos(texto).items()
+    }
@@ -0,0 +1,216 @@
+"""
+Perfilado de los documentos lentos: se perfila cada documento y solo se guarda el
+perfil de los que superan un umbral de tiempo o de memoria.
+
+- Desactivado por defecto (PROFILE_SLOW_DOCS=true para activarlo): perfilar() no hace
+  nada y no añade coste
+- Cada documento se perfila con cProfile (solo el hilo que lo procesa) y, con
+  PROFILE_MIN_MB, se mide el pico de memoria con tracemalloc
+- Si el documento tarda menos de PROFILE_MIN_SECONDS y no supera PROFILE_MIN_MB, el
+  perfil se descarta. Si no, se guardan en PROFILE_DIR:
+  - <etapa>-<hash>-<fecha>.prof: estadísticas de cProfile (pstats, snakeviz,
+    gprof2dot o flameprof para verlas como grafo o gráfico de llamas)
+  - <etapa>-<hash>-<fecha>.json: documento, hash SHA-256 del contenido, duración,
+    memoria y las funciones con más tiempo acumulado
+- PROFILE_SAMPLE: fracción de documentos que se perfilan (por defecto, todos)
+- Los procesos de un pool escriben sus perfiles en la misma carpeta, así que el
+  informe los reúne todos
+
+Si una llamada perfilada contiene otra (ej: extract_invoice_info y, dentro, el OCR),
+solo cuenta la exterior. Con varios hilos el pico de memoria es el del proceso entero
+durante el documento, no solo el de ese hilo.
+
+Uso:
+    inicio = time.time()
+    with perfilar("extraccion", ruta_pdf):
+        datos = extraer(ruta_pdf)
+    ...
+    imprimir_informe(desde=inicio)  # los más lentos del lote, con sus funciones más costosas
+
+    python -m comun.perfilado [carpeta] [--top 10]
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from comun.cache import hash_contenido
+
+ACTIVO = os.getenv("PROFILE_SLOW_DOCS", "false").lower() in ("1", "true", "yes")
+CARPETA = os.getenv("PROFILE_DIR", "perfiles")
+MIN_SEGUNDOS = float(os.getenv("PROFILE_MIN_SECONDS", "5"))
+# 0 = no se mide la memoria (tracemalloc ralentiza las asignaciones)
+MIN_MB = float(os.getenv("PROFILE_MIN_MB", "0"))
+MUESTREO = float(os.getenv("PROFILE_SAMPLE", "1"))
+TOP = int(os.getenv("PROFILE_TOP", "10"))
+
+# Funciones con más tiempo acumulado que se anotan en el .json de cada perfil
+FUNCIONES_INFORME = 8
+
+# Un solo perfil activo por hilo: las llamadas anidadas no se perfilan por separado
+_hilo = threading.local()
+_lock_memoria = threading.Lock()
+
+
+def _funciones_costosas(perfil, n=FUNCIONES_INFORME):
+    """Las n funciones con más tiempo acumulado: [{funcion, llamadas, total_s, acumulado_s}]."""
+    estadisticas = pstats.Stats(perfil, stream=io.StringIO())
+    filas = []
+    for (archivo, linea, nombre), (_, llamadas, total, acumulado, _) in estadisticas.stats.items():
+        # El propio perfilar() (y el with que lo envuelve) no aporta nada
+        if archivo in (__file__, contextlib.__file__) or "_lsprof.Profiler" in nombre:
+            continue
+        ubicacion = f"{os.path.basename(archivo)}:{linea}" if linea else archivo
+        filas.append({"funcion": f"{nombre} ({ubicacion})", "llamadas": llamadas,
+                      "total_s": round(total, 4), "acumulado_s": round(acumulado, 4)})
+    filas.sort(key=lambda fila: fila["acumulado_s"], reverse=True)
+    return filas[:n]
+
+
+def _guardar(perfil, etapa, documento, contenido, segundos, memoria_mb, carpeta):
+    if contenido is None and isinstance(documento, str) and os.path.isfile(documento):
+        contenido = documento
+    elif hasattr(contenido, "tobytes"):
+        # Array de Numpy (ej: una imagen ya cargada en memoria)
+        contenido = contenido.tobytes()
+    huella = hash_contenido(contenido) if contenido is not None else None
+    nombre = f"{etapa}-{(huella or 'sin_hash')[:12]}-{datetime.now():%Y%m%d-%H%M%S-%f}"
+    os.makedirs(carpeta, exist_ok=True)
+
+    perfil.dump_stats(os.path.join(carpeta, nombre + ".prof"))
+    datos = {
+        "etapa": etapa,
+        "documento": os.path.basename(documento) if isinstance(documento, str) else str(documento),
+        "ruta": documento if isinstance(documento, str) else None,
+        "hash": huella,
+        "segundos": round(segundos, 3),
+        "memoria_mb": None if memoria_mb is None else round(memoria_mb, 1),
+        "fecha": time.time(),
+        "pid": os.getpid(),
+        "perfil": nombre + ".prof",
+        "funciones": _funciones_costosas(perfil),
+    }
+    # Se escribe aparte y se renombra: el informe nunca lee un .json a medias
+    temporal = os.path.join(carpeta, nombre + ".json.tmp")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(datos, archivo, ensure_ascii=False, indent=2)
+    os.replace(temporal, os.path.join(carpeta, nombre + ".json"))
+    return datos
+
+
+@contextlib.contextmanager
+def perfilar(etapa, documento, contenido=None, activo=None, min_segundos=None, min_mb=None,
+             carpeta=None):
+    """
+    Perfila el bloque y guarda el perfil si el documento es lento o usa mucha memoria.
+
+    Parámetros:
+    - etapa: nombre de lo que se mide (ej: "extraccion", "preprocesado", "ocr", "llm")
+    - documento: nombre o ruta del documento (la ruta también sirve para el hash)
+    - contenido: bytes, array de Numpy o ruta de los que se calcula el hash, si no es el
+      propio documento (ej: la imagen de una página renderizada)
+    - activo, min_segundos, min_mb, carpeta: por defecto, los de las variables de entorno
+
+    El hash solo se calcula para los documentos que se guardan.
+    """
+    activo = ACTIVO if activo is None else activo
+    if not activo or getattr(_hilo, "perfilando", False) or random.random() >= MUESTREO:
+        yield
+        return
+
+    min_segundos = MIN_SEGUNDOS if min_segundos is None else min_segundos
+    min_mb = MIN_MB if min_mb is None else min_mb
+    if min_mb:
+        with _lock_memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memoria_inicial = tracemalloc.get_traced_memory()[0]
+
+    perfil = cProfile.Profile()
+    _hilo.perfilando = True
+    inicio = time.perf_counter()
+    try:
+        perfil.enable()
+    except ValueError:
+        # Ya hay otro perfilador activo en el hilo (ej: el script se lanzó con -m cProfile)
+        _hilo.perfilando = False
+        yield
+        return
+    try:
+        yield
+    finally:
+        perfil.disable()
+        segundos = time.perf_counter() - inicio
+        _hilo.perfilando = False
+        memoria_mb = None
+        if min_mb:
+            memoria_mb = (tracemalloc.get_traced_memory()[1] - memoria_inicial) / (1024 * 1024)
+        if segundos >= min_segundos or (memoria_mb is not None and memoria_mb >= min_mb):
+            _guardar(perfil, etapa, documento, contenido, segundos, memoria_mb, carpeta or CARPETA)
+
+
+def perfiles(carpeta=None, desde=None):
+    """Metadatos (.json) de los perfiles guardados, opcionalmente solo los posteriores a desde (time.time())."""
+    carpeta = carpeta or CARPETA
+    if not os.path.isdir(carpeta):
+        return []
+    resultado = []
+    for nombre in os.listdir(carpeta):
+        if not nombre.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(carpeta, nombre), encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            continue
+        if desde is None or datos["fecha"] >= desde:
+            resultado.append(datos)
+    return resultado
+
+
+def informe(carpeta=None, desde=None, top=None, funciones=3):
+    """
+    Texto con los documentos más lentos y, de cada uno, sus funciones más costosas.
+
+    Parámetros:
+    - carpeta: carpeta de los perfiles (por defecto, PROFILE_DIR)
+    - desde: solo los perfiles guardados a partir de este time.time() (ej: inicio del lote)
+    - top: número de documentos (por defecto, PROFILE_TOP)
+    - funciones: funciones que se muestran de cada documento
+    """
+    carpeta = carpeta or CARPETA
+    lentos = sorted(perfiles(carpeta, desde), key=lambda datos: datos["segundos"], reverse=True)
+    if not lentos:
+        return f"Sin documentos lentos en {carpeta}"
+    lineas = [f"Documentos más lentos ({min(len(lentos), top or TOP)} de {len(lentos)} en {carpeta}):"]
+    for datos in lentos[:top or TOP]:
+        memoria = "" if datos["memoria_mb"] is None else f", {datos['memoria_mb']} MB"
+        lineas.append(f"- {datos['segundos']}s{memoria} [{datos['etapa']}] {datos['documento']} "
+                      f"(hash {(datos['hash'] or '-')[:12]}, perfil {datos['perfil']})")
+        for funcion in datos["funciones"][:funciones]:
+            lineas.append(f"    {funcion['acumulado_s']}s acumulado, {funcion['llamadas']} llamadas: {funcion['funcion']}")
+    return "\n".join(lineas)
+
+
+def imprimir_informe(desde=None, carpeta=None, top=None):
+    """Muestra el informe al terminar un lote, solo si el perfilado está activo."""
+    if ACTIVO:
+        print(informe(carpeta, desde, top))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Documentos más lentos de los perfiles guardados")
+    parser.add_argument("carpeta", nargs="?", default=CARPETA)
+    parser.add_argument("--top", type=int, default=TOP)
+    parser.add_argument("--funciones", type=int, default=3, help="funciones por documento")
+    args = parser.parse_args()
+    print(informe(args.carpeta, top=args.top, funciones=args.funciones))
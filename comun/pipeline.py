@@ -0,0 +1,568 @@
+"""
+Pipeline por etapas conectadas con colas acotadas.
+
+- Cada etapa tiene su propio modelo de concurrencia:
+  - "procesos": pool de procesos, para el trabajo de CPU (renderizado, preprocesado)
+  - "async": bucle asyncio en un hilo, para las llamadas de red (OCR en la nube)
+  - "hilos": hilos, para librerías síncronas que esperan E/S (o trabajo ligero)
+- Entre dos etapas hay una cola de tam_cola elementos. Si una etapa es lenta, su cola se
+  llena y la anterior se detiene al entregar (contrapresión): la memoria no depende del
+  tamaño del lote, sino de tam_cola y de los elementos en vuelo de cada etapa
+- Una etapa puede trabajar por lotes (lote=N: recibe listas de hasta N elementos) y puede
+  expandir (un PDF -> varias páginas). Si la función devuelve None, el elemento se descarta
+- Métricas por etapa: elementos, errores, profundidad de su cola (actual y máxima),
+  elementos por segundo, latencia por llamada (p50/p95), utilización, tiempo esperando
+  entrada (le falta trabajo) y tiempo esperando para entregar (la siguiente etapa no da
+  abasto). La etapa con más utilización es el cuello de botella
+- Si una etapa entera falla (no un elemento: su contexto no se abre, el pool de procesos
+  se rompe), las demás se cancelan y ejecutar() relanza ese error en lugar de quedarse
+  esperando en colas que nadie vacía
+
+Uso:
+    pipeline = Pipeline([
+        Etapa("render", renderizar, modo="procesos", workers=4),
+        Etapa("ocr", ocr_async, modo="async", workers=16),
+        Etapa("extraer", extraer_lote, lote=16),
+        Etapa("guardar", guardar),
+    ], tam_cola=32)
+    for resultado in pipeline.ejecutar(tareas):
+        ...
+    print(pipeline.informe())
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from comun.metricas import PIPELINE_SEGUNDOS, ERRORES, evento
+
+MODOS = ("hilos", "procesos", "async")
+
+# Marca de fin de la entrada; recorre el pipeline detrás del último elemento
+_FIN = object()
+
+# Latencias que se guardan por etapa para los percentiles (las más recientes)
+MAX_LATENCIAS = 10000
+
+# Segundos entre comprobaciones de la cancelación mientras se espera en una cola
+_ESPERA_CANCELACION = 0.1
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista de valores, por el método del rango más cercano."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+
+class _ErrorEntrada:
+    """Excepción del iterable de entrada, que se relanza en ejecutar()."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Cancelado(Exception):
+    """Otra etapa falló (o se dejó de leer el resultado): los hilos terminan sin más."""
+
+
+def _cronometrar(funcion, unidad):
+    """Ejecuta la función en el proceso del pool y mide solo su tiempo (sin la espera en el pool)."""
+    inicio = time.perf_counter()
+    resultado = funcion(unidad)
+    return resultado, time.perf_counter() - inicio
+
+
+class Etapa:
+    """
+    Configuración de una etapa.
+    """
+
+    def __init__(self, nombre, funcion, modo="hilos", workers=1, lote=1, espera_lote=0.5,
+                 expande=False, contexto=None, tam_cola=None):
+        """
+        Parámetros:
+        - nombre: nombre en las métricas
+        - funcion: función que recibe un elemento (o una lista, si lote > 1) y devuelve el
+          resultado, o None para descartarlo. En modo "procesos" debe poder enviarse a
+          otro proceso (función de módulo o functools.partial); en modo "async" es una
+          corrutina
+        - modo: "hilos", "procesos" o "async"
+        - workers: hilos, procesos o corrutinas simultáneas
+        - lote: elementos por llamada; la función recibe una lista y devuelve un iterable
+          con los resultados (uno por elemento o los que correspondan)
+        - espera_lote: segundos máximos esperando a completar un lote
+        - expande: la función devuelve un iterable y se entrega cada uno de sus elementos
+        - contexto: solo en modo "async": función que devuelve un gestor de contexto
+          asíncrono (ej: un cliente HTTP) que se abre en el bucle de la etapa; su valor se
+          pasa como primer argumento a la función
+        - tam_cola: tamaño de la cola de entrada de la etapa (por defecto, el del pipeline)
+        """
+        if modo not in MODOS:
+            raise ValueError(f"Modo desconocido: {modo} (opciones: {MODOS})")
+        if contexto is not None and modo != "async":
+            raise ValueError("contexto solo se usa en las etapas async")
+        self.nombre = nombre
+        self.funcion = funcion
+        self.modo = modo
+        self.workers = max(1, workers)
+        self.lote = max(1, lote)
+        self.espera_lote = espera_lote
+        self.expande = expande or self.lote > 1
+        self.contexto = contexto
+        self.tam_cola = tam_cola
+
+
+class _EstadoEtapa:
+    """Colas, hilos y contadores de una etapa durante una ejecución."""
+
+    def __init__(self, etapa, entrada, salida):
+        self.etapa = etapa
+        self.entrada = entrada
+        self.salida = salida
+        self.lock = threading.Lock()
+        self.vivos = etapa.workers if etapa.modo == "hilos" else 1
+        self.entradas = 0
+        self.salidas = 0
+        self.errores = 0
+        self.en_vuelo = 0
+        self.cola_max = 0
+        self.ocupado = 0.0
+        self.latencias = deque(maxlen=MAX_LATENCIAS)
+        self.espera_entrada = 0.0
+        self.espera_salida = 0.0
+        self.inicio = None
+        self.fin = None
+
+
+class Pipeline:
+    """
+    Ejecuta una secuencia de etapas; cada ejecución crea sus colas, hilos y pools.
+    """
+
+    def __init__(self, etapas, tam_cola=16, al_error=None, intervalo_informe=None, al_informe=print):
+        """
+        Parámetros:
+        - etapas: lista de Etapa, en orden
+        - tam_cola: tamaño por defecto de la cola de entrada de cada etapa
+        - al_error: función (nombre_etapa, elemento, excepción) para los elementos que
+          fallan (por defecto se imprime el error); el elemento se descarta
+        - intervalo_informe: segundos entre informes durante la ejecución (None = ninguno)
+        - al_informe: función que recibe el texto de cada informe
+        """
+        self.etapas = list(etapas)
+        self.tam_cola = tam_cola
+        self.al_error = al_error
+        self.intervalo_informe = intervalo_informe
+        self.al_informe = al_informe
+        self._estados = []
+        self._inicio = None
+        self._cancelar = threading.Event()
+        self._error = None
+
+    # ---- Colas ----
+
+    def _poner(self, cola, elemento):
+        """
+        put() que no se queda bloqueado para siempre: si la cola está llena y otra etapa
+        falla, lanza _Cancelado en lugar de esperar a un consumidor que ya no existe.
+        """
+        while True:
+            if self._cancelar.is_set():
+                raise _Cancelado()
+            try:
+                cola.put(elemento, timeout=_ESPERA_CANCELACION)
+                return
+            except queue.Full:
+                pass
+
+    def _obtener(self, cola, timeout=None):
+        """get() que lanza _Cancelado si se cancela la ejecución; queue.Empty si vence timeout."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._cancelar.is_set():
+                raise _Cancelado()
+            espera = _ESPERA_CANCELACION
+            if limite is not None:
+                espera = min(espera, limite - time.monotonic())
+                if espera <= 0:
+                    raise queue.Empty
+            try:
+                return cola.get(timeout=espera)
+            except queue.Empty:
+                pass
+
+    def _fallo_fatal(self, error):
+        """Una etapa no puede seguir: se guarda el primer error y se cancelan las demás."""
+        with self._lock_error:
+            if self._error is None:
+                self._error = error
+        self._cancelar.set()
+
+    def _tomar(self, estado, timeout=None):
+        """Siguiente elemento de la entrada (o _FIN); mide la espera. queue.Empty si vence timeout."""
+        profundidad = estado.entrada.qsize()
+        inicio = time.perf_counter()
+        try:
+            elemento = self._obtener(estado.entrada, timeout)
+        finally:
+            with estado.lock:
+                estado.espera_entrada += time.perf_counter() - inicio
+                estado.cola_max = max(estado.cola_max, profundidad)
+        return elemento
+
+    def _siguiente(self, estado):
+        """
+        Retorna (unidad, fin): unidad es un elemento, una lista (si lote > 1) o None si
+        no queda nada; fin indica que se recibió _FIN.
+        """
+        etapa = estado.etapa
+        elemento = self._tomar(estado)
+        while isinstance(elemento, _ErrorEntrada):
+            # El error de la entrada no pasa por las funciones: va directo al final
+            self._poner(estado.salida, elemento)
+            elemento = self._tomar(estado)
+        if elemento is _FIN:
+            return None, True
+        if etapa.lote == 1:
+            return elemento, False
+        # Completa el lote hasta lote elementos o hasta que pase espera_lote
+        lote = [elemento]
+        limite = time.monotonic() + etapa.espera_lote
+        while len(lote) < etapa.lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                elemento = self._tomar(estado, timeout=restante)
+            except queue.Empty:
+                break
+            if elemento is _FIN:
+                return lote, True
+            if isinstance(elemento, _ErrorEntrada):
+                self._poner(estado.salida, elemento)
+                continue
+            lote.append(elemento)
+        return lote, False
+
+    def _entregar(self, estado, resultado):
+        """Pasa el resultado a la siguiente cola (se bloquea si está llena)."""
+        if resultado is None:
+            return
+        resultados = resultado if estado.etapa.expande else (resultado,)
+        for elemento in resultados:
+            if elemento is None:
+                continue
+            inicio = time.perf_counter()
+            self._poner(estado.salida, elemento)
+            with estado.lock:
+                estado.espera_salida += time.perf_counter() - inicio
+                estado.salidas += 1
+
+    def _contar(self, estado, unidad, segundos):
+        with estado.lock:
+            estado.entradas += len(unidad) if estado.etapa.lote > 1 else 1
+            estado.ocupado += segundos
+            estado.latencias.append(segundos)
+        # Los tiempos de las etapas en procesos solo llegan al registro por aquí: el
+        # registro de cada proceso hijo no se exporta
+        PIPELINE_SEGUNDOS.observar(segundos, etapa=estado.etapa.nombre)
+
+    def _fallo(self, estado, unidad, error):
+        with estado.lock:
+            estado.errores += len(unidad) if estado.etapa.lote > 1 else 1
+        ERRORES.inc(etapa=estado.etapa.nombre, origen="pipeline")
+        if self.al_error is not None:
+            self.al_error(estado.etapa.nombre, unidad, error)
+        else:
+            evento("error_etapa", nivel="error", etapa=estado.etapa.nombre, error=str(error))
+
+    def _terminar(self, estado):
+        """Un worker recibió _FIN: el último de la etapa lo pasa a la siguiente."""
+        with estado.lock:
+            estado.vivos -= 1
+            ultimo = estado.vivos == 0
+            if ultimo:
+                estado.fin = time.perf_counter()
+        if ultimo:
+            self._poner(estado.salida, _FIN)
+        else:
+            # Para que lo reciban los demás workers de la etapa
+            self._poner(estado.entrada, _FIN)
+
+    # ---- Modos de ejecución ----
+
+    def _ejecutar_hilos(self, estado):
+        funcion = estado.etapa.funcion
+        while True:
+            unidad, fin = self._siguiente(estado)
+            if unidad is not None:
+                inicio = time.perf_counter()
+                try:
+                    resultado = funcion(unidad)
+                except Exception as e:
+                    self._contar(estado, unidad, time.perf_counter() - inicio)
+                    self._fallo(estado, unidad, e)
+                else:
+                    self._contar(estado, unidad, time.perf_counter() - inicio)
+                    self._entregar(estado, resultado)
+            if fin:
+                self._terminar(estado)
+                return
+
+    def _ejecutar_procesos(self, estado):
+        etapa = estado.etapa
+        # Como mucho 2 unidades por proceso en vuelo: los procesos nunca esperan trabajo,
+        # pero no se leen más elementos de los que se pueden atender
+        max_en_vuelo = etapa.workers * 2
+        pool = ProcessPoolExecutor(max_workers=etapa.workers)
+        cancelado = True
+        try:
+            pendientes = {}
+            fin = False
+            while True:
+                # Envía trabajo hasta llenar el pool. Con algo en vuelo no se espera a la
+                # entrada, para poder entregar los resultados en cuanto terminan
+                while not fin and len(pendientes) < max_en_vuelo:
+                    if pendientes and estado.entrada.empty():
+                        break
+                    unidad, fin = self._siguiente(estado)
+                    if unidad is not None:
+                        pendientes[pool.submit(_cronometrar, etapa.funcion, unidad)] = unidad
+                if not pendientes:
+                    if fin:
+                        break
+                    continue
+                with estado.lock:
+                    estado.en_vuelo = len(pendientes)
+                lleno = fin or len(pendientes) >= max_en_vuelo
+                hechos, _ = wait(pendientes, timeout=None if lleno else 0.01, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    unidad = pendientes.pop(futuro)
+                    try:
+                        resultado, segundos = futuro.result()
+                    except BrokenProcessPool:
+                        # Un proceso murió: el pool ya no sirve para ningún elemento
+                        raise
+                    except Exception as e:
+                        self._contar(estado, unidad, 0.0)
+                        self._fallo(estado, unidad, e)
+                    else:
+                        self._contar(estado, unidad, segundos)
+                        self._entregar(estado, resultado)
+            with estado.lock:
+                estado.en_vuelo = 0
+            cancelado = False
+        finally:
+            # Si la ejecución se cancela no se espera a lo que quede en el pool
+            pool.shutdown(wait=not cancelado, cancel_futures=cancelado)
+        self._terminar(estado)
+
+    def _ejecutar_async(self, estado):
+        etapa = estado.etapa
+
+        async def procesar(valor, unidad, semaforo):
+            inicio = time.perf_counter()
+            try:
+                if etapa.contexto is not None:
+                    resultado = await etapa.funcion(valor, unidad)
+                else:
+                    resultado = await etapa.funcion(unidad)
+            except Exception as e:
+                self._contar(estado, unidad, time.perf_counter() - inicio)
+                self._fallo(estado, unidad, e)
+            else:
+                self._contar(estado, unidad, time.perf_counter() - inicio)
+                # La entrega puede bloquearse (contrapresión): fuera del bucle de eventos
+                await loop.run_in_executor(None, self._entregar, estado, resultado)
+            finally:
+                with estado.lock:
+                    estado.en_vuelo -= 1
+                semaforo.release()
+
+        async def principal(valor):
+            semaforo = asyncio.Semaphore(etapa.workers)
+            tareas = set()
+            while True:
+                # Solo se lee un elemento cuando hay hueco para procesarlo
+                await semaforo.acquire()
+                unidad, fin = await loop.run_in_executor(None, self._siguiente, estado)
+                if unidad is None:
+                    semaforo.release()
+                else:
+                    with estado.lock:
+                        estado.en_vuelo += 1
+                    tarea = asyncio.create_task(procesar(valor, unidad, semaforo))
+                    tareas.add(tarea)
+                    tarea.add_done_callback(tareas.discard)
+                if fin:
+                    break
+            if tareas:
+                await asyncio.gather(*tareas)
+
+        async def con_contexto():
+            nonlocal loop
+            loop = asyncio.get_running_loop()
+            if etapa.contexto is None:
+                await principal(None)
+            else:
+                async with etapa.contexto() as valor:
+                    await principal(valor)
+
+        loop = None
+        # Si el contexto (ej: el cliente HTTP) no se puede abrir, el error llega a
+        # _ejecutar_etapa, que cancela el resto del pipeline
+        asyncio.run(con_contexto())
+        self._terminar(estado)
+
+    # ---- Ejecución ----
+
+    def _ejecutar_etapa(self, ejecutor, estado):
+        """Hilo de una etapa: cualquier error que no sea de un elemento cancela el pipeline."""
+        try:
+            ejecutor(estado)
+        except _Cancelado:
+            pass
+        except BaseException as e:
+            evento("etapa_detenida", nivel="error", etapa=estado.etapa.nombre,
+                   error=f"{type(e).__name__}: {e}")
+            self._fallo_fatal(e)
+
+    def _alimentar(self, entradas, cola):
+        try:
+            try:
+                for elemento in entradas:
+                    self._poner(cola, elemento)
+            except _Cancelado:
+                return
+            except Exception as e:
+                self._poner(cola, _ErrorEntrada(e))
+            self._poner(cola, _FIN)
+        except _Cancelado:
+            pass
+
+    def ejecutar(self, entradas):
+        """
+        Pasa los elementos de entradas por todas las etapas.
+
+        Retorna (generador):
+        - Resultados de la última etapa, en el orden en que terminan
+
+        Si una etapa no puede continuar (su contexto no se abre, el pool de procesos se
+        rompe...), se cancelan las demás y ejecutar() relanza ese primer error. Los
+        errores de un elemento concreto no detienen nada: van a al_error.
+        """
+        self._cancelar = threading.Event()
+        self._lock_error = threading.Lock()
+        self._error = None
+        colas = [queue.Queue(maxsize=etapa.tam_cola or self.tam_cola) for etapa in self.etapas]
+        colas.append(queue.Queue(maxsize=self.tam_cola))
+        self._estados = [_EstadoEtapa(etapa, colas[i], colas[i + 1]) for i, etapa in enumerate(self.etapas)]
+        self._inicio = time.perf_counter()
+
+        hilos = [threading.Thread(target=self._alimentar, args=(entradas, colas[0]),
+                                  name="pipeline-entrada", daemon=True)]
+        ejecutores = {"hilos": self._ejecutar_hilos, "procesos": self._ejecutar_procesos,
+                      "async": self._ejecutar_async}
+        for estado in self._estados:
+            estado.inicio = time.perf_counter()
+            workers = estado.etapa.workers if estado.etapa.modo == "hilos" else 1
+            for i in range(workers):
+                hilos.append(threading.Thread(target=self._ejecutar_etapa,
+                                              args=(ejecutores[estado.etapa.modo], estado),
+                                              name=f"pipeline-{estado.etapa.nombre}-{i}", daemon=True))
+        for hilo in hilos:
+            hilo.start()
+
+        parar_informe = threading.Event()
+        if self.intervalo_informe:
+            def informar():
+                while not parar_informe.wait(self.intervalo_informe):
+                    self.al_informe(self.informe())
+            threading.Thread(target=informar, name="pipeline-informe", daemon=True).start()
+
+        terminado = False
+        try:
+            while True:
+                try:
+                    resultado = self._obtener(colas[-1])
+                except _Cancelado:
+                    break
+                if resultado is _FIN:
+                    terminado = True
+                    break
+                if isinstance(resultado, _ErrorEntrada):
+                    raise resultado.error
+                yield resultado
+        finally:
+            parar_informe.set()
+            if not terminado:
+                # Error, o quien consume el generador dejó de leer: los hilos no deben
+                # quedarse esperando en colas que nadie va a vaciar
+                self._cancelar.set()
+                for hilo in hilos:
+                    hilo.join()
+        for hilo in hilos:
+            hilo.join()
+        if self._error is not None:
+            raise self._error
+
+    def estadisticas(self):
+        """
+        Métricas de cada etapa de la última ejecución (también durante la ejecución).
+
+        Retorna:
+        - Diccionario nombre -> métricas
+        """
+        ahora = time.perf_counter()
+        resultado = {}
+        for estado in self._estados:
+            etapa = estado.etapa
+            with estado.lock:
+                segundos = max((estado.fin or ahora) - (estado.inicio or ahora), 1e-9)
+                resultado[etapa.nombre] = {
+                    "modo": etapa.modo,
+                    "workers": etapa.workers,
+                    "entradas": estado.entradas,
+                    "salidas": estado.salidas,
+                    "errores": estado.errores,
+                    "en_vuelo": estado.en_vuelo,
+                    "cola": estado.entrada.qsize(),
+                    "cola_max": estado.cola_max,
+                    "cola_capacidad": estado.entrada.maxsize,
+                    "por_segundo": round(estado.entradas / segundos, 2),
+                    # Segundos por llamada a la función (por lote, si lote > 1)
+                    "latencia_p50_s": round(percentil(estado.latencias, 50), 4),
+                    "latencia_p95_s": round(percentil(estado.latencias, 95), 4),
+                    # Fracción del tiempo con todos los workers ocupados
+                    "utilizacion": round(min(estado.ocupado / (segundos * etapa.workers), 1.0), 3),
+                    "espera_entrada_s": round(estado.espera_entrada, 3),
+                    "espera_salida_s": round(estado.espera_salida, 3),
+                }
+        return resultado
+
+    def cuello_de_botella(self):
+        """Nombre de la etapa con mayor utilización, o None si no se ha ejecutado."""
+        estadisticas = self.estadisticas()
+        if not estadisticas:
+            return None
+        return max(estadisticas, key=lambda nombre: estadisticas[nombre]["utilizacion"])
+
+    def informe(self):
+        """Tabla de texto con las métricas de cada etapa."""
+        lineas = [f"{'etapa':<12} {'modo':<8} {'entradas':>8} {'errores':>7} {'cola':>9} "
+                  f"{'max':>4} {'/s':>8} {'util.':>6} {'sin_trabajo_s':>13} {'bloqueada_s':>11}"]
+        for nombre, m in self.estadisticas().items():
+            lineas.append(
+                f"{nombre:<12} {m['modo']:<8} {m['entradas']:>8} {m['errores']:>7} "
+                f"{m['cola']:>4}/{m['cola_capacidad']:<4} {m['cola_max']:>4} {m['por_segundo']:>8} "
+                f"{m['utilizacion']:>6.0%} {m['espera_entrada_s']:>13} {m['espera_salida_s']:>11}"
+            )
+        cuello = self.cuello_de_botella()
+        if cuello:
+            lineas.append(f"Cuello de botella: {cuello}")
+        return "\n".join(lineas)
@@ -0,0 +1,434 @@
+"""
+Salida de resultados por lotes: CSV, JSONL y Parquet.
+
+- El archivo se abre una sola vez y las filas se acumulan en memoria; se escriben
+  cuando se llega a tam_lote filas o cada intervalo segundos, y siempre al cerrar
+- Se puede compartir entre hilos: escribir() y vaciar() están protegidas por un lock.
+  al_escribir se llama fuera de ese lock (de una en una), así que puede tardar o volver
+  a escribir en otra salida sin bloquear a los demás hilos
+- Un error al escribir no pierde filas: siguen en el buffer y se reintentan en el
+  siguiente vaciado. Los errores del hilo de vaciado periódico se registran y el hilo sigue
+- JSONL y Parquet llevan columnas con tipo: las fechas como fecha y los importes como
+  decimales exactos, para que quien los cargue no tenga que volver a interpretar textos.
+  El CSV conserva los valores tal como llegan (compatible con los archivos existentes)
+- Un valor que no se puede convertir a su tipo (o no cabe en la columna Parquet) se
+  escribe vacío y se cuenta en valores_no_convertidos: no hace fallar el lote
+
+Uso:
+    with abrir_salida("facturas_new.parquet", INVOICE_FIELDS, TIPOS_FACTURA) as salida:
+        salida.escribir({"Fecha": "20/02/2021", "Total a pagar": "52,00", ...})
+"""
+import csv
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from comun.lineas_factura import _separador_decimal_auto
+from comun.metricas import medir, evento, BYTES, FILAS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Tipos de columna: "texto", "fecha" o "decimal"
+TIPOS_FACTURA = {
+    "Fecha": "fecha",
+    "Subtotal": "decimal",
+    "IVA": "decimal",
+    "Total a pagar": "decimal",
+}
+
+# Decimales de las columnas "decimal" (importes y porcentajes)
+DECIMALES = 2
+
+# Formatos de fecha habituales en las facturas (día primero) y en ISO
+FORMATOS_FECHA = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%Y/%m/%d")
+
+_NO_NUMERICO = re.compile(r'[^\d,.\-]')
+
+
+def a_fecha(valor):
+    """
+    Convierte un texto de fecha ("20/02/2021", "2021-02-20"...) en datetime.date.
+    Retorna None si está vacío o no se reconoce.
+    """
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = str(valor or '').strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def a_decimal(valor):
+    """
+    Convierte un importe en Decimal: quita símbolos de moneda, % y espacios, y decide el
+    separador decimal igual que comun/lineas_factura.py: "1.234,56" y "1,234.56" (el
+    último es el decimal), "52,00" (un separador con dos cifras o menos detrás) y
+    "$1,234" o "1.234" (separador de miles).
+    Retorna None si está vacío o no es un número.
+    """
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, (int, float)):
+        return Decimal(str(valor))
+    texto = _NO_NUMERICO.sub('', str(valor or ''))
+    decimal = _separador_decimal_auto(texto)
+    for separador in {',': '.', '.': ','}.get(decimal, ',.'):
+        texto = texto.replace(separador, '')
+    if decimal:
+        texto = texto.replace(decimal, '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return None
+
+
+_CONVERSORES = {"fecha": a_fecha, "decimal": a_decimal}
+
+
+class SalidaResultados:
+    """
+    Base de las salidas: buffer, lock, vaciado por tamaño o por tiempo, y cierre.
+    Cada formato implementa _abrir(), _escribir_lote(filas) y _cerrar().
+    """
+
+    # Si las filas se pueden leer del archivo en cuanto se escribe un lote (False si
+    # el formato solo es legible una vez cerrado)
+    legible_al_escribir = True
+
+    # Nombre del formato en las métricas
+    formato = None
+
+    def __init__(self, ruta, columnas, tipos=None, tam_lote=500, intervalo=5.0, al_escribir=None):
+        """
+        Parámetros:
+        - ruta: archivo de salida
+        - columnas: nombres de las columnas, en orden
+        - tipos: diccionario columna -> "texto" | "fecha" | "decimal" (por defecto, texto)
+        - tam_lote: filas acumuladas que provocan una escritura
+        - intervalo: segundos máximos que una fila espera en memoria (None = solo por tamaño)
+        - al_escribir: función que recibe la lista de referencias (ver escribir()) de las
+          filas ya escritas en el archivo, tras cada escritura. Si lanza una excepción,
+          se registra y esas referencias no se vuelven a entregar
+        """
+        self.ruta = ruta
+        self.columnas = list(columnas)
+        self.tipos = {columna: (tipos or {}).get(columna, "texto") for columna in self.columnas}
+        self.tam_lote = max(1, tam_lote)
+        self.intervalo = intervalo
+        self.al_escribir = al_escribir
+
+        self._lock = threading.Lock()
+        # Serializa las llamadas a al_escribir, que se hacen sin self._lock
+        self._lock_entrega = threading.Lock()
+        self._buffer = []
+        self._referencias = []
+        # Referencias escritas pero aún no legibles (Parquet, hasta cerrar) y referencias
+        # legibles pendientes de entregar a al_escribir
+        self._sin_confirmar = []
+        self._por_entregar = []
+        self._cerrada = False
+        self.filas_escritas = 0
+        self.escrituras = 0
+        self.valores_no_convertidos = 0
+
+        self._abrir()
+
+        # Hilo que vacía el buffer cada intervalo aunque no lleguen más filas
+        self._parar = threading.Event()
+        self._hilo = None
+        if intervalo:
+            self._hilo = threading.Thread(target=self._vaciar_periodicamente, daemon=True)
+            self._hilo.start()
+
+    def _abrir(self):
+        raise NotImplementedError
+
+    def _escribir_lote(self, filas):
+        raise NotImplementedError
+
+    def _cerrar(self):
+        raise NotImplementedError
+
+    def _tamano(self):
+        """Bytes del archivo en disco (para medir lo escrito en cada lote)."""
+        return os.path.getsize(self.ruta) if os.path.isfile(self.ruta) else 0
+
+    def _medir_escritura(self, funcion, *argumentos):
+        # Duración en facturas_etapa_segundos{etapa="escritura"} y bytes añadidos al archivo
+        antes = self._tamano()
+        with medir("escritura", formato=self.formato):
+            funcion(*argumentos)
+        BYTES.inc(self._tamano() - antes, operacion="escrito", destino=self.formato)
+
+    def convertir(self, fila):
+        """Fila con los valores de cada columna convertidos a su tipo (None si no se puede)."""
+        convertida = {}
+        for columna in self.columnas:
+            valor = fila.get(columna)
+            conversor = _CONVERSORES.get(self.tipos[columna])
+            if conversor is None:
+                convertida[columna] = None if valor is None else str(valor)
+                continue
+            convertido = conversor(valor)
+            if convertido is None and str(valor or '').strip():
+                self.valores_no_convertidos += 1
+            convertida[columna] = convertido
+        return convertida
+
+    def escribir(self, fila, referencia=None):
+        """
+        Añade una fila (diccionario columna -> valor; las columnas que falten quedan vacías).
+        La referencia opcional se entrega a al_escribir cuando la fila llega al archivo.
+        """
+        with self._lock:
+            if self._cerrada:
+                raise ValueError(f"La salida {self.ruta} ya está cerrada")
+            self._buffer.append(fila)
+            self._referencias.append(referencia)
+            if len(self._buffer) >= self.tam_lote:
+                self._vaciar()
+        self._entregar()
+
+    def escribir_varias(self, filas):
+        for fila in filas:
+            self.escribir(fila)
+
+    def _vaciar(self):
+        # Se llama con el lock tomado. El buffer solo se suelta cuando la escritura ha
+        # terminado bien: si falla, las filas se reintentan en el siguiente vaciado
+        if not self._buffer:
+            return
+        filas, referencias = self._buffer, self._referencias
+        self._medir_escritura(self._escribir_lote, filas)
+        self._buffer, self._referencias = [], []
+        FILAS.inc(len(filas), formato=self.formato)
+        self.filas_escritas += len(filas)
+        self.escrituras += 1
+        escritas = [r for r in referencias if r is not None]
+        if self.legible_al_escribir:
+            self._por_entregar.extend(escritas)
+        else:
+            self._sin_confirmar.extend(escritas)
+
+    def _entregar(self):
+        # Entrega a al_escribir las referencias de las filas ya legibles en el archivo.
+        # Se llama sin self._lock: el callback puede tardar (mover archivos, registrar en
+        # el manifiesto) sin bloquear escribir() en otros hilos
+        if self.al_escribir is None:
+            with self._lock:
+                self._por_entregar = []
+            return
+        with self._lock_entrega:
+            with self._lock:
+                confirmadas, self._por_entregar = self._por_entregar, []
+            if not confirmadas:
+                return
+            try:
+                self.al_escribir(confirmadas)
+            except Exception as e:
+                evento("al_escribir_fallido", nivel="error", salida=self.ruta,
+                       referencias=len(confirmadas), error=f"{type(e).__name__}: {e}")
+
+    def vaciar(self):
+        """Escribe en el archivo las filas pendientes."""
+        with self._lock:
+            if not self._cerrada:
+                self._vaciar()
+        self._entregar()
+
+    def _vaciar_periodicamente(self):
+        # Un error (disco lleno, archivo bloqueado...) no detiene el hilo: las filas
+        # siguen en el buffer y se reintentan en el siguiente intervalo
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.vaciar()
+            except Exception as e:
+                evento("vaciado_fallido", nivel="error", salida=self.ruta,
+                       pendientes=len(self._buffer), error=f"{type(e).__name__}: {e}")
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "filas_escritas": self.filas_escritas,
+                "pendientes": len(self._buffer),
+                "escrituras": self.escrituras,
+                "valores_no_convertidos": self.valores_no_convertidos,
+            }
+
+    def cerrar(self):
+        """
+        Escribe lo pendiente y cierra el archivo. El archivo se cierra aunque falle la
+        última escritura (el error se relanza): así Parquet escribe su pie y los lotes
+        anteriores siguen siendo legibles.
+        """
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        try:
+            with self._lock:
+                if self._cerrada:
+                    return
+                try:
+                    self._vaciar()
+                except Exception:
+                    evento("filas_no_escritas", nivel="error", salida=self.ruta, filas=len(self._buffer))
+                    raise
+                finally:
+                    self._cerrada = True
+                    # Parquet escribe el pie (y parte de los datos) al cerrar
+                    self._medir_escritura(self._cerrar)
+                    self._por_entregar.extend(self._sin_confirmar)
+                    self._sin_confirmar = []
+        finally:
+            self._entregar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class SalidaCSV(SalidaResultados):
+    """CSV con cabecera; los valores se escriben como llegan, sin convertir."""
+
+    formato = "csv"
+
+    def _abrir(self):
+        nuevo = not os.path.isfile(self.ruta) or os.path.getsize(self.ruta) == 0
+        # newline='': evita líneas vacías extra al escribir en CSV
+        self._archivo = open(self.ruta, "a", newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._archivo, fieldnames=self.columnas,
+                                      restval='', extrasaction='ignore')
+        if nuevo:
+            self._writer.writeheader()
+
+    def _escribir_lote(self, filas):
+        self._writer.writerows(filas)
+        self._archivo.flush()
+
+    def _cerrar(self):
+        self._archivo.close()
+
+
+def _json_valor(valor):
+    """Valor JSON: los decimales como número exacto y las fechas en ISO (AAAA-MM-DD)."""
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime.date):
+        return json.dumps(valor.isoformat())
+    return json.dumps(valor, ensure_ascii=False)
+
+
+class SalidaJSONL(SalidaResultados):
+    """Una fila JSON por línea, con los valores convertidos a su tipo."""
+
+    formato = "jsonl"
+
+    def _abrir(self):
+        self._archivo = open(self.ruta, "a", encoding='utf-8')
+
+    def _escribir_lote(self, filas):
+        lineas = []
+        for fila in filas:
+            convertida = self.convertir(fila)
+            # Se serializa a mano para escribir los Decimal como números sin perder precisión
+            campos = ", ".join(f"{json.dumps(columna, ensure_ascii=False)}: {_json_valor(valor)}"
+                               for columna, valor in convertida.items())
+            lineas.append("{" + campos + "}\n")
+        self._archivo.write("".join(lineas))
+        self._archivo.flush()
+
+    def _cerrar(self):
+        self._archivo.close()
+
+
+class SalidaParquet(SalidaResultados):
+    """
+    Parquet con esquema tipado (date32 y decimal128). Un archivo Parquet no admite
+    añadir filas, así que ruta es una carpeta y cada ejecución escribe en ella un
+    archivo nuevo; cada escritura es un grupo de filas. Conviene un tam_lote grande.
+    El archivo solo es legible cuando se cierra: al_escribir se llama entonces.
+    """
+
+    legible_al_escribir = False
+    formato = "parquet"
+
+    _TIPOS_ARROW = {
+        "texto": lambda: pa.string(),
+        "fecha": lambda: pa.date32(),
+        "decimal": lambda: pa.decimal128(18, DECIMALES),
+    }
+
+    def _abrir(self):
+        if pa is None:
+            raise RuntimeError("La salida Parquet necesita pyarrow (pip install pyarrow)")
+        self.esquema = pa.schema([(columna, self._TIPOS_ARROW[self.tipos[columna]]())
+                                  for columna in self.columnas])
+        os.makedirs(self.ruta, exist_ok=True)
+        nombre = f"parte-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet"
+        self.archivo = os.path.join(self.ruta, nombre)
+        self._writer = pq.ParquetWriter(self.archivo, self.esquema)
+
+    def _tamano(self):
+        return os.path.getsize(self.archivo) if os.path.isfile(self.archivo) else 0
+
+    def _a_decimal128(self, valor):
+        """
+        Importe redondeado a DECIMALES, o None si no cabe en decimal128(18, DECIMALES):
+        un valor así se cuenta como no convertido en lugar de hacer fallar todo el lote.
+        """
+        try:
+            valor = valor.quantize(Decimal(1).scaleb(-DECIMALES), rounding=ROUND_HALF_UP)
+        except InvalidOperation:
+            valor = None
+        if valor is not None and valor.adjusted() < 18 - DECIMALES:
+            return valor
+        self.valores_no_convertidos += 1
+        return None
+
+    def _escribir_lote(self, filas):
+        columnas = {columna: [] for columna in self.columnas}
+        for fila in filas:
+            for columna, valor in self.convertir(fila).items():
+                if isinstance(valor, Decimal):
+                    valor = self._a_decimal128(valor)
+                columnas[columna].append(valor)
+        self._writer.write_table(pa.table(columnas, schema=self.esquema))
+
+    def _cerrar(self):
+        self._writer.close()
+
+
+# Formato de cada extensión
+FORMATOS = {".csv": SalidaCSV, ".jsonl": SalidaJSONL, ".parquet": SalidaParquet}
+
+
+def abrir_salida(ruta, columnas, tipos=None, formato=None, **opciones):
+    """
+    Crea la salida adecuada para la ruta.
+
+    Parámetros:
+    - ruta: archivo .csv o .jsonl, o carpeta .parquet
+    - columnas, tipos: ver SalidaResultados
+    - formato: "csv", "jsonl" o "parquet" (por defecto, según la extensión de ruta)
+    - opciones: tam_lote, intervalo, al_escribir
+
+    Retorna:
+    - SalidaResultados abierta
+    """
+    extension = f".{formato}" if formato else os.path.splitext(ruta)[1].lower()
+    if extension not in FORMATOS:
+        raise ValueError(f"Formato de salida desconocido: {extension} (opciones: {list(FORMATOS)})")
+    return FORMATOS[extension](ruta, columnas, tipos, **opciones)
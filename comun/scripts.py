@@ -0,0 +1,30 @@
+"""
+Carga de los main.py de cada pipeline desde otros programas (el servicio, los benchmarks).
+
+Las carpetas de los pipelines tienen espacios en el nombre y no son paquetes, así que no
+se pueden importar con import: se cargan desde su ruta.
+
+Uso:
+    script = cargar_script("PDF estructurado", "pdf_estructurado")
+    script.extract_invoice_info(ruta_pdf)
+"""
+import importlib.util
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_script(carpeta, nombre):
+    """
+    Importa el main.py de una carpeta del repositorio como el módulo 'nombre'.
+    La carpeta se añade a sys.path para que main.py encuentre sus módulos hermanos,
+    como lo haría ejecutado desde su carpeta.
+    """
+    ruta_carpeta = os.path.join(RAIZ, carpeta)
+    if ruta_carpeta not in sys.path:
+        sys.path.append(ruta_carpeta)
+    spec = importlib.util.spec_from_file_location(nombre, os.path.join(ruta_carpeta, "main.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
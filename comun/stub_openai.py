@@ -0,0 +1,124 @@
+"""
+Servidor HTTP local compatible con POST /v1/chat/completions de OpenAI.
+
+Permite probar y medir la extracción con LLM sin coste ni red:
+- Lee los campos pedidos de las líneas "- Campo" del prompt
+- Responde un JSON con un valor simulado por campo; si el prompt es por lotes
+  (identificadores factura_N) responde un objeto por identificador
+- Informa "usage" con una estimación de tokens (4 caracteres por token)
+
+Uso desde la línea de comandos:
+    python -m comun.stub_openai --puerto 8766 --latencia 0.5
+Y en .env:
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from comun.extraccion_llm import PREFIJO_DOCUMENTO
+
+
+def _estimar_tokens(texto):
+    return max(1, len(texto) // 4)
+
+
+def respuesta_por_defecto(prompt):
+    """
+    Genera el contenido de la respuesta a partir del prompt: "simulado" en cada campo.
+    """
+    # Los campos son las líneas "- Campo" anteriores al texto de las facturas
+    cabecera = re.split(r"\n\s*(?:Texto:|Facturas:)", prompt, maxsplit=1)[0]
+    campos = re.findall(r"^\s*-\s*(.+?)\s*$", cabecera, re.MULTILINE)
+    datos = {campo: "simulado" for campo in campos}
+
+    identificadores = sorted(set(re.findall(rf"=== ({PREFIJO_DOCUMENTO}\d+) ===", prompt)))
+    if identificadores:
+        return json.dumps({identificador: datos for identificador in identificadores}, ensure_ascii=False)
+    return "```json\n" + json.dumps(datos, ensure_ascii=False) + "\n```"
+
+
+class _ManejadorChat(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        servidor = self.server
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        peticion = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = "\n".join(m.get("content", "") for m in peticion.get("messages", []))
+        with servidor.lock:
+            servidor.peticiones += 1
+
+        # Latencia simulada del modelo
+        time.sleep(servidor.latencia)
+
+        contenido = servidor.generar_respuesta(prompt)
+        cuerpo = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": peticion.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": contenido},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": _estimar_tokens(prompt),
+                "completion_tokens": _estimar_tokens(contenido),
+                "total_tokens": _estimar_tokens(prompt) + _estimar_tokens(contenido),
+            },
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def iniciar_servidor(puerto=0, latencia=0.2, generar_respuesta=respuesta_por_defecto):
+    """
+    Arranca el servidor simulado en un hilo en segundo plano.
+
+    Parámetros:
+    - puerto: puerto local (0 = cualquiera libre)
+    - latencia: segundos que tarda cada respuesta
+    - generar_respuesta: función prompt -> contenido de la respuesta del modelo
+
+    Retorna:
+    - (servidor, base_url). base_url se pasa a OpenAI/AsyncOpenAI(base_url=...).
+      servidor.peticiones cuenta las llamadas recibidas.
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _ManejadorChat)
+    servidor.daemon_threads = True
+    servidor.lock = threading.Lock()
+    servidor.latencia = latencia
+    servidor.generar_respuesta = generar_respuesta
+    servidor.peticiones = 0
+
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local compatible con OpenAI chat.completions")
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    servidor, base_url = iniciar_servidor(args.puerto, args.latencia)
+    print("API de OpenAI simulada en:", base_url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
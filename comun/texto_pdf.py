@@ -0,0 +1,128 @@
+"""
+Extracción del texto de PDFs con capa de texto, página a página.
+
+- Backends intercambiables: PyMuPDF (rápido, en C) y PyPDF2 (Python puro, de respaldo)
+- iter_paginas() produce el texto de cada página según se lee, sin acumularlo
+- leer_texto() une las páginas con un join (no con += en un bucle) y puede parar en
+  cuanto aparecen todos los campos requeridos, sin leer el resto del documento
+
+Uso:
+    texto = leer_texto("factura.pdf")                        # PyMuPDF si está instalado
+    texto = leer_texto("factura.pdf", backend="pypdf2")
+    cabecera = leer_texto("extracto.pdf", campos_requeridos=[r"INVOICE\\s*#\\s*(\\d+)"])
+"""
+import re
+
+from comun.metricas import medir
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+# Caracteres del final de la página anterior que se vuelven a mirar al buscar los
+# campos requeridos, por si una coincidencia empieza en una página y acaba en la siguiente
+SOLAPE_PAGINAS = 500
+
+
+class ExtractorPyMuPDF:
+    """Texto de cada página con PyMuPDF (page.get_text)."""
+
+    nombre = "pymupdf"
+
+    def paginas(self, ruta_pdf):
+        with fitz.open(ruta_pdf) as documento:
+            for pagina in documento:
+                yield pagina.get_text()
+
+
+class ExtractorPyPDF2:
+    """Texto de cada página con PyPDF2 (page.extract_text), como hacían los scripts originales."""
+
+    nombre = "pypdf2"
+
+    def paginas(self, ruta_pdf):
+        # rb: lectura binaria, el PDF se lee en crudo
+        with open(ruta_pdf, 'rb') as archivo:
+            lector = PyPDF2.PdfReader(archivo)
+            for pagina in lector.pages:
+                yield pagina.extract_text() or ''
+
+
+# Backends registrados, en orden de preferencia
+EXTRACTORES = {
+    ExtractorPyMuPDF.nombre: (ExtractorPyMuPDF, fitz),
+    ExtractorPyPDF2.nombre: (ExtractorPyPDF2, PyPDF2),
+}
+
+
+def obtener_extractor(backend=None):
+    """
+    Retorna una instancia del backend pedido, o del primero disponible si backend es None.
+    """
+    if backend is not None:
+        if backend not in EXTRACTORES:
+            raise ValueError(f"Backend de texto desconocido: {backend} (opciones: {list(EXTRACTORES)})")
+        clase, modulo = EXTRACTORES[backend]
+        if modulo is None:
+            raise RuntimeError(f"El backend '{backend}' no está instalado")
+        return clase()
+    for clase, modulo in EXTRACTORES.values():
+        if modulo is not None:
+            return clase()
+    raise RuntimeError("No hay ningún backend de texto PDF instalado (PyMuPDF o PyPDF2)")
+
+
+def iter_paginas(ruta_pdf, backend=None):
+    """
+    Genera el texto de cada página del PDF, en orden.
+
+    Parámetros:
+    - ruta_pdf: ruta del archivo PDF
+    - backend: "pymupdf", "pypdf2" o None (el primero disponible)
+    """
+    yield from obtener_extractor(backend).paginas(ruta_pdf)
+
+
+def leer_texto(ruta_pdf, backend=None, campos_requeridos=None, separador=''):
+    """
+    Extrae el texto del PDF.
+
+    Parámetros:
+    - ruta_pdf: ruta del archivo PDF
+    - backend: "pymupdf", "pypdf2" o None (el primero disponible)
+    - campos_requeridos: lista de patrones regex (texto o compilados). Si se indica,
+      se deja de leer en cuanto todos han aparecido; el texto retornado llega hasta esa
+      página. No usar cuando hace falta el documento completo (por ejemplo, para sumar
+      todas las líneas de un extracto)
+    - separador: texto entre páginas ('' para unirlas igual que el antiguo +=)
+
+    Retorna:
+    - Texto de las páginas leídas, unido con el separador
+    """
+    paginas = []
+    pendientes = [re.compile(p) if isinstance(p, str) else p for p in (campos_requeridos or [])]
+    cola = ''
+    generador = iter_paginas(ruta_pdf, backend)
+    with medir("texto_pdf", backend=backend or "auto"):
+        try:
+            for texto_pagina in generador:
+                paginas.append(texto_pagina)
+                if not campos_requeridos:
+                    continue
+                # Solo se busca en la página nueva (más el final de la anterior), no en todo
+                # el texto acumulado
+                ventana = cola + separador + texto_pagina
+                pendientes = [patron for patron in pendientes if not patron.search(ventana)]
+                if not pendientes:
+                    break
+                cola = ventana[-SOLAPE_PAGINAS:]
+        finally:
+            # Cierra el documento aunque se pare antes de la última página
+            generador.close()
+    return separador.join(paginas)
@@ -0,0 +1,250 @@
+"""
+Vigilancia de carpetas de entrada: avisa de cada archivo nuevo en cuanto termina de escribirse.
+
+- Con watchdog instalado (pip install watchdog) se usan los eventos del sistema
+  (inotify en Linux, ReadDirectoryChangesW en Windows, FSEvents en macOS); sin él,
+  se comparan las carpetas cada intervalo segundos
+- Antirrebote: un archivo se entrega cuando su tamaño y su fecha de modificación no
+  cambian durante 'espera' segundos y se puede abrir. Así no se procesa un PDF que
+  todavía se está copiando o descargando
+- Un PDF, además, debe terminar en %%EOF: si la copia se detiene más de 'espera' segundos
+  a mitad, se sigue esperando (hasta espera_maxima; después se entrega y el procesador
+  lo dará por erróneo)
+- Se ignoran los temporales habituales (.part, .tmp, .crdownload, ~$..., ocultos)
+- Al arrancar se entregan también los archivos que ya estaban en las carpetas
+
+Uso:
+    vigilante = VigilanteCarpetas(["documents", "facturas"], al_listo=print, espera=2.0)
+    vigilante.iniciar()
+    ...
+    vigilante.detener()
+"""
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# Archivos que se están escribiendo o que no son documentos
+EXTENSIONES_TEMPORALES = (".part", ".partial", ".tmp", ".crdownload", ".download", ".swp")
+PREFIJOS_TEMPORALES = (".", "~$", "~")
+
+
+def es_temporal(ruta):
+    """True si el nombre corresponde a un archivo temporal u oculto."""
+    nombre = os.path.basename(ruta)
+    return nombre.startswith(PREFIJOS_TEMPORALES) or nombre.lower().endswith(EXTENSIONES_TEMPORALES)
+
+
+def _firma(ruta):
+    """(tamaño, fecha de modificación) del archivo, o None si ya no existe."""
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return info.st_size, info.st_mtime_ns
+
+
+# Un PDF completo termina en %%EOF (seguido, como mucho, de algunos bytes de relleno)
+_FIN_PDF = b"%%EOF"
+_COLA_PDF = 1024
+
+
+def _esta_completo(ruta):
+    """True si el archivo se puede abrir y, si es un PDF, tiene su marca de final."""
+    # En Windows un archivo que otro proceso sigue escribiendo no se puede abrir
+    try:
+        with open(ruta, "rb") as archivo:
+            if not ruta.lower().endswith(".pdf"):
+                return True
+            archivo.seek(0, os.SEEK_END)
+            archivo.seek(max(0, archivo.tell() - _COLA_PDF))
+            return _FIN_PDF in archivo.read()
+    except OSError:
+        return False
+
+
+class _Eventos(FileSystemEventHandler):
+    """Traduce los eventos de watchdog a avisos al vigilante."""
+
+    def __init__(self, vigilante):
+        self.vigilante = vigilante
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_moved(self, event):
+        # Renombrar "factura.pdf.part" a "factura.pdf" es la forma habitual de terminar una copia
+        if not event.is_directory:
+            self.vigilante.notificar(event.dest_path)
+
+
+class VigilanteCarpetas:
+    """
+    Vigila varias carpetas y llama a al_listo(ruta) una vez por cada archivo listo.
+    al_listo se llama desde el hilo del vigilante: si tarda, retrasa los siguientes
+    avisos (conviene que solo encole el trabajo).
+    """
+
+    def __init__(self, carpetas, al_listo, espera=2.0, intervalo=1.0, recursivo=True,
+                 excluir=(), usar_eventos=True, espera_maxima=60.0):
+        """
+        Parámetros:
+        - carpetas: carpetas a vigilar (se crean si no existen)
+        - al_listo: función que recibe la ruta de cada archivo listo
+        - espera: segundos sin cambios para dar un archivo por terminado
+        - intervalo: cada cuántos segundos se revisan los archivos pendientes (y, sin
+          watchdog, las carpetas)
+        - recursivo: vigilar también las subcarpetas
+        - excluir: carpetas dentro de las vigiladas que se ignoran (ej: las de procesados)
+        - usar_eventos: False para comparar las carpetas aunque watchdog esté instalado
+          (carpetas de red, donde los eventos no siempre llegan)
+        - espera_maxima: segundos sin cambios tras los que un archivo que no parece
+          completo (PDF sin %%EOF, o que no se puede abrir) se entrega igualmente
+        """
+        self.carpetas = [os.path.abspath(carpeta) for carpeta in carpetas]
+        self.al_listo = al_listo
+        self.espera = espera
+        self.espera_maxima = max(espera, espera_maxima)
+        self.intervalo = intervalo
+        self.recursivo = recursivo
+        self.excluir = tuple(os.path.abspath(carpeta) + os.sep for carpeta in excluir)
+        self.usar_eventos = usar_eventos and Observer is not None
+
+        self._lock = threading.Lock()
+        # ruta -> (firma, instante del último cambio) de los archivos que aún se escriben
+        self._pendientes = {}
+        # ruta -> firma de los archivos ya entregados (no se vuelven a entregar si no cambian)
+        self._entregados = {}
+        self._parar = threading.Event()
+        self._hilo = None
+        self._observador = None
+        self.entregados = 0
+        self.ignorados = 0
+
+    @property
+    def modo(self):
+        return "eventos" if self.usar_eventos else "sondeo"
+
+    def _vigilado(self, ruta):
+        if es_temporal(ruta) or ruta.startswith(self.excluir):
+            return False
+        return self.recursivo or os.path.dirname(ruta) in self.carpetas
+
+    def notificar(self, ruta):
+        """Avisa de que un archivo se creó o cambió (lo llaman los eventos o el sondeo)."""
+        ruta = os.path.abspath(ruta)
+        if not self._vigilado(ruta):
+            with self._lock:
+                self.ignorados += 1
+            return
+        firma = _firma(ruta)
+        if firma is None:
+            return
+        with self._lock:
+            if self._entregados.get(ruta) == firma:
+                return
+            anterior = self._pendientes.get(ruta)
+            if anterior is None or anterior[0] != firma:
+                self._pendientes[ruta] = (firma, time.monotonic())
+
+    def _recorrer(self):
+        """Rutas de los archivos de las carpetas vigiladas."""
+        for carpeta in self.carpetas:
+            if self.recursivo:
+                for raiz, carpetas, archivos in os.walk(carpeta):
+                    # No se baja a las carpetas excluidas
+                    carpetas[:] = [c for c in carpetas
+                                   if not (os.path.join(raiz, c) + os.sep).startswith(self.excluir)]
+                    for archivo in archivos:
+                        yield os.path.join(raiz, archivo)
+            else:
+                with os.scandir(carpeta) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_file():
+                            yield entrada.path
+
+    def _listos(self):
+        """Saca de los pendientes los archivos que llevan 'espera' segundos sin cambios."""
+        ahora = time.monotonic()
+        listos = []
+        with self._lock:
+            pendientes = list(self._pendientes.items())
+        for ruta, (firma, cambio) in pendientes:
+            actual = _firma(ruta)
+            with self._lock:
+                if actual is None:
+                    # Se borró o se movió antes de terminar
+                    self._pendientes.pop(ruta, None)
+                elif actual != firma:
+                    self._pendientes[ruta] = (actual, ahora)
+                elif ahora - cambio >= self.espera and (
+                        _esta_completo(ruta) or ahora - cambio >= self.espera_maxima):
+                    del self._pendientes[ruta]
+                    self._entregados[ruta] = actual
+                    listos.append(ruta)
+        return listos
+
+    def _bucle(self):
+        while True:
+            if not self.usar_eventos:
+                for ruta in self._recorrer():
+                    self.notificar(ruta)
+            for ruta in self._listos():
+                self.entregados += 1
+                self.al_listo(ruta)
+            # Los entregados que ya no existen (se movieron a procesados) se olvidan
+            with self._lock:
+                for ruta in [r for r in self._entregados if not os.path.exists(r)]:
+                    del self._entregados[ruta]
+            if self._parar.wait(self.intervalo):
+                return
+
+    def iniciar(self):
+        """Empieza a vigilar; los archivos que ya estaban se entregan como nuevos."""
+        for carpeta in self.carpetas:
+            os.makedirs(carpeta, exist_ok=True)
+        if self.usar_eventos:
+            self._observador = Observer()
+            for carpeta in self.carpetas:
+                self._observador.schedule(_Eventos(self), carpeta, recursive=self.recursivo)
+            self._observador.start()
+        # Archivos que llegaron mientras el servicio estaba parado
+        for ruta in self._recorrer():
+            self.notificar(ruta)
+        self._hilo = threading.Thread(target=self._bucle, name="vigilante", daemon=True)
+        self._hilo.start()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "modo": self.modo,
+                "entregados": self.entregados,
+                "pendientes": len(self._pendientes),
+                "ignorados": self.ignorados,
+            }
+
+    def detener(self):
+        self._parar.set()
+        if self._observador is not None:
+            self._observador.stop()
+            self._observador.join()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.detener()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+# La carpeta tiene espacios y no es un paquete: se importa como lo hace su main.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "Documentos escaneados"))
+import azure_read_stub  # noqa: E402
+from azure_ocr_async import ClienteAzureReadAsync  # noqa: E402
+
+IMAGENES = [f"pagina {i}".encode() for i in range(8)]
+
+
+def _ocr_lote(endpoint, imagenes, **opciones):
+    async def ejecutar():
+        async with ClienteAzureReadAsync(endpoint, "clave", **opciones) as cliente:
+            return await cliente.ocr_lote(imagenes)
+    return asyncio.run(ejecutar())
+
+
+class ClienteAzureReadAsyncTest(unittest.TestCase):
+    def _servidor(self, **opciones):
+        servidor, endpoint = azure_read_stub.iniciar_servidor(**opciones)
+        self.addCleanup(servidor.shutdown)
+        return servidor, endpoint
+
+    def test_reintenta_los_429_respetando_retry_after(self):
+        servidor, endpoint = self._servidor(latencia=0.05, max_operaciones=2, retry_after=0.05)
+        textos = _ocr_lote(endpoint, IMAGENES, max_en_vuelo=8)
+        self.assertGreater(servidor.rechazos_429, 0)
+        esperados = ["\n".join(azure_read_stub.texto_por_defecto(imagen)) for imagen in IMAGENES]
+        self.assertEqual(textos, esperados)
+
+    def test_no_supera_max_en_vuelo(self):
+        abiertas = {"maximo": 0}
+        servidor = None
+
+        def generar_texto(imagen):
+            # Se llama con servidor.lock tomado, al registrar cada operación nueva
+            actuales = 1 + sum(not op["leida"] for op in servidor.operaciones.values())
+            abiertas["maximo"] = max(abiertas["maximo"], actuales)
+            return azure_read_stub.texto_por_defecto(imagen)
+
+        servidor, endpoint = self._servidor(latencia=0.1, generar_texto=generar_texto)
+        textos = _ocr_lote(endpoint, IMAGENES, max_en_vuelo=3)
+        self.assertFalse([t for t in textos if isinstance(t, Exception)])
+        self.assertEqual(servidor.rechazos_429, 0)
+        self.assertEqual(abiertas["maximo"], 3)
+
+    def test_la_espera_se_adapta_a_la_latencia(self):
+        servidor, endpoint = self._servidor(latencia=0.2)
+        inicio = time.perf_counter()
+        texto, = _ocr_lote(endpoint, IMAGENES[:1], espera_inicial=0.02, factor_espera=1.5)
+        segundos = time.perf_counter() - inicio
+        self.assertIn("Factura simulada", texto)
+        # Varias consultas cortas: el resultado llega poco después de estar listo,
+        # sin esperar un segundo fijo entre consultas
+        self.assertGreater(servidor.consultas, 1)
+        self.assertLess(segundos, 0.6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from comun.cache import CacheDisco
+from comun.extraccion_escalonada import ExtractorEscalonado
+from comun.extraccion_llm import MotorExtraccionLLM
+from comun.stub_openai import iniciar_servidor, respuesta_por_defecto
+
+CAMPOS = ["Fecha", "Número", "Cliente", "Domicilio", "Ciudad", "NIF", "Subtotal", "IVA", "Total a pagar"]
+
+# Facturas a las que les faltan campos distintos: cada una va en un grupo de campos propio
+TEXTOS = ["", "Fecha: 20/02/2021", "Número: 10940", "Fecha: 20/02/2021\nNúmero: 10940"]
+
+
+class ExtractorEscalonadoTest(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.carpeta.cleanup()
+
+    def _servidor(self, generar_respuesta):
+        servidor, base_url = iniciar_servidor(latencia=0, generar_respuesta=generar_respuesta)
+        self.addCleanup(servidor.shutdown)
+        return base_url
+
+    def test_los_grupos_comparten_el_limite_de_concurrencia(self):
+        lock = threading.Lock()
+        simultaneas = {"actual": 0, "maximo": 0}
+
+        def lenta(prompt):
+            with lock:
+                simultaneas["actual"] += 1
+                simultaneas["maximo"] = max(simultaneas["maximo"], simultaneas["actual"])
+            time.sleep(0.05)
+            with lock:
+                simultaneas["actual"] -= 1
+            return respuesta_por_defecto(prompt)
+
+        motor = MotorExtraccionLLM(CAMPOS, max_concurrencia=2, base_url=self._servidor(lenta), api_key="x")
+        extractor = ExtractorEscalonado(motor)
+        resultados = extractor.extraer_todos(TEXTOS * 4)
+        self.assertFalse([r for r in resultados if isinstance(r, Exception)])
+        self.assertGreater(len({tuple(sorted(r.origen.items())) for r in resultados}), 1)
+        self.assertLessEqual(simultaneas["maximo"], 2)
+
+    def test_una_respuesta_que_no_es_un_objeto_no_detiene_el_lote(self):
+        base_url = self._servidor(lambda prompt: '["no", "es", "un", "objeto"]')
+        cache = CacheDisco(os.path.join(self.carpeta.name, "llm.sqlite"))
+        self.addCleanup(cache.cerrar)
+        motor = MotorExtraccionLLM(CAMPOS, base_url=base_url, api_key="x", cache=cache)
+        resultados = ExtractorEscalonado(motor).extraer_todos(TEXTOS)
+        self.assertTrue(all(isinstance(r, ValueError) for r in resultados))
+        # No se guarda en la caché: la siguiente ejecución vuelve a preguntar
+        self.assertEqual(cache.estadisticas()["bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from comun.indice_etiquetas import IndiceEtiquetas
+
+
+def _prov(izquierda, arriba, derecha, abajo):
+    return [{"page_no": 1, "bbox": {"l": izquierda, "t": arriba, "r": derecha, "b": abajo,
+                                    "coord_origin": "TOPLEFT"}}]
+
+
+class ValorEtiquetaTest(unittest.TestCase):
+    def test_etiqueta_y_valor_en_el_mismo_texto(self):
+        textos = [
+            {"text": "Order Number: 77", "prov": _prov(0, 0, 100, 10)},
+            {"text": "Item", "prov": _prov(110, 0, 150, 10)},
+        ]
+        self.assertEqual(IndiceEtiquetas(textos).valor("Order Number"), "77")
+
+    def test_valor_a_la_derecha_de_la_etiqueta(self):
+        textos = [
+            {"text": "Invoice Number", "prov": _prov(0, 0, 80, 10)},
+            {"text": "INV-9", "prov": _prov(90, 0, 130, 10)},
+            {"text": "Total", "prov": _prov(0, 30, 40, 40)},
+        ]
+        self.assertEqual(IndiceEtiquetas(textos).valor("Invoice Number"), "INV-9")
+
+    def test_fila_de_cabeceras_sin_procedencia(self):
+        textos = [{"text": texto} for texto in ["Order Number", "Invoice Number", "77", "123"]]
+        valores = IndiceEtiquetas(textos).extraer(["Order Number", "Invoice Number"])
+        self.assertEqual(valores, {"Order Number": "77", "Invoice Number": "123"})
+
+    def test_etiquetas_seguidas_de_su_valor_sin_procedencia(self):
+        textos = [{"text": texto} for texto in ["Invoice Number", "INV-1", "Due Date", "2024-01-31"]]
+        valores = IndiceEtiquetas(textos).extraer(["Invoice Number", "Due Date"])
+        self.assertEqual(valores, {"Invoice Number": "INV-1", "Due Date": "2024-01-31"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from decimal import Decimal
+
+from comun.lineas_factura import leer_items, leer_linea
+
+
+class LeerLineaTest(unittest.TestCase):
+    def test_moneda_delante_y_detras(self):
+        self.assertEqual(leer_linea("Widget 2 €5.00 €10.00"),
+                         ("Widget", Decimal("2"), Decimal("5.00"), Decimal("10.00"), "€"))
+        self.assertEqual(leer_linea("Widget 2 5,00 10,00 €", locale="es"),
+                         ("Widget", Decimal("2"), Decimal("5.00"), Decimal("10.00"), "€"))
+
+    def test_signo_antes_o_despues_del_simbolo(self):
+        for importe in ("-€10.00", "€-10.00", "-10.00€"):
+            with self.subTest(importe=importe):
+                leida = leer_linea(f"Descuento 1 {importe} {importe}")
+                self.assertEqual(leida, ("Descuento", Decimal("1"), Decimal("-10.00"),
+                                         Decimal("-10.00"), "€"))
+
+    def test_importes_pegados_por_el_simbolo(self):
+        self.assertEqual(leer_linea("Widget 2 50€100.00"),
+                         ("Widget", Decimal("2"), Decimal("50"), Decimal("100.00"), "€"))
+        self.assertEqual(leer_linea("Widget 2 5.00€10.00€"),
+                         ("Widget", Decimal("2"), Decimal("5.00"), Decimal("10.00"), "€"))
+        self.assertEqual(leer_linea("Descuento 1 €-5.00€-5.00"),
+                         ("Descuento", Decimal("1"), Decimal("-5.00"), Decimal("-5.00"), "€"))
+
+    def test_sin_moneda_no_es_un_item(self):
+        self.assertIsNone(leer_linea("Teléfono 91 555 1234"))
+
+
+class LeerItemsTest(unittest.TestCase):
+    def test_items_y_totales(self):
+        texto = "Widget 2 €5.00 €10.00\nDescuento 1 -€2.00 -€2.00\nTotal 1 1 €8.00\n"
+        tabla = leer_items(texto, max_segundos=0)
+        self.assertTrue(tabla.completa)
+        self.assertEqual([item.importe for item in tabla.items], [Decimal("10.00"), Decimal("-2.00")])
+        self.assertEqual([item.importe for item in tabla.totales], [Decimal("8.00")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import contextlib
+import os
+import threading
+import unittest
+
+from comun.pipeline import Etapa, Pipeline
+
+
+def _doble(numero):
+    return numero * 2
+
+
+def _morir(numero):
+    # Simula un proceso del pool que muere (ej: sin memoria)
+    os._exit(1)
+
+
+@contextlib.asynccontextmanager
+async def _cliente_roto():
+    raise RuntimeError("no se pudo abrir el cliente")
+    yield
+
+
+async def _ocr(cliente, numero):
+    return numero
+
+
+def _ejecutar_con_limite(pipeline, entradas, segundos=20):
+    """Ejecuta el pipeline en otro hilo: (resultados, error); falla el test si no termina."""
+    salida = {}
+
+    def ejecutar():
+        try:
+            salida["resultados"] = list(pipeline.ejecutar(entradas))
+        except Exception as e:
+            salida["error"] = e
+
+    hilo = threading.Thread(target=ejecutar, daemon=True)
+    hilo.start()
+    hilo.join(segundos)
+    if hilo.is_alive():
+        raise AssertionError("el pipeline no terminó")
+    return salida.get("resultados"), salida.get("error")
+
+
+class PipelineTest(unittest.TestCase):
+    def test_resultados_de_todas_las_etapas(self):
+        pipeline = Pipeline([
+            Etapa("doble", _doble, modo="procesos", workers=2),
+            Etapa("suma", lambda numeros: [n + 1 for n in numeros], lote=4),
+        ], tam_cola=2)
+        resultados, error = _ejecutar_con_limite(pipeline, range(50))
+        self.assertIsNone(error)
+        self.assertEqual(sorted(resultados), [n * 2 + 1 for n in range(50)])
+
+    def test_el_contexto_async_falla(self):
+        pipeline = Pipeline([
+            Etapa("render", _doble, workers=2),
+            Etapa("ocr", _ocr, modo="async", workers=4, contexto=_cliente_roto),
+        ], tam_cola=2)
+        resultados, error = _ejecutar_con_limite(pipeline, range(200))
+        self.assertIsInstance(error, RuntimeError)
+        self.assertIn("cliente", str(error))
+
+    def test_el_pool_de_procesos_se_rompe(self):
+        pipeline = Pipeline([
+            Etapa("render", _morir, modo="procesos", workers=2),
+            Etapa("guardar", _doble),
+        ], tam_cola=2)
+        resultados, error = _ejecutar_con_limite(pipeline, range(200))
+        self.assertIsNotNone(error)
+        self.assertEqual(type(error).__name__, "BrokenProcessPool")
+
+    def test_dejar_de_leer_detiene_los_hilos(self):
+        pipeline = Pipeline([Etapa("doble", _doble)], tam_cola=1)
+        resultados = pipeline.ejecutar(range(1000))
+        self.assertEqual(next(resultados), 0)
+        resultados.close()
+        vivos = [hilo for hilo in threading.enumerate() if hilo.name.startswith("pipeline-doble")]
+        self.assertEqual(vivos, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+
+from comun.salida_resultados import SalidaCSV, SalidaParquet, a_decimal
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+def _esperar(condicion, segundos=2.0):
+    limite = time.monotonic() + segundos
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+
+class VaciadoPeriodicoTest(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.carpeta.name, "salida.csv")
+
+    def tearDown(self):
+        self.carpeta.cleanup()
+
+    def test_un_error_en_al_escribir_no_detiene_el_hilo(self):
+        entregadas = []
+
+        def al_escribir(referencias):
+            entregadas.extend(referencias)
+            if len(entregadas) == 1:
+                raise FileNotFoundError("ya no existe")
+
+        salida = SalidaCSV(self.ruta, ["a"], tam_lote=100, intervalo=0.05, al_escribir=al_escribir)
+        salida.escribir({"a": 1}, referencia="r1")
+        self.assertTrue(_esperar(lambda: entregadas == ["r1"]))
+        salida.escribir({"a": 2}, referencia="r2")
+        self.assertTrue(_esperar(lambda: entregadas == ["r1", "r2"]))
+        self.assertEqual(salida.estadisticas()["pendientes"], 0)
+        salida.cerrar()
+
+    def test_las_filas_se_conservan_si_falla_la_escritura(self):
+        salida = SalidaCSV(self.ruta, ["a"], tam_lote=100, intervalo=0.05)
+        escribir_lote = salida._escribir_lote
+        fallos = []
+
+        def falla_una_vez(filas):
+            if not fallos:
+                fallos.append(len(filas))
+                raise OSError("disco lleno")
+            escribir_lote(filas)
+
+        salida._escribir_lote = falla_una_vez
+        salida.escribir({"a": 1})
+        self.assertTrue(_esperar(lambda: salida.estadisticas()["filas_escritas"] == 1))
+        self.assertEqual(fallos, [1])
+        salida.cerrar()
+        with open(self.ruta, encoding="utf-8") as archivo:
+            self.assertEqual(archivo.read().split(), ["a", "1"])
+
+
+class ADecimalTest(unittest.TestCase):
+    def test_separador_decimal_o_de_miles(self):
+        casos = {
+            "$1,234": Decimal("1234"),
+            "1.234": Decimal("1234"),
+            "1.234,56 €": Decimal("1234.56"),
+            "1,234.56": Decimal("1234.56"),
+            "52,00": Decimal("52.00"),
+            "52.5": Decimal("52.5"),
+            "-10,00": Decimal("-10.00"),
+            "21%": Decimal("21"),
+            "": None,
+            "n/a": None,
+        }
+        for texto, esperado in casos.items():
+            with self.subTest(texto=texto):
+                self.assertEqual(a_decimal(texto), esperado)
+
+
+@unittest.skipIf(pq is None, "pyarrow no está instalado")
+class SalidaParquetTest(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.carpeta.name, "salida.parquet")
+
+    def tearDown(self):
+        self.carpeta.cleanup()
+
+    def test_un_importe_que_no_cabe_se_escribe_vacio(self):
+        salida = SalidaParquet(self.ruta, ["Total"], {"Total": "decimal"}, intervalo=None)
+        salida.escribir({"Total": "52,00"})
+        salida.escribir({"Total": "9" * 40})
+        salida.escribir({"Total": "1" * 17})
+        salida.cerrar()
+        self.assertEqual(salida.estadisticas()["valores_no_convertidos"], 2)
+        tabla = pq.read_table(salida.archivo)
+        self.assertEqual(tabla.column("Total").to_pylist(), [Decimal("52.00"), None, None])
+
+    def test_el_archivo_se_cierra_aunque_falle_la_ultima_escritura(self):
+        salida = SalidaParquet(self.ruta, ["a"], tam_lote=1, intervalo=None)
+        salida.escribir({"a": "uno"})
+
+        def falla(filas):
+            raise OSError("disco lleno")
+
+        salida._escribir_lote = falla
+        salida.tam_lote = 100
+        salida.escribir({"a": "dos"})
+        with self.assertRaises(OSError):
+            salida.cerrar()
+        self.assertTrue(salida._cerrada)
+        self.assertEqual(pq.read_table(salida.archivo).column("a").to_pylist(), ["uno"])
+
+
+if __name__ == "__main__":
+    unittest.main()